@@ -1,6 +1,44 @@
-from typing import Dict, List, Union
-
+from ont.graph import OntologyGraph
+from typing import Any, Dict, Iterator, List, Tuple, Union
+
+import inspect
+import json
+import numpy as np
+import ont.cache
+import ont.compiled
+import ont.graph
 import ont.management
+import ont.properties
+import ont.search
+import ont.sync
+import os
+
+
+# Upper bounds on path enumeration, applied whatever a caller asks for
+MAX_PATHS = int(os.environ["MAX_PATHS"]) if "MAX_PATHS" in os.environ else 1000
+MAX_PATH_DEPTH = int(os.environ["MAX_PATH_DEPTH"]) if "MAX_PATH_DEPTH" in os.environ else 64
+MAX_BATCH_OPERATIONS = int(os.environ["MAX_BATCH_OPERATIONS"]) if "MAX_BATCH_OPERATIONS" in os.environ else 100
+
+# Selectional restriction facets, tightest first
+CONSTRAINT_FACETS = ["default", "sem", "relaxable-to"]
+
+# The read-only methods a batch may call
+BATCH_OPERATIONS = [
+    "get", "list", "roots", "search", "fuzzy_search", "search_definitions", "exists", "exists_batch", "ancestors",
+    "descendants", "siblings", "is_a", "is_a_batch", "common_ancestors", "common_ancestors_batch", "similarity",
+    "check_constraints", "statistics", "inverses", "relations", "domains_and_ranges", "report"
+]
+
+# What a batch argument may hold beyond its annotated type, by argument name
+BATCH_CHOICES = {
+    "match": [ont.search.EXACT, ont.search.PREFIX, ont.search.SUBSTRING],
+    "metric": [ont.graph.WU_PALMER, ont.graph.PATH]
+}
+BATCH_MINIMUMS = {"limit": 0, "k": 0, "max_distance": 0, "max_paths": 1, "max_depth": 0}
+
+
+class BatchError(Exception):
+    pass
 
 
 class OntologyAPI(object):
@@ -10,25 +48,19 @@ class OntologyAPI(object):
             self.collection = ont.management.handle()
         else:
             self.collection = collection
-        self._cache = {}
 
-    def list(self) -> List[str]:
-        pipeline = [
-            {"$project": {"name": 1, "_id": 0}},
-            {"$group": {"_id": None, "all": {"$addToSet": "$name"}}}
-        ]
-        results = list(self.collection.aggregate(pipeline))
+    @property
+    def graph(self) -> OntologyGraph:
+        return ont.graph.snapshot(self.collection)
 
-        return sorted(results[0]["all"])
+    def list(self) -> List[str]:
+        return sorted(self.graph.names)
 
     def roots(self) -> List[str]:
-        results = list(self.collection.find({
-            "parents.0": {"$exists": False}
-        }))
+        graph = self.graph
+        return sorted(map(lambda id: graph.names[id], graph.roots))
 
-        return sorted(list(map(lambda r: r["name"], results)))
-
-    def search(self, name_like: str = None) -> List[str]:
+    def search(self, name_like: str = None, match: str=ont.search.SUBSTRING, limit: int=None) -> List[str]:
 
         if name_like is not None and len(name_like) < 3:
             name_like = None
@@ -40,188 +72,238 @@ class OntologyAPI(object):
         if name_like is not None:
             name_like = name_like.lower()
 
-        results = list(self.collection.find({
-            "name": {"$regex": name_like}
-        }))
+        return ont.search.index(self.collection).search(name_like, match=match, limit=limit)
+
+    def fuzzy_search(self, name: str, max_distance: int=2, k: int=10) -> List[dict]:
+        if name is None or len(name) == 0:
+            return []
+
+        matches = ont.search.index(self.collection).fuzzy(name.lower(), max_distance=max_distance, k=k)
+        return list(map(lambda match: {"name": match[0], "distance": match[1]}, matches))
+
+    def search_definitions(self, query: str, limit: int=10) -> List[dict]:
+        if query is None:
+            return []
+
+        matches = ont.search.text_index(self.collection).search(query, limit=limit)
+        return list(map(lambda match: {"name": match[0], "score": match[1]}, matches))
 
-        results = list(map(lambda r: r["name"], results))
-        return sorted(results)
+    def exists(self, concept: str) -> bool:
+        return self.exists_batch([concept])[0]
+
+    def exists_batch(self, concepts: List[str]) -> List[bool]:
+        names = ont.search.index(self.collection)
+        return list(map(lambda concept: concept.lower() in names, concepts))
+
+    def existence_filter(self, error_rate: float=0.01) -> dict:
+        return ont.search.index(self.collection).bloom(error_rate=error_rate).to_json()
 
     def get(self, concepts: Union[str, List[str]], local: bool=False, metadata: bool=False) -> List[dict]:
         if isinstance(concepts, str):
             concepts = [concepts]
 
         concepts = list(map(lambda c: c.lower(), concepts))
+        results = self._get(concepts, local=local, metadata=metadata)
+
+        # Only count names that exist, so that unknown ones are never warmed
+        ont.cache.touch(self.collection, list(map(lambda result: next(iter(result)), results)))
+
+        return results
+
+    def _get(self, concepts: List[str], local: bool=False, metadata: bool=False) -> List[dict]:
+        # Resolve the hierarchy snapshot and inheritance memo once for the whole batch
+        graph = self.graph
+        memo = ont.cache.memo(self.collection)
+
+        # A fresh compile already holds the resolved frames; anything it cannot answer is resolved live
+        compiled, missing = ({}, concepts) if metadata else ont.compiled.frames(self.collection, concepts, memo.version, local=local)
+        records = ont.cache.records(self.collection, missing, version=memo.version)
 
         results = []
-        for record in self.collection.find({"$or": list(map(lambda concept: {"name": concept}, concepts))}):
-            results.append(self.format(record, local=local, metadata=metadata))
+        for concept in sorted(set(concepts), key=concepts.index):
+            if concept in compiled:
+                results.append({concept: compiled[concept]})
+                continue
+
+            for record in records.get(concept, []):
+                results.append(self.format(record, local=local, metadata=metadata, graph=graph, memo=memo))
 
         return results
 
-    def ancestors(self, concept: str, immediate: bool=False, details: bool=False, paths: bool=False) -> Union[List[str], List[List[str]], List[dict], List[List[dict]]]:
-        concept = concept.lower()
+    def ancestors(self, concept: str, immediate: bool=False, details: bool=False, paths: bool=False, max_paths: int=None, max_depth: int=None) -> Union[List[str], List[List[str]], List[dict], List[List[dict]]]:
+        if paths:
+            return list(self.ancestor_paths(concept, details=details, max_paths=max_paths, max_depth=max_depth))
 
-        pipeline = [
-            {
-                "$match": {
-                    "name": concept
-                }
-            }
-        ]
+        concept = concept.lower()
 
-        if immediate:
-            pipeline.append({
-                "$graphLookup": {
-                    "from": self.collection.name,
-                    "startWith": "$parents",
-                    "connectFromField": "parents",
-                    "connectToField": "name",
-                    "as": "ancestors",
-                    "maxDepth": 0
-                }
-            })
-        else:
-            pipeline.append({
-                "$graphLookup": {
-                    "from": self.collection.name,
-                    "startWith": "$parents",
-                    "connectFromField": "parents",
-                    "connectToField": "name",
-                    "as": "ancestors"
-                }
-            })
+        graph = self.graph
+        output = graph.ancestors(concept, immediate=immediate)
 
-        result = list(self.collection.aggregate(pipeline))[0]
-        self.cache([result])
-        self.cache(result["ancestors"])
+        if details:
+            memo = ont.cache.memo(self.collection)
+            records = self._load(output, memo=memo)
+            output = list(map(lambda concept: self.format(records[concept], graph=graph, memo=memo), output))
 
-        def build_paths(name, current_path=None):
-            if current_path is None:
-                current_path = []
+        return output
 
-            concept = self._cache[name]
+    def ancestor_paths(self, concept: str, details: bool=False, max_paths: int=None, max_depth: int=None) -> Iterator[Union[List[str], List[dict]]]:
+        concept = concept.lower()
 
-            if len(concept["parents"]) == 0:
-                return [current_path]
+        graph = self.graph
+        max_paths, max_depth = self._path_limits(max_paths, max_depth)
+        paths = graph.ancestor_paths(graph.id(concept), max_paths=max_paths, max_depth=max_depth)
 
-            paths = []
-            for parent in concept["parents"]:
-                for path in build_paths(parent, current_path + [parent]):
-                    paths.append(path)
+        records = None
+        if details:
+            records = self._load(graph.ancestors(concept))
 
-            return paths
+        return self._expand_paths(paths, graph, records=records)
 
-        output = [list(map(lambda ancestor: ancestor["name"], result["ancestors"]))]
+    def descendants(self, concept: str, immediate: bool = False, details: bool = False, paths: bool = False, max_paths: int=None, max_depth: int=None) -> Union[List[str], List[List[str]], List[dict], List[List[dict]]]:
         if paths:
-            output = list(filter(lambda path: len(path) > 0, build_paths(result["name"])))
+            return list(self.descendant_paths(concept, details=details, max_paths=max_paths, max_depth=max_depth))
+
+        concept = concept.lower()
+
+        graph = self.graph
+        output = graph.descendants(concept, immediate=immediate)
 
         if details:
-            output = list(map(lambda path: list(map(lambda concept: self.format(self._cache[concept]), path)), output))
+            memo = ont.cache.memo(self.collection)
+            records = self._load(output, memo=memo)
+            output = list(map(lambda concept: self.format(records[concept], graph=graph, memo=memo), output))
+            output = sorted(output, key=lambda x: list(x.keys())[0])
 
-        if not paths:
-            return output[0]
         return output
 
-    def descendants(self, concept: str, immediate: bool = False, details: bool = False, paths: bool = False) -> Union[List[str], List[List[str]], List[dict], List[List[dict]]]:
+    def descendant_paths(self, concept: str, details: bool=False, max_paths: int=None, max_depth: int=None) -> Iterator[Union[List[str], List[dict]]]:
         concept = concept.lower()
 
-        pipeline = [
-            {
-                "$match": {
-                    "name": concept
-                }
-            }
-        ]
+        graph = self.graph
+        max_paths, max_depth = self._path_limits(max_paths, max_depth)
+        paths = graph.descendant_paths(graph.id(concept), max_paths=max_paths, max_depth=max_depth)
 
-        if immediate:
-            pipeline.append({
-                "$graphLookup": {
-                    "from": self.collection.name,
-                    "startWith": "$name",
-                    "connectFromField": "name",
-                    "connectToField": "parents",
-                    "as": "descendants",
-                    "maxDepth": 0
-                }
-            })
+        records = None
+        if details:
+            records = self._load(graph.descendants(concept))
+
+        return self._expand_paths(paths, graph, records=records)
+
+    @staticmethod
+    def _path_limits(max_paths: int=None, max_depth: int=None) -> Tuple[int, int]:
+        max_paths = MAX_PATHS if max_paths is None else min(max_paths, MAX_PATHS)
+        max_depth = MAX_PATH_DEPTH if max_depth is None else min(max_depth, MAX_PATH_DEPTH)
+
+        return max_paths, max_depth
+
+    def _expand_paths(self, paths: Iterator[List[int]], graph: OntologyGraph, records: Dict[str, dict]=None) -> Iterator[Union[List[str], List[dict]]]:
+        memo = ont.cache.memo(self.collection) if records is not None else None
+
+        for path in paths:
+            path = list(map(lambda id: graph.names[id], path))
+            if records is not None:
+                path = list(map(lambda concept: self.format(records[concept], graph=graph, memo=memo), path))
+            yield path
+
+    def is_a(self, concept: str, ancestor: str) -> bool:
+        return self.is_a_batch([(concept, ancestor)])[0]
+
+    def is_a_batch(self, pairs: List[Tuple[str, str]]) -> List[bool]:
+        graph = self.graph
+        return list(map(lambda pair: graph.is_a(pair[0].lower().strip(), pair[1].lower().strip()), pairs))
+
+    def common_ancestors(self, concepts: List[str], most_specific: bool=True) -> List[str]:
+        return self.common_ancestors_batch([concepts], most_specific=most_specific)[0]
+
+    def common_ancestors_batch(self, groups: List[List[str]], most_specific: bool=True) -> List[List[str]]:
+        graph = self.graph
+        depths = graph.depths()
+
+        results = []
+        for concepts in groups:
+            concepts = set(map(lambda concept: concept.lower().strip(), concepts))
+            subsumers = graph.most_specific_subsumers(concepts) if most_specific else graph.common_subsumers(concepts)
+
+            # Deepest (most specific) first
+            results.append(sorted(subsumers, key=lambda name: (-depths[graph.ids[name]], name)))
+
+        return results
+
+    def similarity(self, pairs: List[Tuple[str, str]], metric: str=ont.graph.WU_PALMER) -> List[float]:
+        graph = self.graph
+        pairs = list(map(lambda pair: (pair[0].lower().strip(), pair[1].lower().strip()), pairs))
+
+        if metric == ont.graph.WU_PALMER:
+            measure = graph.wu_palmer
+        elif metric == ont.graph.PATH:
+            measure = graph.path_similarity
         else:
-            pipeline.append({
-                "$graphLookup": {
-                    "from": self.collection.name,
-                    "startWith": "$name",
-                    "connectFromField": "name",
-                    "connectToField": "parents",
-                    "as": "descendants"
-                }
-            })
+            raise Exception("Unknown similarity metric %s." % metric)
 
-        result = list(self.collection.aggregate(pipeline))[0]
-        self.cache([result])
-        self.cache(result["descendants"])
+        # Pairs naming an unknown concept score 0
+        known = list(filter(lambda i: pairs[i][0] in graph and pairs[i][1] in graph, range(len(pairs))))
+        x = np.array(list(map(lambda i: graph.ids[pairs[i][0]], known)), dtype=np.int64)
+        y = np.array(list(map(lambda i: graph.ids[pairs[i][1]], known)), dtype=np.int64)
 
-        def build_paths(name, current_path=None):
-            if current_path is None:
-                current_path = []
+        results = [0.0] * len(pairs)
+        for i, score in zip(known, measure(x, y).tolist()):
+            results[i] = score
 
-            c = self._cache[name]
+        return results
 
-            if len(c["parents"]) == 0:
-                return [current_path]
+    def check_constraints(self, items: List[Tuple[str, str, Any]]) -> List[dict]:
+        graph = self.graph
+        memo = ont.cache.memo(self.collection)
 
-            paths = []
-            for parent in filter(lambda parent: parent != concept, c["parents"]):
-                for path in build_paths(parent, current_path + [parent]):
-                    paths.append(path)
+        items = list(map(lambda item: (item[0].lower().strip(), item[1].lower().strip(), item[2]), items))
+        records = self._load(set(map(lambda item: item[0], items)), memo=memo)
 
-            if len(paths) == 0:
-                return [current_path]
+        # Resolve each distinct concept's inherited constraining facets once
+        constraints = {}
+        for concept in set(map(lambda item: item[0], items)):
+            if concept not in records:
+                continue
 
-            return paths
+            constraints[concept] = {}
+            for property in self._inherit(records[concept], memo=memo):
+                if property["facet"] in CONSTRAINT_FACETS:
+                    constraints[concept].setdefault(property["slot"], {}).setdefault(property["facet"], []).append(property["filler"])
 
-        output = [list(map(lambda descendant: descendant["name"], result["descendants"]))]
-        if paths:
-            output = map(lambda descendant: build_paths(descendant, current_path=[descendant]), output[0])
-            output = [item for sublist in output for item in sublist]
-            output = list(map(lambda path: list(reversed(path)), output))
+        verdicts = []
+        for concept, slot, filler in items:
+            if concept not in constraints:
+                verdicts.append({"satisfied": False, "facet": None})
+                continue
 
-        if details:
-            output = list(map(lambda path: list(map(lambda concept: self.format(self._cache[concept]), path)), output))
+            facets = constraints[concept].get(slot, {})
+            if len(facets) == 0:
+                verdicts.append({"satisfied": True, "facet": None})
+                continue
 
-        if details and not paths:
-            output[0] = sorted(output[0], key=lambda x: list(x.keys())[0])
+            # Report the tightest facet with a filler that subsumes (or equals) the candidate
+            matched = None
+            for facet in CONSTRAINT_FACETS:
+                if any(map(lambda constraint: self._satisfies(graph, filler, constraint), facets.get(facet, []))):
+                    matched = facet
+                    break
 
-        if not paths:
-            return output[0]
-        return output
+            verdicts.append({"satisfied": matched is not None, "facet": matched})
 
-    def siblings(self, concept: str) -> List[str]:
-        concept = concept.lower()
+        return verdicts
 
-        pipeline = [
-            {"$match": {"name": concept}},
-            {
-                "$graphLookup": {
-                    "from": self.collection.name,
-                    "startWith": "$parents",
-                    "connectFromField": "name",
-                    "connectToField": "parents",
-                    "as": "children",
-                    "maxDepth": 1,
-                }
-            },
-            {"$unwind": "$children"},
-            {"$project": {"name": "$children.name", "iparents": {
-            "$gt": [{"$size": {"$setIntersection": ["$parents", "$children.parents"]}}, 0]}}},
-            {"$match": {"name": {"$ne": concept}}},
-            {"$match": {"iparents": True}}
-        ]
+    def statistics(self, concepts: Union[str, List[str]]) -> Dict[str, dict]:
+        if isinstance(concepts, str):
+            concepts = [concepts]
 
-        siblings = list(self.collection.aggregate(pipeline))
-        siblings = list(map(lambda s: s["name"], siblings))
-        siblings = sorted(siblings)
+        graph = self.graph
+        concepts = map(lambda concept: concept.lower().strip(), concepts)
+
+        return dict(map(lambda concept: (concept, graph.statistics(concept)), filter(lambda concept: concept in graph, concepts)))
+
+    def siblings(self, concept: str) -> List[str]:
+        concept = concept.lower()
 
-        return siblings
+        return self.graph.siblings(concept)
 
     def inverses(self) -> List[str]:
         pipeline = [
@@ -230,39 +312,16 @@ class OntologyAPI(object):
             {"$group": {"_id": "result", "inverses": {"$push": "$inverse"}}}
         ]
 
-        result = list(self.collection.aggregate(pipeline))[0]
-        result = result["inverses"]
+        result = list(self.collection.aggregate(pipeline))
+        if len(result) == 0:
+            return []
 
-        return result
+        return result[0]["inverses"]
 
     def relations(self, inverses: bool=False) -> List[str]:
-        pipeline = [
-            {
-                "$match": {
-                    "name": "relation"
-                }
-            }, {
-                "$graphLookup": {
-                    "from": self.collection.name,
-                    "startWith": "$name",
-                    "connectFromField": "name",
-                    "connectToField": "parents",
-                    "as": "descendants"
-                }
-            }, {
-                "$unwind": {
-                    "path": "$descendants"
-                }
-            },
-            {
-                "$project": {
-                    "rel": "$descendants.name"
-                }
-            }
-        ]
+        graph = self.graph
 
-        result = list(self.collection.aggregate(pipeline))
-        result = list(map(lambda r: r["rel"], result))
+        result = graph.descendants("relation") if "relation" in graph else []
         result.append("relation")
 
         if inverses:
@@ -284,40 +343,10 @@ class OntologyAPI(object):
     def domains_and_ranges(self, property: str) -> Dict[str, List[str]]:
         property = property.lower().strip()
 
-        pipeline = [
-            {"$match": {"localProperties.slot": property}},
-            {"$project": {"name": 1, "localProperties": 1}},
-            {"$unwind": "$localProperties"},
-            {"$match": {"localProperties.slot": property}},
-            {"$project": {"domain": "$name", "range": "$localProperties.filler"}}
-        ]
-
-        results = {}
-        for dr in self.collection.aggregate(pipeline):
-            if dr["domain"] not in results:
-                results[dr["domain"]] = []
-            results[dr["domain"]].append(dr["range"])
-
-        return results
+        return ont.properties.index(self.collection).domains_and_ranges(property)
 
     def full_ancestry(self) -> dict:
-        pipeline = [
-            {
-                "$graphLookup": {
-                    "from": self.collection.name,
-                    "startWith": "$parents",
-                    "connectFromField": "parents",
-                    "connectToField": "name",
-                    "as": "ancestors"
-                }
-            },
-            {"$project": {"ancestry": "$ancestors.name", "name": 1}}
-        ]
-
-        ancestry = {}
-        for d in self.collection.aggregate(pipeline):
-            ancestry[d["name"]] = set(d["ancestry"])
-        return ancestry
+        return self.graph.full_ancestry()
 
     def relations_to_inverses(self) -> dict:
 
@@ -387,67 +416,57 @@ class OntologyAPI(object):
             ]
             report["usage"]["subclasses"] = list(map(lambda o: o["name"], self.collection.aggregate(pipeline)))
 
-
-            pipeline: List[dict] = [
-                {"$match": {"name": concept}},
-            ]
-
-            if not usage_with_inheritance:
-                pipeline.append({"$addFields": {"ancestry": [concept]}})
-            else:
-                pipeline.extend([
-                    {
-                        "$graphLookup": {
-                            "from": self.collection.name,
-                            "startWith": "$parents",
-                            "connectFromField": "parents",
-                            "connectToField": "name",
-                            "as": "ancestors"
-                        }
-                    },
-                    {"$addFields": {"ancestry": {"$setUnion": ["$ancestors.name", [concept]]}}}
-                ])
-
-            pipeline.extend([
-                {"$lookup": {
-                    "from": self.collection.name,
-                    "localField": "ancestry",
-                    "foreignField": "localProperties.filler",
-                    "as": "usages"
-                }
-                },
-                {"$unwind": "$usages"},
-                {"$project":
-                    {
-                        "ancestry": 1,
-                        "name": "$usages.name",
-                        "localProperties": "$usages.localProperties"
-                    }
-                },
-                {"$unwind": "$ancestry"},
-                {"$unwind": "$localProperties"},
-                {"$project":
-                    {
-                        "ancestry": 1,
-                        "name": 1,
-                        "slot": "$localProperties.slot",
-                        "facet": "$localProperties.facet",
-                        "filler": "$localProperties.filler",
-                    }
-                },
-                {"$match": {"$expr": {"$eq": ["$filler", "$ancestry"]}}},
-                {"$project": {"ancestry": 0, "_id": 0}}
-            ])
+            graph = self.graph
+            ancestry = []
+            if concept in graph:
+                ancestry = [concept]
+                if usage_with_inheritance:
+                    ancestry.extend(graph.ancestors(concept))
 
             report["usage"]["inverses"] = list(map(lambda o: {
-                "concept": o["name"],
-                "slot": o["slot"],
-                "facet": o["facet"],
-                "filler": o["filler"],
-            }, self.collection.aggregate(pipeline)))
+                "concept": o[0],
+                "slot": o[1],
+                "facet": o[2],
+                "filler": o[3],
+            }, ont.properties.index(self.collection).usages(ancestry)))
 
         return report
 
+    def batch(self, operations: List[dict]) -> list:
+        # Each operation is {"op": method name, "args": keyword arguments}; results come back in the same order. Every
+        # operation is checked before any runs, and path enumerations are held to the same caps as their own routes
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            raise BatchError("At most %d operations per batch." % MAX_BATCH_OPERATIONS)
+
+        calls = []
+        for operation in operations:
+            op = operation.get("op")
+            if op not in BATCH_OPERATIONS:
+                raise BatchError("Unknown operation %s." % op)
+
+            args = operation.get("args", {})
+            signature = inspect.signature(getattr(self, op))
+            try:
+                signature.bind(**args)
+            except TypeError as e:
+                raise BatchError("Invalid arguments to %s: %s." % (op, e))
+
+            for name, value in args.items():
+                parameter = signature.parameters[name]
+                if value is None and parameter.default is None:
+                    continue
+
+                if not _conforms(value, parameter.annotation):
+                    raise BatchError("Invalid %s %s." % (name, json.dumps(value)))
+                if name in BATCH_CHOICES and value not in BATCH_CHOICES[name]:
+                    raise BatchError("Invalid %s %s." % (name, json.dumps(value)))
+                if name in BATCH_MINIMUMS and value < BATCH_MINIMUMS[name]:
+                    raise BatchError("Invalid %s %s." % (name, json.dumps(value)))
+
+            calls.append((getattr(self, op), args))
+
+        return list(map(lambda call: call[0](**call[1]), calls))
+
     def update_definition(self, concept: str, definition: str):
         concept = concept.lower().strip()
 
@@ -459,6 +478,8 @@ class OntologyAPI(object):
             }
         })
 
+        self._changed([], defined=[concept])
+
     def insert_property(self, concept: str, slot: str, facet: str, filler: str):
         concept = concept.lower().strip()
 
@@ -474,6 +495,8 @@ class OntologyAPI(object):
             }
         })
 
+        self._changed([concept], inverse=slot.lower().strip() == "inverse", properties=[concept])
+
     def remove_property(self, concept: str, slot: str, facet: str, filler: str):
         concept = concept.lower().strip()
 
@@ -489,6 +512,8 @@ class OntologyAPI(object):
             }
         })
 
+        self._changed([concept], inverse=slot.lower().strip() == "inverse", properties=[concept])
+
     def block_property(self, concept: str, slot: str, facet: str, filler: str):
         concept = concept.lower().strip()
 
@@ -504,6 +529,8 @@ class OntologyAPI(object):
             }
         })
 
+        self._changed([concept])
+
     def unblock_property(self, concept: str, slot: str, facet: str, filler: str):
         concept = concept.lower().strip()
 
@@ -519,6 +546,8 @@ class OntologyAPI(object):
             }
         })
 
+        self._changed([concept])
+
     def add_parent(self, concept: str, parent: str):
         concept = concept.lower().strip()
         parent = parent.lower().strip()
@@ -534,6 +563,8 @@ class OntologyAPI(object):
             }
         })
 
+        self._changed([concept], hierarchy=True, relinked=[concept])
+
     def remove_parent(self, concept: str, parent: str):
         concept = concept.lower().strip()
         parent = parent.lower().strip()
@@ -546,6 +577,8 @@ class OntologyAPI(object):
             }
         })
 
+        self._changed([concept], hierarchy=True, relinked=[concept])
+
     def add_concept(self, concept: str, parent: Union[str, None], definition: str):
         concept = concept.lower().strip()
 
@@ -571,12 +604,17 @@ class OntologyAPI(object):
             "totallyRemovedProperties": []
         })
 
+        self._changed(None, hierarchy=True, added=[concept], properties=[concept], relinked=[concept])
+
     def remove_concept(self, concept: str, include_usages: bool=False):
         concept = concept.lower().strip()
+        edited = [concept]
+        relinked = [concept]
 
         if include_usages:
             report = self.report(concept, include_usage=True)
             for child in report["usage"]["subclasses"]:
+                relinked.append(child)
                 self.collection.update_one({
                     "name": child
                 }, {
@@ -585,6 +623,7 @@ class OntologyAPI(object):
                     }
                 })
             for inverse in report["usage"]["inverses"]:
+                edited.append(inverse["concept"])
                 self.collection.update_one({
                     "name": inverse["concept"]
                 }, {
@@ -601,30 +640,78 @@ class OntologyAPI(object):
             "name": concept
         })
 
-    def cache(self, concepts):
-        for concept in concepts:
-            self._cache[concept["name"]] = concept
+        self._changed(None, hierarchy=True, removed=[concept], properties=edited, relinked=relinked)
+
+    def warm(self, limit: int=ont.management.WARM_CONCEPTS) -> List[str]:
+        # Resolve the most requested frames, the roots and the relations ahead of time, and pin the hot frames and
+        # their documents so that neither cache evicts them; access statistics are not counted for any of this
+        hot = ont.cache.hottest(self.collection, limit)
+        ont.cache.pin(self.collection, hot)
+
+        self.roots()
+
+        memo = ont.cache.memo(self.collection)
+        if memo.relations is None:
+            memo.relations = frozenset(self.relations(inverses=True))
+
+        self._get(hot)
+
+        return hot
+
+    def _changed(self, concepts: Union[List[str], None], hierarchy: bool=False, inverse: bool=False, added: List[str]=(), removed: List[str]=(), defined: List[str]=(), properties: List[str]=(), relinked: List[str]=()):
+        # Record what the edit touched along with the new version, so that other processes can replay it, then carry
+        # this process's own structures forward
+        change = {
+            "concepts": list(concepts) if concepts is not None else None,
+            "hierarchy": hierarchy,
+            "inverse": inverse,
+            "added": list(added),
+            "removed": list(removed),
+            "defined": list(defined),
+            "properties": list(properties),
+            "relinked": list(relinked)
+        }
+
+        graph = self.graph if concepts is not None else None
+        previous, current = ont.management.bump_version(self.collection, change=change)
+
+        ont.sync.apply(self.collection, previous, current, change, graph=graph)
+
+    def _load(self, names, memo: ont.cache.InheritanceMemo=None) -> Dict[str, dict]:
+        # The first document for each name that exists
+        version = memo.version if memo is not None else None
+        records = ont.cache.records(self.collection, names, version=version)
+
+        return dict(map(lambda name: (name, records[name][0]), records.keys()))
+
+    def format(self, concept, local: bool=False, metadata: bool=False, graph: OntologyGraph=None, memo=None):
+        if graph is None:
+            graph = self.graph
+        if memo is None:
+            memo = ont.cache.memo(self.collection)
 
-    def format(self, concept, local: bool=False, metadata: bool=False):
         output = {
             "is-a": {"value": concept["parents"]},
-            "subclasses": {"value": list(map(lambda record: record["name"], self.collection.find({"parents": concept["name"]})))}
+            "subclasses": {"value": graph.descendants(concept["name"], immediate=True) if concept["name"] in graph else []}
         }
 
         if local:
             properties = concept["localProperties"]
             for p in properties:
                 if metadata:
-                    p["metadata"] = {
+                    p = dict(p, metadata={
                         "defined_in": concept["name"]
-                    }
+                    })
                 self._add_property(output, p, metadata=metadata)
         else:
-            for property in self._inherit(concept, metadata=metadata):
+            for property in self._inherit(concept, metadata=metadata, memo=memo):
                 self._add_property(output, property, metadata=metadata)
 
         if metadata:
-            relations = self.relations(inverses=True)
+            if memo.relations is None:
+                memo.relations = frozenset(self.relations(inverses=True))
+
+            relations = memo.relations
             for property in output:
                 output[property]["is_relation"] = property in relations
 
@@ -657,45 +744,97 @@ class OntologyAPI(object):
         else:
             output[slot][facet].append(filler)
 
-    def _inherit(self, concept, metadata: bool=False):
-        properties = concept["localProperties"]
+    def _inherit(self, concept, metadata: bool=False, memo=None):
+        if memo is None:
+            memo = ont.cache.memo(self.collection)
+
+        key = (concept["name"], metadata)
+        version = memo.version
+
+        resolved = memo.get(key)
+        if resolved is not None:
+            return resolved
+
+        # Resolved lists are shared through the memo, so properties are copied rather than annotated in place
+        properties = list(concept["localProperties"])
 
         if metadata:
-            for p in properties:
-                p["metadata"] = {
-                    "defined_in": concept["name"]
-                }
+            properties = list(map(lambda p: dict(p, metadata={"defined_in": concept["name"]}), properties))
 
-        for parent_name in concept["parents"]:
-            parent = self._cache[parent_name] if parent_name in self._cache else self.collection.find_one({"name": parent_name})
+        present = set(map(self._triple, concept["localProperties"]))
+        overridden = set(map(self._triple, concept["overriddenFillers"]))
+        deleted = set(map(self._triple, concept["totallyRemovedProperties"]))
 
-            if parent_name not in self._cache:
-                self.cache([parent])
+        for parent_name in concept["parents"]:
+            parent = self._load([parent_name], memo=memo).get(parent_name)
 
-            inherited = self._inherit(parent, metadata=metadata)
-            inherited = self._remove_overridden_fillers(inherited, concept["overriddenFillers"])
-            inherited = self._remove_deleted_fillers(inherited, concept["totallyRemovedProperties"], metadata=metadata)
-            inherited = self._prune_list(inherited, properties) # Clean up any duplicates, retaining local copies
+            inherited = self._inherit(parent, metadata=metadata, memo=memo)
+            inherited = self._prune_keys(inherited, overridden)
+            inherited = self._block_keys(inherited, deleted, metadata=metadata)
+            if not metadata:
+                # Clean up any duplicates, retaining local copies; with metadata every copy is kept so the editor can show where each came from
+                inherited = self._prune_keys(inherited, present)
+                present.update(map(self._triple, inherited))
 
-            properties = properties + inherited
+            properties.extend(inherited)
 
+        memo.store(key, properties, version)
         return properties
 
     def _remove_overridden_fillers(self, properties, overridden_fillers):
-        properties = self._prune_list(properties, overridden_fillers)
-        return properties
+        return self._prune_keys(properties, set(map(self._triple, overridden_fillers)))
 
     def _remove_deleted_fillers(self, properties, deleted_fillers, metadata=False):
-        if metadata:
-            properties = list(filter(lambda p: not ("blocked" in p["metadata"] and p["metadata"]["blocked"]), properties))
-            for inherited in properties:
-                if {"slot": inherited["slot"], "facet": inherited["facet"], "filler": inherited["filler"]} in deleted_fillers:
-                    inherited["metadata"]["blocked"] = True
-            return properties
-
-        return self._prune_list(properties, deleted_fillers)
+        return self._block_keys(properties, set(map(self._triple, deleted_fillers)), metadata=metadata)
 
     def _prune_list(self, enclosing_list, to_remove):
-        pruned = [e for e in enclosing_list if {"slot": e["slot"], "facet": e["facet"], "filler": e["filler"]} not in to_remove]
-        return pruned
-
+        return self._prune_keys(enclosing_list, set(map(self._triple, to_remove)))
+
+    def _prune_keys(self, enclosing_list, keys):
+        if len(keys) == 0:
+            return enclosing_list
+        return [e for e in enclosing_list if self._triple(e) not in keys]
+
+    def _block_keys(self, properties, keys, metadata=False):
+        if not metadata:
+            return self._prune_keys(properties, keys)
+
+        # Fillers blocked further up are dropped entirely; fillers blocked here are kept but marked
+        properties = list(filter(lambda p: not ("blocked" in p["metadata"] and p["metadata"]["blocked"]), properties))
+        return list(map(lambda p: dict(p, metadata=dict(p["metadata"], blocked=True)) if self._triple(p) in keys else p, properties))
+
+    @staticmethod
+    def _satisfies(graph: OntologyGraph, filler, constraint) -> bool:
+        if isinstance(filler, str) and isinstance(constraint, str):
+            filler = filler.lower().strip()
+            return filler == constraint.lower() or graph.is_a(filler, constraint.lower())
+        return filler == constraint
+
+    @staticmethod
+    def _triple(property) -> tuple:
+        filler = property["filler"]
+        if isinstance(filler, (dict, list)):
+            filler = json.dumps(filler, sort_keys=True)
+
+        return property["slot"], property["facet"], filler
+
+
+def _conforms(value, annotation) -> bool:
+    # Whether a value decoded from JSON fits a parameter's annotation; tuples arrive as lists
+    origin = getattr(annotation, "__origin__", None)
+    args = getattr(annotation, "__args__", ())
+
+    if origin is Union:
+        return any(map(lambda option: _conforms(value, option), args))
+    if origin in (list, List):
+        return isinstance(value, list) and all(map(lambda item: _conforms(item, args[0]), value))
+    if origin in (tuple, Tuple):
+        return isinstance(value, list) and len(value) == len(args) and all(map(lambda item: _conforms(item[0], item[1]), zip(value, args)))
+    if origin in (dict, Dict):
+        return isinstance(value, dict)
+    if annotation in (bool, int, str):
+        return type(value) == annotation
+    if annotation == float:
+        return type(value) in (int, float)
+
+    return True
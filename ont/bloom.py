@@ -0,0 +1,57 @@
+from typing import Iterable
+
+import base64
+import hashlib
+import math
+
+
+class BloomFilter(object):
+
+    def __init__(self, size: int, hashes: int, bits: bytearray=None, count: int=0):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bits if bits is not None else bytearray((size + 7) // 8)
+        self.count = count
+
+    @classmethod
+    def of(cls, names: Iterable[str], error_rate: float=0.01) -> "BloomFilter":
+        # Sized for the names given (and the requested false positive rate), so later additions raise that rate
+        names = list(names)
+        capacity = max(len(names), 1)
+
+        size = max(int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))), 8)
+        hashes = max(int(round(size / capacity * math.log(2))), 1)
+
+        bloom = cls(size, hashes)
+        for name in names:
+            bloom.add(name)
+
+        return bloom
+
+    @classmethod
+    def from_json(cls, data: dict) -> "BloomFilter":
+        return cls(data["size"], data["hashes"], bits=bytearray(base64.b64decode(data["bits"])), count=data["count"])
+
+    def to_json(self) -> dict:
+        return {
+            "size": self.size,
+            "hashes": self.hashes,
+            "count": self.count,
+            "bits": base64.b64encode(bytes(self.bits)).decode("ascii")
+        }
+
+    def __contains__(self, name: str) -> bool:
+        return all(map(lambda position: self.bits[position >> 3] & (1 << (position & 7)), self._positions(name)))
+
+    def add(self, name: str):
+        for position in self._positions(name):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def _positions(self, name: str) -> Iterable[int]:
+        # Double hashing over one MD5 digest, so that any client can reproduce the positions from the shipped bits
+        digest = hashlib.md5(name.encode("utf-8")).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+
+        return map(lambda i: (h1 + i * h2) % self.size, range(self.hashes))
@@ -0,0 +1,421 @@
+from bson import BSON
+from collections import OrderedDict
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from typing import Dict, Iterable, List, Tuple, Union
+
+import logging
+import ont.management
+import ont.search
+import os
+import pymongo.errors
+import threading
+import time
+
+
+RECORD_CACHE_ENTRIES = int(os.environ["RECORD_CACHE_ENTRIES"]) if "RECORD_CACHE_ENTRIES" in os.environ else 50000
+RECORD_CACHE_BYTES = int(os.environ["RECORD_CACHE_BYTES"]) if "RECORD_CACHE_BYTES" in os.environ else 256 * 1024 * 1024
+MEMO_ENTRIES = int(os.environ["MEMO_ENTRIES"]) if "MEMO_ENTRIES" in os.environ else 50000
+MEMO_BYTES = int(os.environ["MEMO_BYTES"]) if "MEMO_BYTES" in os.environ else 256 * 1024 * 1024
+ACCESS_FLUSH_INTERVAL = float(os.environ["ACCESS_FLUSH_INTERVAL"]) if "ACCESS_FLUSH_INTERVAL" in os.environ else 60.0
+
+logger = logging.getLogger(__name__)
+
+
+class InheritanceMemo(object):
+
+    def __init__(self, version: str=None, entries: int=MEMO_ENTRIES, bytes: int=MEMO_BYTES):
+        self.version = version
+        self.capacity = entries
+        self.max_bytes = bytes
+
+        # Resolved property lists, keyed by (name, metadata), in least- to most-recently used order along with their
+        # encoded sizes; lists share their inherited properties, so the sizes overstate what the memo really holds
+        self.resolved = OrderedDict()
+        self.bytes = 0
+        self.relations = None
+
+        # Keys never evicted to make room (edits still evict them)
+        self.pinned = frozenset()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+
+    def __contains__(self, key) -> bool:
+        return key in self.resolved
+
+    def __getitem__(self, key) -> List[dict]:
+        return self.resolved[key][0]
+
+    def get(self, key) -> Union[List[dict], None]:
+        with self._lock:
+            entry = self.resolved.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.resolved.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def store(self, key, properties: List[dict], version: str) -> bool:
+        size = sum(map(lambda property: len(BSON.encode(property)), properties))
+
+        # Keep a resolved frame only if no edit moved the memo on while it was being resolved
+        with self._lock:
+            if self.version != version:
+                return False
+
+            self._evict(key)
+            self.resolved[key] = (properties, size)
+            self.bytes += size
+
+            while len(self.resolved) > self.capacity or self.bytes > self.max_bytes:
+                oldest = next(filter(lambda key: key not in self.pinned, self.resolved), None)
+                if oldest is None:
+                    break
+
+                self._evict(oldest)
+                self.evictions += 1
+
+            return True
+
+    def pin(self, keys: Iterable):
+        with self._lock:
+            self.pinned = frozenset(keys)
+
+    def evict(self, concepts: Iterable[str]):
+        concepts = set(concepts)
+        with self._lock:
+            for key in list(filter(lambda key: key[0] in concepts, self.resolved.keys())):
+                self._evict(key)
+
+    def advance(self, current: str, concepts: Iterable[str], relations: bool=False):
+        concepts = set(concepts)
+        with self._lock:
+            for key in list(filter(lambda key: key[0] in concepts, self.resolved.keys())):
+                self._evict(key)
+
+            self.version = current
+            if relations:
+                self.relations = None
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self.resolved),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "pinned": len(self.pinned)
+            }
+
+    def _evict(self, key):
+        entry = self.resolved.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+
+class RecordCache(object):
+
+    def __init__(self, entries: int=RECORD_CACHE_ENTRIES, bytes: int=RECORD_CACHE_BYTES):
+        self.capacity = entries
+        self.max_bytes = bytes
+
+        # Concept documents in least- to most-recently used order, keyed by (database, collection, name); each
+        # collection's entries all belong to the one version recorded for it, and move forward with it on edits
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.members = {}
+        self.bytes = 0
+
+        # Names per collection whose entries are never evicted to make room (edits still evict them)
+        self.pinned = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str], version: str, names: Iterable[str]) -> Tuple[Dict[str, List[dict]], List[str]]:
+        found = {}
+        missing = []
+
+        with self._lock:
+            if self.versions.get(key) != version:
+                self._purge(key)
+                self.versions[key] = version
+
+            for name in names:
+                entry = self.entries.get(key + (name,))
+                if entry is None:
+                    missing.append(name)
+                    continue
+
+                self.entries.move_to_end(key + (name,))
+                found[name] = entry[0]
+
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        return found, missing
+
+    def put(self, key: Tuple[str, str], version: str, name: str, records: List[dict]):
+        size = sum(map(lambda record: len(BSON.encode(record)), records))
+
+        with self._lock:
+            if self.versions.get(key) != version:
+                return
+
+            self._evict(key, name)
+            self.entries[key + (name,)] = (records, size)
+            self.members.setdefault(key, set()).add(name)
+            self.bytes += size
+
+            while len(self.entries) > self.capacity or self.bytes > self.max_bytes:
+                oldest = next(filter(lambda entry: entry[2] not in self.pinned.get(entry[:2], ()), self.entries), None)
+                if oldest is None:
+                    break
+
+                self._evict(oldest[:2], oldest[2])
+                self.evictions += 1
+
+    def pin(self, key: Tuple[str, str], names: Iterable[str]):
+        with self._lock:
+            self.pinned[key] = frozenset(names)
+
+    def advance(self, key: Tuple[str, str], previous: str, current: str, concepts: Union[Iterable[str], None]):
+        with self._lock:
+            if self.versions.get(key) != previous or concepts is None:
+                self._purge(key)
+                return
+
+            for name in concepts:
+                self._evict(key, name)
+            self.versions[key] = current
+
+    def clear(self):
+        with self._lock:
+            self.entries = OrderedDict()
+            self.versions = {}
+            self.members = {}
+            self.bytes = 0
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "capacity": self.capacity,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": float(self.hits) / lookups if lookups > 0 else 0.0,
+                "evictions": self.evictions,
+                "pinned": sum(map(len, self.pinned.values()))
+            }
+
+    def _evict(self, key: Tuple[str, str], name: str):
+        entry = self.entries.pop(key + (name,), None)
+        if entry is not None:
+            self.bytes -= entry[1]
+            self.members[key].discard(name)
+
+    def _purge(self, key: Tuple[str, str]):
+        for name in list(self.members.get(key, [])):
+            self._evict(key, name)
+        self.versions.pop(key, None)
+
+
+class AccessLog(object):
+
+    def __init__(self, interval: float=ACCESS_FLUSH_INTERVAL):
+        self.interval = interval
+
+        # Request counts per collection not yet added to the persisted ones, and where to persist them
+        self.pending = {}
+        self.databases = {}
+        self.flushed = time.time()
+        self.flushing = False
+
+        self._lock = threading.Lock()
+
+    def record(self, collection, names: Iterable[str]):
+        key = (collection.database.name, collection.name)
+
+        with self._lock:
+            counts = self.pending.setdefault(key, {})
+            for name in names:
+                counts[name] = counts.get(name, 0) + 1
+            self.databases[key[0]] = collection.database
+
+            due = not self.flushing and time.time() - self.flushed >= self.interval
+            if due:
+                self.flushing = True
+
+        # Persist from a background thread, so that no request waits on the write or fails with it
+        if due:
+            threading.Thread(target=self._flush, daemon=True).start()
+
+    def flush(self):
+        with self._lock:
+            pending = self.pending
+            self.pending = {}
+            self.flushed = time.time()
+
+        for key, counts in pending.items():
+            if len(counts) == 0:
+                continue
+
+            counts = list(counts.items())
+            updates = list(map(lambda count: UpdateOne(
+                {"collection": key[1], "name": count[0]},
+                {"$inc": {"count": count[1]}},
+                upsert=True
+            ), counts))
+
+            try:
+                self.databases[key[0]][ont.management.ACCESSES].bulk_write(updates, ordered=False)
+            except pymongo.errors.BulkWriteError as e:
+                # Upserts of a new name racing in from several processes collide on the unique index; count the
+                # failed ones again next time
+                self._requeue(key, map(lambda error: counts[error["index"]], e.details.get("writeErrors", [])))
+            except pymongo.errors.PyMongoError:
+                logger.exception("Persisting access counts for %s.%s failed." % key)
+                self._requeue(key, counts)
+
+    def _flush(self):
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                self.flushing = False
+
+    def _requeue(self, key: Tuple[str, str], counts: Iterable[Tuple[str, int]]):
+        with self._lock:
+            pending = self.pending.setdefault(key, {})
+            for name, count in counts:
+                pending[name] = pending.get(name, 0) + count
+
+    def hottest(self, collection, limit: int) -> List[str]:
+        if limit <= 0:
+            return []
+
+        self.flush()
+
+        records = collection.database[ont.management.ACCESSES].find({"collection": collection.name}, {"name": 1, "_id": 0})
+        return list(map(lambda record: record["name"], records.sort([("count", DESCENDING), ("name", ASCENDING)]).limit(limit)))
+
+
+_memos = {}
+_pins = {}
+_records = RecordCache()
+_accesses = AccessLog()
+
+
+def memo(collection) -> InheritanceMemo:
+    key = (collection.database.name, collection.name)
+    version = ont.management.version(collection)
+
+    resolved = _memos.get(key)
+    if resolved is None or resolved.version != version:
+        resolved = InheritanceMemo(version=version)
+        resolved.pin(map(lambda name: (name, False), _pins.get(key, ())))
+        _memos[key] = resolved
+
+    return resolved
+
+
+def records(collection, names: Iterable[str], version: str=None) -> Dict[str, List[dict]]:
+    # Every document for each name, shared by all OntologyAPI instances in the process; callers must not modify them
+    key = (collection.database.name, collection.name)
+    if version is None:
+        version = ont.management.version(collection)
+
+    found, missing = _records.get(key, version, names)
+
+    # Names the (already loaded) name index has never seen cannot have documents; skip asking Mongo for them
+    names = ont.search.peek(collection, version)
+    if names is not None:
+        missing = list(filter(lambda name: name in names, missing))
+
+    if len(missing) > 0:
+        loaded = {}
+        for record in collection.find({"name": {"$in": missing}}):
+            loaded.setdefault(record["name"], []).append(record)
+
+        for name, documents in loaded.items():
+            _records.put(key, version, name, documents)
+        found.update(loaded)
+
+    return found
+
+
+def evict(collection, previous: str, current: str, concepts: Union[Iterable[str], None]):
+    _records.advance((collection.database.name, collection.name), previous, current, concepts)
+
+
+def metrics() -> dict:
+    # Record cache metrics, plus those of the resolved inheritance frames summed over every collection's memo (each
+    # capped at MEMO_ENTRIES and MEMO_BYTES on its own)
+    memos = list(map(lambda resolved: resolved.metrics(), list(_memos.values())))
+    hits = sum(map(lambda memo: memo["hits"], memos))
+    lookups = hits + sum(map(lambda memo: memo["misses"], memos))
+
+    return dict(_records.metrics(), memo={
+        "entries": sum(map(lambda memo: memo["entries"], memos)),
+        "bytes": sum(map(lambda memo: memo["bytes"], memos)),
+        "capacity": MEMO_ENTRIES,
+        "max_bytes": MEMO_BYTES,
+        "hits": hits,
+        "misses": lookups - hits,
+        "hit_rate": float(hits) / lookups if lookups > 0 else 0.0,
+        "evictions": sum(map(lambda memo: memo["evictions"], memos)),
+        "pinned": sum(map(lambda memo: memo["pinned"], memos))
+    })
+
+
+def pin(collection, names: Iterable[str]):
+    # Pin the names' documents and resolved (non-metadata) frames, for this and every later version of the collection
+    key = (collection.database.name, collection.name)
+    names = frozenset(names)
+
+    _pins[key] = names
+    _records.pin(key, names)
+
+    resolved = _memos.get(key)
+    if resolved is not None:
+        resolved.pin(map(lambda name: (name, False), names))
+
+
+def touch(collection, names: Iterable[str]):
+    # Count a request for each of the names, persisted every ACCESS_FLUSH_INTERVAL seconds
+    _accesses.record(collection, names)
+
+
+def flush():
+    _accesses.flush()
+
+
+def hottest(collection, limit: int) -> List[str]:
+    return _accesses.hottest(collection, limit)
+
+
+def advance(collection, previous: str, current: str, concepts: Union[Iterable[str], None], relations: bool=False):
+    # Carry the memo over to the new version only if it was current right before this edit; otherwise drop it
+    key = (collection.database.name, collection.name)
+
+    resolved = _memos.get(key)
+    if resolved is None:
+        return
+
+    if resolved.version != previous or concepts is None:
+        _memos.pop(key, None)
+        return
+
+    resolved.advance(current, concepts, relations=relations)
@@ -0,0 +1,92 @@
+from typing import Dict, List, Tuple, Union
+
+import os
+import time
+
+
+# How long to trust a freshness check of a compiled collection before reading its PROGRESS document again
+CHECK_INTERVAL = float(os.environ["COMPILED_CHECK_INTERVAL"]) if "COMPILED_CHECK_INTERVAL" in os.environ else 5.0
+
+
+def handle(collection):
+    return collection.database["compiled_" + collection.name]
+
+
+def fresh(progress: Union[dict, None], version: str) -> Union[bool, None]:
+    # Which get (local or inherited) the compiled frames can stand in for: only a finished compile of this very
+    # version, with no extra domain/range or inverse frames, whose upper casing can be undone exactly; None for neither
+    if progress is None or progress.get("finished") is None or progress.get("version") != version:
+        return None
+
+    if not progress.get("lowercase", False):
+        return None
+
+    options = progress.get("options", {})
+    if options.get("domains_and_ranges", True) or options.get("inverses", True):
+        return None
+
+    return not options.get("inherited_values", False)
+
+
+_checks = {}
+
+
+def source(collection, version: str) -> Union[bool, None]:
+    key = (collection.database.name, collection.name)
+    now = time.time()
+
+    check = _checks.get(key)
+    if check is not None and check[0] == version and now - check[2] < CHECK_INTERVAL:
+        return check[1]
+
+    local = fresh(handle(collection).find_one({"_id": "PROGRESS"}), version)
+    _checks[key] = (version, local, now)
+
+    return local
+
+
+def frames(collection, names: List[str], version: str, local: bool=False) -> Tuple[Dict[str, dict], List[str]]:
+    # Frames for whichever names the compiled collection can answer, and the names left for live resolution
+    if len(names) == 0 or source(collection, version) != local:
+        return {}, names
+
+    found = {}
+    for record in handle(collection).find({"_id": {"$in": list(map(lambda name: name.upper(), names))}}):
+        # The bookkeeping document shares the _id space; a concept named "progress" is always resolved live
+        if record["_id"] == "PROGRESS":
+            continue
+
+        name = record.pop("_id").lower()
+        found[name] = lowered(record)
+
+    return found, list(filter(lambda name: name not in found, names))
+
+
+def lowered(frame: dict) -> dict:
+    # The inverse of compile's upper casing of slots, facets and string fillers
+    output = {}
+    for slot, facets in frame.items():
+        output[slot.lower()] = dict(map(lambda facet: (facet[0].lower(), list(map(lambda filler: filler.lower() if type(filler) == str else filler, facet[1]))), facets.items()))
+
+    return output
+
+
+def lowercase(name: str, frame: dict) -> bool:
+    # Whether upper casing the frame for compilation can be undone exactly
+    if name != name.lower():
+        return False
+
+    for slot, facets in frame.items():
+        if slot != slot.lower():
+            return False
+        for facet, fillers in facets.items():
+            if facet != facet.lower():
+                return False
+            if any(map(lambda filler: type(filler) == str and filler != filler.lower(), fillers)):
+                return False
+
+    return True
+
+
+def invalidate(collection):
+    _checks.pop((collection.database.name, collection.name), None)
@@ -0,0 +1,734 @@
+from bisect import bisect
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Set, Tuple, Union
+
+import numpy as np
+import ont.management
+import sys
+
+
+WU_PALMER = "wu-palmer"
+PATH = "path"
+
+# How many unpacked ancestry cells a batched similarity may hold at once (about 2 MB of flags and 4 MB of depths)
+UNPACKED_CELLS = 2 ** 21
+
+
+class UnknownConceptError(Exception):
+    pass
+
+
+class OntologyGraph(object):
+
+    def __init__(self, version: str=None):
+        self.version = version
+
+        # Concept names are interned and mapped to dense integer ids; the adjacency lists are indexed by id
+        self.ids = {}
+        self.names = []
+        self.parents = []
+        self.children = []
+        self.roots = []
+
+        # Each concept's position in document order (which is also the order a fresh load lists children and roots
+        # in), so edits can slot concepts in where a reload would put them
+        self.order = []
+        self._sequence = 0
+
+        self._labels = None
+        self._matrix = None
+        self._depths = None
+
+        # Subtree sizes and min/max depths, computed on first use and then patched by hierarchy edits (unless the
+        # hierarchy has a cycle, in which case they are measured again)
+        self._stats = None
+        self._cyclic = False
+
+    @classmethod
+    def load(cls, collection, version: str=None) -> "OntologyGraph":
+        graph = cls(version=version)
+
+        records = list(collection.find({}, {"name": 1, "parents": 1, "_id": 0}))
+        for record in records:
+            graph._intern(record["name"])
+
+        for record in records:
+            if len(record["parents"]) == 0:
+                graph.roots.append(graph.ids[record["name"]])
+
+            for parent in record["parents"]:
+                graph._link(record["name"], parent)
+
+        return graph
+
+    def copy(self) -> "OntologyGraph":
+        # An independent copy of the hierarchy to edit while other threads keep reading this one; the derived labels,
+        # matrix and depths are only ever replaced, never changed, so they can be shared until the copy is edited
+        graph = OntologyGraph(version=self.version)
+
+        graph.ids = dict(self.ids)
+        graph.names = list(self.names)
+        graph.parents = list(map(list, self.parents))
+        graph.children = list(map(list, self.children))
+        graph.roots = list(self.roots)
+        graph.order = list(self.order)
+        graph._sequence = self._sequence
+
+        graph._labels = self._labels
+        graph._matrix = self._matrix
+        graph._depths = self._depths
+
+        graph._stats = tuple(map(list, self._stats)) if self._stats is not None else None
+        graph._cyclic = self._cyclic
+
+        return graph
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def id(self, name: str) -> int:
+        try:
+            return self.ids[name]
+        except KeyError:
+            raise UnknownConceptError("Unknown concept %s." % name)
+
+    def ancestor_ids(self, id: int, immediate: bool=False) -> List[int]:
+        if immediate:
+            return list(self.parents[id])
+        return self._walk(id, self.parents)
+
+    def descendant_ids(self, id: int, immediate: bool=False) -> List[int]:
+        if immediate:
+            return list(self.children[id])
+        return self._walk(id, self.children)
+
+    def ancestors(self, name: str, immediate: bool=False) -> List[str]:
+        return list(map(lambda id: self.names[id], self.ancestor_ids(self.id(name), immediate=immediate)))
+
+    def descendants(self, name: str, immediate: bool=False) -> List[str]:
+        return list(map(lambda id: self.names[id], self.descendant_ids(self.id(name), immediate=immediate)))
+
+    def ancestor_paths(self, id: int, max_paths: int=None, max_depth: int=None) -> Iterator[List[int]]:
+        # Every path from the concept up to a root (or to max_depth), excluding the concept itself
+        return self._paths(id, self.parents, maximal=True, max_paths=max_paths, max_depth=max_depth)
+
+    def descendant_paths(self, id: int, max_paths: int=None, max_depth: int=None) -> Iterator[List[int]]:
+        # Every path from the concept down to each of its descendants, excluding the concept itself
+        return self._paths(id, self.children, maximal=False, max_paths=max_paths, max_depth=max_depth)
+
+    def siblings(self, name: str) -> List[str]:
+        if name not in self.ids:
+            return []
+
+        id = self.ids[name]
+        siblings = set()
+        for parent in self.parents[id]:
+            siblings.update(self.children[parent])
+        siblings.discard(id)
+
+        return sorted(map(lambda id: self.names[id], siblings))
+
+    def is_a(self, name: str, ancestor: str) -> bool:
+        if name not in self.ids or ancestor not in self.ids:
+            return False
+
+        x = self.ids[name]
+        y = self.ids[ancestor]
+        if x == y:
+            return True
+
+        pre, post, extra = self.labels()
+        if pre[y] < pre[x] and post[x] < post[y]:
+            return True
+
+        return x in extra and y in extra[x]
+
+    def labels(self) -> Tuple[List[int], List[int], Dict[int, Set[int]]]:
+        if self._labels is None:
+            self._labels = self._label()
+        return self._labels
+
+    def ancestry_matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix = self._pack()
+        return self._matrix
+
+    def depths(self) -> np.ndarray:
+        if self._depths is None:
+            self._depths = np.array(self._statistics()[2], dtype=np.int64)
+        return self._depths
+
+    def depth(self, name: str) -> int:
+        return int(self.depths()[self.id(name)])
+
+    def statistics(self, name: str) -> dict:
+        id = self.id(name)
+        sizes, shallowest, deepest = self._statistics()
+
+        return {
+            "descendants": sizes[id],
+            "children": len(self.children[id]),
+            "leaf": len(self.children[id]) == 0,
+            "min_depth": shallowest[id],
+            "max_depth": deepest[id]
+        }
+
+    def relink(self, name: str, parents: List[str]):
+        # Bring one concept's parent edges (and root status) in line with its document, adding the concept if it is new
+        if name not in self.ids:
+            self._intern(name)
+            if self._stats is not None:
+                for stat in self._stats:
+                    stat.append(0)
+
+        id = self.ids[name]
+        targets = []
+        for parent in parents:
+            if parent in self.ids and self.ids[parent] not in targets:
+                targets.append(self.ids[parent])
+
+        for parent in list(filter(lambda parent: parent not in targets, self.parents[id])):
+            self._detach(id, parent)
+        for parent in list(filter(lambda parent: parent not in self.parents[id], targets)):
+            self._attach(id, parent)
+        self.parents[id] = targets
+
+        if len(parents) == 0 and id not in self.roots:
+            self._place(self.roots, id)
+        if len(parents) > 0 and id in self.roots:
+            self.roots.remove(id)
+
+        self._invalidate()
+
+    def remove(self, name: str):
+        if name not in self.ids:
+            return
+
+        id = self.ids[name]
+        for parent in list(self.parents[id]):
+            self._detach(id, parent)
+        for child in list(self.children[id]):
+            self._detach(child, id)
+
+        if id in self.roots:
+            self.roots.remove(id)
+
+        # Keep ids dense by moving the last concept into the freed slot
+        last = len(self.names) - 1
+        if id != last:
+            self.names[id] = self.names[last]
+            self.ids[self.names[id]] = id
+            self.parents[id] = self.parents[last]
+            self.children[id] = self.children[last]
+            self.order[id] = self.order[last]
+
+            for parent in self.parents[id]:
+                self.children[parent] = list(map(lambda c: id if c == last else c, self.children[parent]))
+            for child in self.children[id]:
+                self.parents[child] = list(map(lambda p: id if p == last else p, self.parents[child]))
+            self.roots = list(map(lambda r: id if r == last else r, self.roots))
+
+            if self._stats is not None:
+                for stat in self._stats:
+                    stat[id] = stat[last]
+
+        self.ids.pop(name)
+        self.names.pop()
+        self.parents.pop()
+        self.children.pop()
+        self.order.pop()
+        if self._stats is not None:
+            for stat in self._stats:
+                stat.pop()
+
+        self._invalidate()
+
+    def reduce_to_common_ancestors(self, names: Set[str]) -> Set[str]:
+        # Drop every concept that has one of its ancestors in the same set
+        known = list(filter(lambda name: name in self.ids, names))
+        if len(known) == 0:
+            return set(names)
+
+        ids = np.array(list(map(lambda name: self.ids[name], known)))
+        pruned = (self.ancestry_matrix()[ids] & self._bits(ids)).any(axis=1)
+
+        return set(names).difference(np.array(known)[pruned])
+
+    def common_subsumers(self, names: Set[str]) -> Set[str]:
+        return set(map(lambda id: self.names[id], self._unbits(self._subsumers(names))))
+
+    def most_specific_subsumers(self, names: Set[str]) -> Set[str]:
+        subsumers = self._subsumers(names)
+        ids = self._unbits(subsumers)
+        if len(ids) == 0:
+            return set()
+
+        # Anything that is itself an ancestor of another common subsumer is less specific
+        general = np.bitwise_or.reduce(self.ancestry_matrix()[ids], axis=0)
+        return set(map(lambda id: self.names[id], self._unbits(subsumers & ~general)))
+
+    def wu_palmer(self, x: np.ndarray, y: np.ndarray, chunk: int=None) -> np.ndarray:
+        # 2 * depth(lcs) / (depth(x) + depth(y)), counting roots as depth 1; the lcs is the deepest concept that is, or
+        # is an ancestor of, both x and y
+        depths = self.depths() + 1
+        scores = np.zeros(len(x), dtype=np.float64)
+
+        # Each pair unpacks to a row of len(self.names) cells; size the chunks so the unpacked rows stay small
+        if chunk is None:
+            chunk = max(1, UNPACKED_CELLS // max(len(self.names), 1))
+        depths = depths.astype(np.uint16 if len(self.names) < 2 ** 16 else np.int64)
+
+        for start in range(0, len(x), chunk):
+            a = x[start:start + chunk]
+            b = y[start:start + chunk]
+
+            common = np.unpackbits(self._inclusive(a) & self._inclusive(b), axis=1)[:, :len(self.names)].view(bool)
+            lcs = np.where(common, depths, 0).max(axis=1) if len(self.names) > 0 else np.zeros(len(a))
+
+            scores[start:start + chunk] = 2.0 * lcs / (depths[a].astype(np.float64) + depths[b])
+
+        return scores
+
+    def path_similarity(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        # 1 / (1 + the shortest path between x and y through a common subsumer), or 0 if they share none
+        distances = {}
+        scores = np.zeros(len(x), dtype=np.float64)
+
+        for i, (a, b) in enumerate(zip(x.tolist(), y.tolist())):
+            for id in (a, b):
+                if id not in distances:
+                    distances[id] = self._distances(id, self.parents)
+
+            lengths = list(map(lambda c: distances[a][c] + distances[b][c], distances[a].keys() & distances[b].keys()))
+            if len(lengths) > 0:
+                scores[i] = 1.0 / (1 + min(lengths))
+
+        return scores
+
+    def full_ancestry(self) -> Dict[str, Set[str]]:
+        closure = self._closure()
+        return {self.names[id]: set(map(lambda a: self.names[a], closure[id])) for id in range(len(self.names))}
+
+    def _intern(self, name: str) -> int:
+        if name in self.ids:
+            return self.ids[name]
+
+        id = len(self.names)
+        self.ids[name] = id
+        self.names.append(sys.intern(name))
+        self.parents.append([])
+        self.children.append([])
+        self.order.append(self._sequence)
+        self._sequence += 1
+
+        return id
+
+    def _link(self, child: str, parent: str):
+        # Dangling parents (names with no concept document) are not traversable, matching $graphLookup
+        if parent not in self.ids:
+            return
+
+        c = self.ids[child]
+        p = self.ids[parent]
+        if p in self.parents[c]:
+            return
+
+        self.parents[c].append(p)
+        self.children[p].append(c)
+
+    def _attach(self, child: int, parent: int):
+        stats = self._stats
+        if stats is not None and (self._cyclic or child == parent or parent in self._walk(child, self.children)):
+            stats = self._stats = None
+
+        if stats is not None:
+            # Every ancestor of the new parent gains whichever of the child's subtree it could not already reach
+            subtree = [child] + self._walk(child, self.children)
+            before = dict(map(lambda id: (id, set(self._walk(id, self.parents))), subtree))
+            for ancestor in [parent] + self._walk(parent, self.parents):
+                stats[0][ancestor] += len(list(filter(lambda id: ancestor not in before[id], subtree)))
+
+        self.parents[child].append(parent)
+        self._place(self.children[parent], child)
+
+        if stats is not None:
+            self._deepen(child)
+
+    def _place(self, ids: List[int], id: int):
+        ids.insert(bisect(list(map(lambda other: self.order[other], ids)), self.order[id]), id)
+
+    def _detach(self, child: int, parent: int):
+        self.parents[child].remove(parent)
+        self.children[parent].remove(child)
+
+        if self._cyclic:
+            self._stats = None
+
+        stats = self._stats
+        if stats is not None:
+            # Every ancestor of the old parent loses whichever of the child's subtree it can no longer reach
+            subtree = [child] + self._walk(child, self.children)
+            after = dict(map(lambda id: (id, set(self._walk(id, self.parents))), subtree))
+            for ancestor in [parent] + self._walk(parent, self.parents):
+                stats[0][ancestor] -= len(list(filter(lambda id: ancestor not in after[id], subtree)))
+
+            self._deepen(child)
+
+    def _deepen(self, start: int):
+        # Re-derive depths over the subtree below an edited concept, top-down, from parents outside it that did not move
+        sizes, shallowest, deepest = self._stats
+        subtree = [start] + self._walk(start, self.children)
+        inside = set(subtree)
+
+        pending = dict(map(lambda id: (id, len(list(filter(lambda parent: parent in inside, self.parents[id])))), subtree))
+        queue = deque([start])
+
+        while len(queue) > 0:
+            id = queue.popleft()
+            if len(self.parents[id]) == 0:
+                shallowest[id] = deepest[id] = 0
+            else:
+                shallowest[id] = min(map(lambda parent: shallowest[parent], self.parents[id])) + 1
+                deepest[id] = max(map(lambda parent: deepest[parent], self.parents[id])) + 1
+
+            for child in self.children[id]:
+                pending[child] -= 1
+                if pending[child] == 0:
+                    queue.append(child)
+
+    def _invalidate(self):
+        self._labels = None
+        self._matrix = None
+        self._depths = None
+
+    def _statistics(self) -> Tuple[List[int], List[int], List[int]]:
+        if self._stats is None:
+            self._stats = self._measure()
+        return self._stats
+
+    def _walk(self, start: int, edges: List[List[int]]) -> List[int]:
+        # The start concept is only reported if the hierarchy contains a cycle back through it
+        seen = set()
+        found = []
+        queue = deque(edges[start])
+
+        while len(queue) > 0:
+            id = queue.popleft()
+            if id in seen:
+                continue
+            seen.add(id)
+            found.append(id)
+            queue.extend(edges[id])
+
+        return found
+
+    def _distances(self, start: int, edges: List[List[int]]) -> Dict[int, int]:
+        # Breadth-first hop counts from the start concept (at 0) to everything reachable along the edges
+        distances = {start: 0}
+        queue = deque([start])
+
+        while len(queue) > 0:
+            id = queue.popleft()
+            for next in edges[id]:
+                if next not in distances:
+                    distances[next] = distances[id] + 1
+                    queue.append(next)
+
+        return distances
+
+    def _paths(self, start: int, edges: List[List[int]], maximal: bool, max_paths: int=None, max_depth: int=None) -> Iterator[List[int]]:
+        # Breadth-first over partial paths, so shorter paths come out first; each partial path is an (id, prefix, depth,
+        # length) cell pointing at the one it extends, so paths that branch from a common prefix share it rather than
+        # copying it
+        yielded = 0
+        queue = deque([(start, None, 0, None)])
+
+        # With a quota, queued cells are tallied by (length, depth), where length is that of the first path the cell is
+        # sure to end in (None if that is unknown); an extension is dropped once enough of them will be emitted before
+        # anything it could lead to, so the cap only ever prunes paths past the max_paths-th shortest
+        ahead = {}
+        nearest = None
+        if max_paths is not None and maximal:
+            shallowest = self._statistics()[1]
+            nearest = shallowest if not self._cyclic else None
+
+        while len(queue) > 0:
+            cell = queue.popleft()
+            id, _, depth, length = cell
+            if length is not None:
+                ahead[(length, depth)] -= 1
+
+            extensions = []
+            if max_depth is None or depth < max_depth:
+                extensions = list(filter(lambda next: not self._on_path(next, cell), edges[id]))
+
+            if depth > 0 and (not maximal or len(extensions) == 0):
+                yield self._unwind(cell)
+
+                yielded += 1
+                if max_paths is not None and yielded >= max_paths:
+                    return
+
+            for next in extensions:
+                length = None
+                if max_paths is not None:
+                    length = self._path_length(next, depth + 1, edges, maximal, max_depth, nearest)
+
+                    # Queued cells ending no later than anything this extension can reach are emitted before it
+                    earliest = length if length is not None else depth + 1
+                    emitted = sum(map(lambda item: item[1], filter(lambda item: item[0][0] < earliest or (item[0][0] == earliest and item[0][1] == depth + 1), ahead.items())))
+                    if yielded + emitted >= max_paths:
+                        continue
+
+                    if length is not None:
+                        ahead[(length, depth + 1)] = ahead.get((length, depth + 1), 0) + 1
+
+                queue.append((next, cell, depth + 1, length))
+
+    def _path_length(self, id: int, depth: int, edges: List[List[int]], maximal: bool, max_depth: Union[int, None], nearest: Union[List[int], None]) -> Union[int, None]:
+        # The length of the shortest path a cell at this depth is sure to end in: every cell is a path of its own unless
+        # only maximal paths count, in which case it runs on to the nearest root (or to max_depth)
+        if not maximal or len(edges[id]) == 0 or depth == max_depth:
+            return depth
+        if nearest is None:
+            return None
+
+        return depth + nearest[id] if max_depth is None else min(depth + nearest[id], max_depth)
+
+    def _on_path(self, id: int, cell: tuple) -> bool:
+        while cell is not None:
+            if cell[0] == id:
+                return True
+            cell = cell[1]
+        return False
+
+    def _unwind(self, cell: tuple) -> List[int]:
+        path = []
+        while cell[1] is not None:
+            path.append(cell[0])
+            cell = cell[1]
+        path.reverse()
+        return path
+
+    def _label(self) -> Tuple[List[int], List[int], Dict[int, Set[int]]]:
+        # Number a depth-first spanning forest in pre- and post-order; y is a tree ancestor of x iff its interval encloses x's
+        count = len(self.names)
+        pre = [0] * count
+        post = [0] * count
+        visited = [False] * count
+        clock = 0
+
+        for start in self.roots + list(range(count)):
+            if visited[start]:
+                continue
+
+            visited[start] = True
+            pre[start] = clock
+            clock += 1
+
+            stack = [(start, iter(self.children[start]))]
+            while len(stack) > 0:
+                id, children = stack[-1]
+                child = next(children, -1)
+
+                if child == -1:
+                    post[id] = clock
+                    clock += 1
+                    stack.pop()
+                elif not visited[child]:
+                    visited[child] = True
+                    pre[child] = clock
+                    clock += 1
+                    stack.append((child, iter(self.children[child])))
+
+        # Ancestors reached only through a second parent fall outside the tree intervals; record those explicitly
+        extra = {}
+        closure = self._closure()
+        for x in range(count):
+            outside = set(filter(lambda y: not (pre[y] < pre[x] and post[x] < post[y]), closure[x]))
+            if len(outside) > 0:
+                extra[x] = outside
+
+        return pre, post, extra
+
+    def _pack(self) -> np.ndarray:
+        # One row per concept with bit j set when concept j is an ancestor; rows are filled top-down from the parents' rows
+        count = len(self.names)
+        matrix = np.zeros((count, (count + 7) // 8), dtype=np.uint8)
+
+        pending = list(map(len, self.parents))
+        done = [False] * count
+        queue = deque(filter(lambda id: pending[id] == 0, range(count)))
+
+        while len(queue) > 0:
+            id = queue.popleft()
+            done[id] = True
+            for parent in self.parents[id]:
+                matrix[id] |= matrix[parent]
+                matrix[id, parent >> 3] |= np.uint8(0x80 >> (parent & 7))
+
+            for child in self.children[id]:
+                pending[child] -= 1
+                if pending[child] == 0:
+                    queue.append(child)
+
+        if not all(done):
+            closure = self._closure()
+            for id in filter(lambda id: not done[id], range(count)):
+                matrix[id] = self._bits(np.array(list(closure[id]), dtype=np.int64))
+
+        return matrix
+
+    def _measure(self) -> Tuple[List[int], List[int], List[int]]:
+        # Shortest and longest paths up to a root (roots are at depth 0), resolved top-down in topological order, and the
+        # number of distinct descendants of each concept, counted from the ancestor closure
+        count = len(self.names)
+        shallowest = [0] * count
+        deepest = [0] * count
+
+        pending = list(map(len, self.parents))
+        done = [False] * count
+        queue = deque(filter(lambda id: pending[id] == 0, range(count)))
+
+        while len(queue) > 0:
+            id = queue.popleft()
+            done[id] = True
+            if len(self.parents[id]) > 0:
+                shallowest[id] = min(map(lambda parent: shallowest[parent], self.parents[id])) + 1
+                deepest[id] = max(map(lambda parent: deepest[parent], self.parents[id])) + 1
+
+            for child in self.children[id]:
+                pending[child] -= 1
+                if pending[child] == 0:
+                    queue.append(child)
+
+        closure = self._closure()
+
+        # Concepts on or below a cycle have no longest path; bound them by the size of their ancestry instead
+        self._cyclic = not all(done)
+        for id in filter(lambda id: not done[id], range(count)):
+            shallowest[id] = deepest[id] = len(closure[id])
+
+        sizes = [0] * count
+        for id in range(count):
+            for ancestor in closure[id]:
+                if ancestor != id:
+                    sizes[ancestor] += 1
+
+        return sizes, shallowest, deepest
+
+    def _inclusive(self, ids: np.ndarray) -> np.ndarray:
+        # Ancestry rows with each concept's own bit set as well
+        rows = self.ancestry_matrix()[ids]
+        rows[np.arange(len(ids)), ids >> 3] |= (0x80 >> (ids & 7)).astype(np.uint8)
+        return rows
+
+    def _bits(self, ids: np.ndarray) -> np.ndarray:
+        row = np.zeros(len(self.names), dtype=bool)
+        row[ids] = True
+        return np.packbits(row)
+
+    def _unbits(self, row: np.ndarray) -> np.ndarray:
+        return np.nonzero(np.unpackbits(row)[:len(self.names)])[0]
+
+    def _subsumers(self, names: Set[str]) -> np.ndarray:
+        # The packed set of concepts that are, or are ancestors of, every named concept
+        names = list(names)
+        if len(names) == 0 or any(map(lambda name: name not in self.ids, names)):
+            return self._bits(np.array([], dtype=np.int64))
+
+        ids = np.array(list(map(lambda name: self.ids[name], names)))
+
+        return np.bitwise_and.reduce(self._inclusive(ids), axis=0)
+
+    def _closure(self) -> List[Set[int]]:
+        # Resolve ancestor sets top-down in topological order, so each concept unions its parents' sets once
+        closure = [None] * len(self.names)
+        pending = list(map(len, self.parents))
+        queue = deque(filter(lambda id: pending[id] == 0, range(len(self.names))))
+
+        while len(queue) > 0:
+            id = queue.popleft()
+            ancestry = set(self.parents[id])
+            for parent in self.parents[id]:
+                ancestry.update(closure[parent])
+            closure[id] = ancestry
+
+            for child in self.children[id]:
+                pending[child] -= 1
+                if pending[child] == 0:
+                    queue.append(child)
+
+        # Anything left over sits on or below a cycle; fall back to walking it directly
+        for id in range(len(self.names)):
+            if closure[id] is None:
+                closure[id] = set(self._walk(id, self.parents))
+
+        return closure
+
+
+_snapshots = {}
+
+
+def snapshot(collection) -> OntologyGraph:
+    key = (collection.database.name, collection.name)
+    version = ont.management.version(collection)
+
+    graph = _snapshots.get(key)
+    if graph is None or graph.version != version:
+        graph = OntologyGraph.load(collection, version=version)
+        _snapshots[key] = graph
+
+    return graph
+
+
+def peek(collection, version: str) -> Union[OntologyGraph, None]:
+    # The snapshot this process already holds, if it is at the given version; never loads one
+    graph = _snapshots.get((collection.database.name, collection.name))
+    if graph is None or graph.version != version:
+        return None
+
+    return graph
+
+
+def advance(collection, previous: str, current: str, concepts: Iterable[str]=()):
+    # Re-read the parents of just the edited concepts, and of anything naming them as a parent (which picks up dangling
+    # references to a newly added concept), and patch a copy of the snapshot that then replaces it, so that readers on
+    # other threads never see a half-edited hierarchy; edits that leave the hierarchy untouched simply move it forward
+    key = (collection.database.name, collection.name)
+
+    graph = _snapshots.get(key)
+    if graph is None:
+        return
+
+    if graph.version != previous:
+        _snapshots.pop(key, None)
+        return
+
+    concepts = list(concepts)
+    if len(concepts) > 0:
+        records = list(collection.find({"$or": [
+            {"name": {"$in": concepts}},
+            {"parents": {"$in": concepts}}
+        ]}, {"name": 1, "parents": 1, "_id": 0}))
+
+        names = list(map(lambda record: record["name"], records))
+        if len(names) != len(set(names)):
+            # Several documents share a name; leave those to a full rebuild
+            _snapshots.pop(key, None)
+            return
+
+        graph = graph.copy()
+        for name in filter(lambda name: name not in names, concepts):
+            graph.remove(name)
+        for record in records:
+            if record["name"] not in graph:
+                graph.relink(record["name"], [])
+        for record in records:
+            graph.relink(record["name"], record["parents"])
+
+    graph.version = current
+    _snapshots[key] = graph
@@ -1,11 +1,14 @@
+from bson.objectid import ObjectId
 from os.path import join
-from pymongo import MongoClient
-from typing import Set, Tuple
+from pymongo import ASCENDING, DESCENDING, MongoClient, ReturnDocument
+from typing import Dict, List, Set, Tuple, Union
 
 import boto3
+import ont.compiled
 import os
 import pymongo.errors
 import subprocess
+import threading
 import time
 
 ARCHIVE_PATH = "ARCHIVE_PATH"
@@ -15,6 +18,25 @@ ONTOLOGY_ACTIVE = "ONTOLOGY_ACTIVE"
 MONGO_HOST = os.environ["MONGO_HOST"] if "MONGO_HOST" in os.environ else "localhost"
 MONGO_PORT = int(os.environ["MONGO_PORT"]) if "MONGO_PORT" in os.environ else 27017
 DATABASE = "leia-ontology"
+VERSIONS = "versions"
+ACCESSES = "accesses"
+
+# How many of the most requested concepts to resolve ahead of time on startup or activation
+WARM_CONCEPTS = int(os.environ["WARM_CONCEPTS"]) if "WARM_CONCEPTS" in os.environ else 1000
+
+# (field, unique) pairs indexed on every ontology collection, and on every compiled_<collection>
+INDEXES = [
+    ("name", True),
+    ("parents", False),
+    ("localProperties.slot", False),
+    ("localProperties.filler", False),
+]
+COMPILED_INDEXES = [
+    ("IS-A.VALUE", False),
+]
+
+# IndexOptionsConflict and IndexKeySpecsConflict
+INDEX_CONFLICTS = (85, 86)
 
 
 def activate(collection):
@@ -44,7 +66,139 @@ def can_connect():
 def list_collections():
     client = getclient()
     db = client[DATABASE]
-    return sorted(filter(lambda c: not c.startswith("compiled_"), db.list_collection_names()))
+    return sorted(filter(lambda c: not c.startswith("compiled_") and c not in [VERSIONS, ACCESSES], db.list_collection_names()))
+
+
+# Versions this process has seen, by database and collection; only consulted while a watcher keeps them current
+_known = {}
+
+
+def version(collection) -> str:
+    # Every ontology collection carries an opaque version token; it is minted on first use and replaced on each edit
+    known = _known.get(collection.database.name, {}).get(collection.name)
+    if known is not None:
+        return known
+
+    versions = collection.database[VERSIONS]
+
+    record = versions.find_one({"_id": collection.name})
+    if record is None:
+        record = versions.find_one_and_update(
+            {"_id": collection.name},
+            {"$setOnInsert": {"version": str(ObjectId())}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    return record["version"]
+
+
+def bump_version(collection, change: dict=None) -> Tuple[Union[str, None], str]:
+    # Returns the token being replaced along with the new one, so callers can tell whether anyone else wrote in between;
+    # the replaced token and a description of the edit are stored alongside, so other processes can replay it
+    versions = collection.database[VERSIONS]
+    token = str(ObjectId())
+
+    while True:
+        record = versions.find_one({"_id": collection.name})
+        previous = record["version"] if record is not None else None
+
+        try:
+            result = versions.update_one(
+                {"_id": collection.name, "version": previous},
+                {"$set": {"version": token, "previous": previous, "change": change}},
+                upsert=record is None
+            )
+        except pymongo.errors.DuplicateKeyError:
+            # Someone else minted the first token in between
+            continue
+
+        if result.matched_count == 1 or result.upserted_id is not None:
+            break
+
+    if collection.name in _known.get(collection.database.name, {}):
+        remember(collection, token)
+
+    return previous, token
+
+
+def known(database: str) -> Dict[str, str]:
+    return dict(_known.get(database, {}))
+
+
+def remember(collection, version: str):
+    _known.setdefault(collection.database.name, {})[collection.name] = version
+
+
+def forget(collection):
+    _known.get(collection.database.name, {}).pop(collection.name, None)
+
+
+def forget_all(database: str):
+    _known.pop(database, None)
+
+
+def ensure_indexes(collection, indexes: List[Tuple[str, bool]]=None) -> List[str]:
+    if indexes is None:
+        indexes = COMPILED_INDEXES if collection.name.startswith("compiled_") else INDEXES
+
+    created = []
+    for field, unique in indexes:
+        try:
+            created.append(collection.create_index([(field, ASCENDING)], unique=unique))
+        except pymongo.errors.OperationFailure as e:
+            # An index on the same field already exists under another name or with other options; it serves lookups
+            if e.code in INDEX_CONFLICTS:
+                continue
+            if not unique:
+                raise
+
+            # Existing duplicates block a unique index; fall back to a plain one so lookups are still indexed
+            created.append(collection.create_index([(field, ASCENDING)]))
+
+    return created
+
+
+def ensure_all_indexes():
+    client = getclient()
+    db = client[DATABASE]
+
+    for c in list_collections():
+        ensure_indexes(db[c])
+        if "compiled_" + c in db.list_collection_names():
+            ensure_indexes(db["compiled_" + c])
+
+    db[ACCESSES].create_index([("collection", ASCENDING), ("name", ASCENDING)], unique=True)
+    db[ACCESSES].create_index([("collection", ASCENDING), ("count", DESCENDING)])
+
+
+def check_query_plans(name: str) -> List[str]:
+    # Explain the lookups the API issues and report any that the planner can only answer with a collection scan
+    client = getclient()
+    db = client[DATABASE]
+    collection = db[name]
+
+    probes = [
+        (collection, "name", {"name": "all"}),
+        (collection, "name $in", {"name": {"$in": ["all"]}}),
+        (collection, "parents", {"parents": "all"}),
+        (collection, "name or parents", {"$or": [{"name": {"$in": ["all"]}}, {"parents": {"$in": ["all"]}}]}),
+        (collection, "localProperties.slot", {"localProperties.slot": "is-a"}),
+        (collection, "localProperties.filler", {"localProperties.filler": "all"}),
+    ]
+
+    if "compiled_" + name in db.list_collection_names():
+        probes.append((db["compiled_" + name], "compiled IS-A", {"IS-A.VALUE": "ALL"}))
+
+    return list(map(lambda probe: probe[1], filter(lambda probe: _scans(probe[0].find(probe[2]).explain()["queryPlanner"]["winningPlan"]), probes)))
+
+
+def _scans(plan) -> bool:
+    if isinstance(plan, dict):
+        return plan.get("stage") == "COLLSCAN" or any(map(_scans, plan.values()))
+    if isinstance(plan, list):
+        return any(map(_scans, plan))
+    return False
 
 
 def rename_collection(original_name, new_name):
@@ -56,6 +210,9 @@ def rename_collection(original_name, new_name):
         raise Exception("Cannot rename to " + new_name + ", that ontology already exists.")
 
     collection.rename(new_name)
+    bump_version(db[original_name])
+    bump_version(db[new_name])
+    db[ACCESSES].update_many({"collection": original_name}, {"$set": {"collection": new_name}})
 
     if active() == original_name:
         activate(new_name)
@@ -66,6 +223,21 @@ def delete_collection(name):
     db = client[DATABASE]
     collection = db[name]
     collection.drop()
+    bump_version(collection)
+    db[ACCESSES].delete_many({"collection": name})
+
+
+def warm(name: str=None, limit: int=WARM_CONCEPTS) -> threading.Thread:
+    # Resolve the most requested frames in the background, so the first requests after a restart or an activation
+    # do not pay for them
+    from ont.api import OntologyAPI
+    collection = getclient()[DATABASE][name if name is not None else active()]
+
+    thread = threading.Thread(target=OntologyAPI(collection).warm, kwargs={"limit": limit})
+    thread.daemon = True
+    thread.start()
+
+    return thread
 
 
 def make_collection(name):
@@ -74,6 +246,7 @@ def make_collection(name):
     collection = db[name]
 
     activate(name)
+    ensure_indexes(collection)
 
     from ont.api import OntologyAPI
     api = OntologyAPI(collection)
@@ -97,6 +270,8 @@ def copy_collection(original_name, copied_name):
     }
 
     collection.aggregate([match, out])
+    ensure_indexes(db[copied_name])
+    bump_version(db[copied_name])
 
 
 def publish_archive(name):
@@ -142,6 +317,11 @@ def file_to_collection(path):
     cmd = "mongorestore --gzip --archive=" + path + " --db " + DATABASE + " --host " + MONGO_HOST + " --port " + str(MONGO_PORT)
     print (subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=True))
 
+    client = getclient()
+    db = client[DATABASE]
+    ensure_indexes(db[name])
+    bump_version(db[name])
+
 
 def list_local_archives():
     path = os.environ[ARCHIVE_PATH] if ARCHIVE_PATH in os.environ else None
@@ -197,7 +377,9 @@ def compile(collection: str, compile_inherited_values: bool=False, compile_domai
             raise PermissionError
 
     # Reset the compiled database
+    ont.compiled.invalidate(db[collection])
     compiled.drop()
+    ensure_indexes(compiled)
 
     # Connect to the API
     from ont.api import OntologyAPI
@@ -206,7 +388,8 @@ def compile(collection: str, compile_inherited_values: bool=False, compile_domai
     # List all of the concepts
     concepts = set(api.list())
 
-    # Prime the PROGRESS document
+    # Prime the PROGRESS document, noting which version is being compiled and how, so reads can tell when the compiled
+    # frames are interchangeable with live ones
     compiled.insert_one({
         "_id": "PROGRESS",
         "status": {
@@ -214,6 +397,12 @@ def compile(collection: str, compile_inherited_values: bool=False, compile_domai
             "total": len(concepts),
             "last": None
         },
+        "version": version(db[collection]),
+        "options": {
+            "inherited_values": compile_inherited_values,
+            "domains_and_ranges": compile_domains_and_ranges,
+            "inverses": compile_inverses
+        },
         "started": time.time(),
         "finished": None
     })
@@ -221,46 +410,26 @@ def compile(collection: str, compile_inherited_values: bool=False, compile_domai
     # Calculate the relations and inverses
     relations = api.relations_to_inverses()
 
-    # Calculate the full ancestry and define a helper method
-    ancestry = api.full_ancestry()
+    # Snapshot the hierarchy; its packed ancestry matrix backs the subsumption checks below
+    graph = api.graph
 
-    def ancestors_or_default(c):
-        try:
-            return ancestry[c]
-        except:
-            return set()
+    def descends_from(c: str, ancestor: str) -> bool:
+        return c != ancestor and graph.is_a(c, ancestor)
 
     # Define a helper method for reducing any set of concepts to their common set of ancestors
     def reduce_to_common_ancestors(concepts: Set[str]) -> Set[str]:
-        to_prune = set()
-
-        for c in concepts:
-            # If any of the filler's ancestors are in the list of concepts it can be pruned
-            ancestors = ancestors_or_default(c)
-            if len(ancestors.intersection(concepts)) > 0:
-                to_prune.add(c)
-
-        return concepts.difference(to_prune)
+        return graph.reduce_to_common_ancestors(concepts)
 
     # Define a helper method for determining the domains and ranges of a given property
     def get_domain_range(property: str) -> Tuple[Set[str], Set[str]]:
-        coll = api.collection
-
-        pipeline = [
-            {"$match": {"localProperties.slot": property}},
-            {"$project": {"localProperties": 1, "_id": "$name"}},
-            {"$unwind": "$localProperties"},
-            {"$match": {"localProperties.slot": property}},
-            {"$project": {"range": "$localProperties.filler"}}
-        ]
-        results = list(coll.aggregate(pipeline))
+        results = api.domains_and_ranges(property)
 
-        domains = set(map(lambda r: r["_id"], results))
-        ranges = set(map(lambda r: r["range"], results))
+        domains = set(results.keys())
+        ranges = set(filler for fillers in results.values() for filler in fillers)
 
         domains = reduce_to_common_ancestors(domains)
 
-        if "relation" in ancestors_or_default(property):
+        if descends_from(property, "relation"):
             ranges = reduce_to_common_ancestors(ranges)
 
         return domains, ranges
@@ -317,13 +486,15 @@ def compile(collection: str, compile_inherited_values: bool=False, compile_domai
     # Initialize the state
     count = 0
     properties = []
+    lowercase = True
 
     # Compile each concept
     local = not compile_inherited_values
     for c in concepts:
-        frame = api.get(c, local=local)[0]
+        # Resolve without counting an access, so that compiling does not make the whole ontology look hot
+        frame = api._get([c.lower()], local=local)[0]
 
-        if compile_domains_and_ranges and "property" in ancestors_or_default(c):
+        if compile_domains_and_ranges and descends_from(c, "property"):
             domains, ranges = get_domain_range(c)
 
             declare_slot_facet(frame[c], "domain", "sem")
@@ -333,9 +504,10 @@ def compile(collection: str, compile_inherited_values: bool=False, compile_domai
             frame[c]["range"]["sem"] = ranges
 
         # Convert frame names, slots, facets, and relation fillers to upper case
+        lowercase = lowercase and ont.compiled.lowercase(c, frame[c])
         frame = format_frame_for_insert(frame)
 
-        if compile_inverses and "relation" in ancestors_or_default(c):
+        if compile_inverses and descends_from(c, "relation"):
             properties.append(frame)
 
         count += 1
@@ -376,8 +548,9 @@ def compile(collection: str, compile_inherited_values: bool=False, compile_domai
     # Mark the task as finished
     compiled.update_one(
         {"_id": "PROGRESS"},
-        {"$set": {"finished": time.time()}}
+        {"$set": {"finished": time.time(), "lowercase": lowercase}}
     )
+    ont.compiled.invalidate(db[collection])
 
 def export(collection: str, format: str):
     path = os.environ[EXPORT_PATH] if EXPORT_PATH in os.environ else None
@@ -1,11 +1,15 @@
+from collections import OrderedDict
+from ont.bloom import BloomFilter
+
 import json
 import os
 import sys
+import time
 
 
 class Ontology():
 
-    def __init__(self, host=None, port=None, cookie=None):
+    def __init__(self, host=None, port=None, cookie=None, cache_size=None, cache_ttl=60.0):
         self.host = host
         if self.host is None:
             self.host = os.environ["ONTOLOGY_HOST"] if "ONTOLOGY_HOST" in os.environ else "localhost"
@@ -16,8 +20,20 @@ class Ontology():
 
         self.cookie = cookie
 
+        # Opt-in: with a cache_size, up to that many GET responses are reused for cache_ttl seconds, then revalidated
+        # against the service's ETag; any edit made through this client empties the cache
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.__cache = OrderedDict()
+        self.__hits = 0
+        self.__misses = 0
+        self.__revalidations = 0
+
+        # Loaded on request, with the ETag and expiry it was fetched under; rules out unknown names without a round-trip
+        self.__filter = None
+
     def __contains__(self, item):
-        return len(self.get([item])) > 0
+        return self.exists(item)
 
     def __getitem__(self, item):
         results = self.get([item])
@@ -32,6 +48,10 @@ class Ontology():
         if data is None:
             data = {}
 
+        if path.startswith("/ontology/edit/"):
+            self.clear_cache()
+            self.__filter = None
+
         def post_python2(ontology, url, data):
             import urllib2
             data = json.dumps(data)
@@ -64,7 +84,7 @@ class Ontology():
         else:
             return post_python3(self, url, data)
 
-    def __rget(self, path, params=None):
+    def __url(self, path, params):
         url = "http://" + self.host + ":" + str(self.port) + path
 
         def __format_param(key):
@@ -77,31 +97,87 @@ class Ontology():
         if len(params) > 0:
             url = url + "?" + "&".join(map(__format_param, params.keys()))
 
-        def get_python2(ontology, url):
+        return url
+
+    def __rget(self, path, params=None):
+        url = self.__url(path, params)
+
+        if not self.cache_size:
+            return self.__fetch(url, None)[0]
+
+        now = time.time()
+        cached = self.__cache.get(url)
+        if cached is not None and cached[2] > now:
+            self.__hits += 1
+            self.__cache.move_to_end(url)
+            return cached[0]
+
+        contents, etag = self.__fetch(url, cached[1] if cached is not None else None)
+        if contents is None:
+            self.__revalidations += 1
+            contents = cached[0]
+        else:
+            self.__misses += 1
+
+        self.__cache[url] = (contents, etag, now + self.cache_ttl)
+        self.__cache.move_to_end(url)
+        while len(self.__cache) > self.cache_size:
+            self.__cache.popitem(last=False)
+
+        return contents
+
+    def __fetch(self, url, etag):
+        # A GET, conditional on the ETag if one is given; returns (None, etag) when the service answers 304
+        def get_python2(ontology, url, etag):
             import urllib2
             request = urllib2.Request(url)
             if self.cookie is not None:
                 request.add_header("cookie", self.cookie)
-            response = urllib2.urlopen(request)
+            if etag is not None:
+                request.add_header("If-None-Match", etag)
+            try:
+                response = urllib2.urlopen(request)
+            except urllib2.HTTPError as e:
+                if e.code == 304:
+                    return None, etag
+                raise
             ontology.cookie = response.headers.get("Set-Cookie")
             contents = response.read()
-            return contents
+            return contents, response.headers.get("ETag")
 
-        def get_python3(ontology, url):
+        def get_python3(ontology, url, etag):
+            import urllib.error
             import urllib.request
             request = urllib.request.Request(url)
             if self.cookie is not None:
                 request.add_header("cookie", self.cookie)
+            if etag is not None:
+                request.add_header("If-None-Match", etag)
             contents = None
-            with urllib.request.urlopen(request) as response:
-                contents = response.read()
-                self.cookie = response.headers.get("Set-Cookie")
-            return contents
-
-        if sys.version_info[0] < 3:
-            return get_python2(self, url)
-        else:
-            return get_python3(self, url)
+            try:
+                with urllib.request.urlopen(request) as response:
+                    contents = response.read()
+                    self.cookie = response.headers.get("Set-Cookie")
+                    etag = response.headers.get("ETag")
+            except urllib.error.HTTPError as e:
+                if e.code == 304:
+                    return None, etag
+                raise
+            return contents, etag
+
+        fetch = get_python2 if sys.version_info[0] < 3 else get_python3
+        return fetch(self, url, etag)
+
+    def cache_metrics(self):
+        return {
+            "entries": len(self.__cache),
+            "hits": self.__hits,
+            "misses": self.__misses,
+            "revalidations": self.__revalidations
+        }
+
+    def clear_cache(self):
+        self.__cache.clear()
 
     def __get_single(self, concept, concepts):
         for c in concepts:
@@ -117,30 +193,103 @@ class Ontology():
         results = self.__rget("/ontology/api/get", params={"concept": concepts, "local": local})
         return json.loads(results)
 
-    def search(self, name_like: str = None):
-        results = self.__rget("/ontology/api/search", params={"name_like": name_like})
+    def search(self, name_like: str = None, match: str = "substring", limit: int = None):
+        params = {"name_like": name_like, "match": match}
+        if limit is not None:
+            params["limit"] = limit
+
+        results = self.__rget("/ontology/api/search", params=params)
+        return json.loads(results)
+
+    def fuzzy_search(self, name: str, max_distance: int = 2, k: int = 10):
+        results = self.__rget("/ontology/api/fuzzy", params={"name": name, "max_distance": max_distance, "k": k})
+        return json.loads(results)
+
+    def search_definitions(self, query: str, limit: int = 10):
+        results = self.__rget("/ontology/api/search_definitions", params={"query": query, "limit": limit})
         return json.loads(results)
 
     def roots(self):
         results = self.__rget("/ontology/api/roots", params={})
         return json.loads(results)
 
-    def ancestors(self, concept, immediate=False, details=False, paths=False):
-        results = self.__rget("/ontology/api/ancestors", params={"concept": concept, "immediate": immediate, "details": details, "paths": paths})
+    def ancestors(self, concept, immediate=False, details=False, paths=False, max_paths=None, max_depth=None):
+        params = {"concept": concept, "immediate": immediate, "details": details, "paths": paths}
+        params.update(self.__path_limits(max_paths, max_depth))
+
+        results = self.__rget("/ontology/api/ancestors", params=params)
         return json.loads(results)
 
-    def descendants(self, concept, immediate=False, details=False, paths=False):
-        results = self.__rget("/ontology/api/descendants", params={"concept": concept, "immediate": immediate, "details": details, "paths": paths})
+    def descendants(self, concept, immediate=False, details=False, paths=False, max_paths=None, max_depth=None):
+        params = {"concept": concept, "immediate": immediate, "details": details, "paths": paths}
+        params.update(self.__path_limits(max_paths, max_depth))
+
+        results = self.__rget("/ontology/api/descendants", params=params)
+        return json.loads(results)
+
+    def __path_limits(self, max_paths, max_depth):
+        limits = {}
+        if max_paths is not None:
+            limits["max_paths"] = max_paths
+        if max_depth is not None:
+            limits["max_depth"] = max_depth
+        return limits
+
+    def is_a(self, concept, ancestor):
+        results = self.__rget("/ontology/api/is_a", params={"concept": concept, "ancestor": ancestor})
+        return json.loads(results)[0]
+
+    def common_ancestors(self, concepts, most_specific=True):
+        if isinstance(concepts, str):
+            concepts = [concepts]
+
+        results = self.__rget("/ontology/api/common_ancestors", params={"concept": concepts, "most_specific": most_specific})
+        return json.loads(results)
+
+    def similarity(self, pairs, metric="wu-palmer"):
+        response = self.__rpost("/ontology/api/similarity?metric=" + metric, data=list(map(list, pairs)))
+        return json.loads(response.read())
+
+    def statistics(self, concepts):
+        if type(concepts) is not list:
+            concepts = [concepts]
+
+        results = self.__rget("/ontology/api/stats", params={"concept": concepts})
         return json.loads(results)
 
     def is_parent(self, concept, parent):
-        results = self.ancestors(concept, immediate=False, details=False)
-        return parent in results
+        return concept.lower() != parent.lower() and self.is_a(concept, parent)
 
     def exists(self, concept):
-        concepts = map(lambda result: result.keys(), self.get(concept))
-        concepts = [item for sublist in concepts for item in sublist]   # Flattens the lists / reduces
-        return concept in concepts
+        existence_filter = self.__existence_filter()
+        if existence_filter is not None and concept.lower() not in existence_filter:
+            return False
+
+        results = self.__rget("/ontology/api/exists", params={"concept": concept})
+        return json.loads(results)[0]
+
+    def load_existence_filter(self, error_rate=0.01):
+        # Trusted for cache_ttl seconds, then revalidated against the service's ETag, so that names added by other
+        # clients are never ruled out for longer than that
+        url = self.__url("/ontology/api/exists", {"filter": True, "error_rate": error_rate})
+        contents, etag = self.__fetch(url, None)
+        self.__filter = (BloomFilter.from_json(json.loads(contents)), url, etag, time.time() + (self.cache_ttl or 0))
+
+    def __existence_filter(self):
+        if self.__filter is None:
+            return None
+
+        existence_filter, url, etag, expires = self.__filter
+        now = time.time()
+        if expires > now:
+            return existence_filter
+
+        contents, etag = self.__fetch(url, etag)
+        if contents is not None:
+            existence_filter = BloomFilter.from_json(json.loads(contents))
+
+        self.__filter = (existence_filter, url, etag, now + (self.cache_ttl or 0))
+        return existence_filter
 
     def get_subtree(self, concept):
         results = self.ancestors(concept, immediate=False, details=False)
@@ -168,6 +317,10 @@ class Ontology():
 
         return []
 
+    def check_constraints(self, items):
+        response = self.__rpost("/ontology/api/check_constraints", data=list(map(list, items)))
+        return json.loads(response.read())
+
     def get_inverses(self, property):
         results = self.get(property)
         property = self.__get_single(property, results)
@@ -189,6 +342,13 @@ class Ontology():
         results = self.__rget("/ontology/api/domains_and_ranges", params={"property": property})
         return json.loads(results)
 
+    def batch(self, operations):
+        # Operations are (name, arguments) pairs, named after the OntologyAPI methods, e.g. ("ancestors", {"concept": "x"})
+        data = list(map(lambda operation: {"op": operation[0], "args": operation[1] if len(operation) > 1 else {}}, operations))
+
+        response = self.__rpost("/ontology/api/batch", data=data)
+        return json.loads(response.read())
+
     def update_definition(self, concept: str, definition: str):
         self.__rpost("/ontology/edit/define/" + concept, data={"definition": definition})
 
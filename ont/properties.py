@@ -0,0 +1,155 @@
+from typing import Dict, Iterable, List, Tuple, Union
+
+import ont.management
+
+
+class PropertyIndex(object):
+
+    def __init__(self, version: str=None):
+        self.version = version
+
+        # Each concept's local (slot, facet, filler) triples in document order, with inverted indexes from a slot to the
+        # concepts that define it and from a (string) filler to the concepts that use it; the inner dicts are ordered sets
+        self.local = {}
+        self.order = {}
+        self.slots = {}
+        self.fillers = {}
+
+        self._sequence = 0
+
+    @classmethod
+    def load(cls, collection, version: str=None) -> "PropertyIndex":
+        index = cls(version=version)
+        for name, properties in _grouped(collection.find({}, {"name": 1, "localProperties": 1, "_id": 0})).items():
+            index.add(name, properties)
+
+        return index
+
+    def copy(self) -> "PropertyIndex":
+        # An independent copy to edit while other threads keep reading this one; the triple lists are only ever
+        # replaced, never changed, so they can be shared
+        index = PropertyIndex(version=self.version)
+
+        index.local = dict(self.local)
+        index.order = dict(self.order)
+        index.slots = dict(map(lambda item: (item[0], dict(item[1])), self.slots.items()))
+        index.fillers = dict(map(lambda item: (item[0], dict(item[1])), self.fillers.items()))
+
+        index._sequence = self._sequence
+
+        return index
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.local
+
+    def add(self, name: str, properties: List[dict]):
+        self.remove(name, keep_order=True)
+
+        if name not in self.order:
+            self.order[name] = self._sequence
+            self._sequence += 1
+
+        self.local[name] = list(map(lambda property: (property["slot"], property["facet"], property["filler"]), properties))
+        for slot, facet, filler in self.local[name]:
+            self.slots.setdefault(slot, {})[name] = None
+            if isinstance(filler, str):
+                self.fillers.setdefault(filler, {})[name] = None
+
+    def remove(self, name: str, keep_order: bool=False):
+        if name not in self.local:
+            return
+
+        for slot, facet, filler in self.local.pop(name):
+            self._discard(self.slots, slot, name)
+            if isinstance(filler, str):
+                self._discard(self.fillers, filler, name)
+
+        if not keep_order:
+            self.order.pop(name, None)
+
+    def domains_and_ranges(self, slot: str) -> Dict[str, list]:
+        results = {}
+        for domain in self._ordered(self.slots.get(slot, {})):
+            results[domain] = list(map(lambda triple: triple[2], filter(lambda triple: triple[0] == slot, self.local[domain])))
+
+        return results
+
+    def usages(self, fillers: Iterable[str]) -> List[Tuple[str, str, str, str]]:
+        # Every (concept, slot, facet, filler) whose filler is exactly one of the given names
+        fillers = set(fillers)
+
+        concepts = set()
+        for filler in fillers:
+            concepts.update(self.fillers.get(filler, {}).keys())
+
+        results = []
+        for concept in self._ordered(concepts):
+            for slot, facet, filler in self.local[concept]:
+                if isinstance(filler, str) and filler in fillers:
+                    results.append((concept, slot, facet, filler))
+
+        return results
+
+    def _ordered(self, names: Iterable[str]) -> List[str]:
+        return sorted(names, key=lambda name: self.order[name])
+
+    def _discard(self, index: dict, key: str, name: str):
+        names = index.get(key)
+        if names is None:
+            return
+
+        names.pop(name, None)
+        if len(names) == 0:
+            index.pop(key)
+
+
+def _grouped(records: Iterable[dict]) -> Dict[str, List[dict]]:
+    # Several documents may share a name; their local properties are indexed together
+    grouped = {}
+    for record in records:
+        grouped.setdefault(record["name"], []).extend(record.get("localProperties", []))
+
+    return grouped
+
+
+_indexes = {}
+
+
+def index(collection) -> PropertyIndex:
+    key = (collection.database.name, collection.name)
+    version = ont.management.version(collection)
+
+    properties = _indexes.get(key)
+    if properties is None or properties.version != version:
+        properties = PropertyIndex.load(collection, version=version)
+        _indexes[key] = properties
+
+    return properties
+
+
+def advance(collection, previous: str, current: str, concepts: Union[Iterable[str], None]):
+    # Re-read the local properties of just the edited concepts (dropping any that no longer exist) into a copy of the
+    # index that then replaces it, so readers on other threads never see a half-applied edit; None means anything
+    key = (collection.database.name, collection.name)
+
+    properties = _indexes.get(key)
+    if properties is None:
+        return
+
+    if properties.version != previous or concepts is None:
+        _indexes.pop(key, None)
+        return
+
+    concepts = set(concepts)
+    if len(concepts) > 0:
+        found = _grouped(collection.find({"name": {"$in": list(concepts)}}, {"name": 1, "localProperties": 1, "_id": 0}))
+
+        properties = properties.copy()
+        for name, local in found.items():
+            properties.add(name, local)
+
+        for name in concepts.difference(found.keys()):
+            properties.remove(name)
+
+    properties.version = current
+    _indexes[key] = properties
@@ -0,0 +1,371 @@
+from bisect import bisect_left, insort
+from ont.bloom import BloomFilter
+from typing import Dict, Iterable, List, Tuple, Union
+
+import math
+import ont.management
+import re
+
+
+EXACT = "exact"
+PREFIX = "prefix"
+SUBSTRING = "substring"
+
+TOKEN = re.compile(r"[a-z0-9]+")
+
+
+class NameIndex(object):
+
+    def __init__(self, names: Iterable[str]=None, version: str=None):
+        self.version = version
+
+        # A sorted list of names answers prefix queries by bisection; trigram postings narrow down substring queries
+        self.names = []
+        self.trigrams = {}
+
+        # A Bloom filter over the names, built on request for shipping to clients
+        self._bloom = None
+        self._error_rate = None
+
+        for name in set(names if names is not None else []):
+            self.add(name)
+
+    @classmethod
+    def load(cls, collection, version: str=None) -> "NameIndex":
+        return cls(map(lambda record: record["name"], collection.find({}, {"name": 1, "_id": 0})), version=version)
+
+    def copy(self) -> "NameIndex":
+        # An independent copy to edit while other threads keep reading this one
+        index = NameIndex(version=self.version)
+
+        index.names = list(self.names)
+        index.trigrams = dict(map(lambda item: (item[0], set(item[1])), self.trigrams.items()))
+
+        if self._bloom is not None:
+            index._bloom = BloomFilter(self._bloom.size, self._bloom.hashes, bits=bytearray(self._bloom.bits), count=self._bloom.count)
+            index._error_rate = self._error_rate
+
+        return index
+
+    def __contains__(self, name: str) -> bool:
+        i = bisect_left(self.names, name)
+        return i < len(self.names) and self.names[i] == name
+
+    def add(self, name: str):
+        if name in self:
+            return
+
+        insort(self.names, name)
+        for trigram in self._trigrams(name, padded=True):
+            self.trigrams.setdefault(trigram, set()).add(name)
+
+        if self._bloom is not None:
+            self._bloom.add(name)
+
+    def remove(self, name: str):
+        if name not in self:
+            return
+
+        self.names.pop(bisect_left(self.names, name))
+        for trigram in self._trigrams(name, padded=True):
+            postings = self.trigrams.get(trigram)
+            if postings is not None:
+                postings.discard(name)
+                if len(postings) == 0:
+                    self.trigrams.pop(trigram)
+
+        # Bloom filters cannot forget a name
+        self._bloom = None
+
+    def bloom(self, error_rate: float=0.01) -> BloomFilter:
+        if self._bloom is None or self._error_rate != error_rate:
+            self._bloom = BloomFilter.of(self.names, error_rate=error_rate)
+            self._error_rate = error_rate
+
+        return self._bloom
+
+    def search(self, query: str, match: str=SUBSTRING, limit: int=None) -> List[str]:
+        if match == EXACT:
+            results = [query] if query in self else []
+        elif match == PREFIX:
+            results = self._prefixed(query)
+        elif match == SUBSTRING:
+            results = self._containing(query)
+        else:
+            raise Exception("Unknown match type %s." % match)
+
+        results = sorted(results, key=lambda name: (self._rank(name, query), len(name), name))
+
+        if limit is not None:
+            results = results[:limit]
+
+        return results
+
+    def fuzzy(self, query: str, max_distance: int=2, k: int=None) -> List[Tuple[str, int]]:
+        # Each edit destroys at most three of the query's trigrams, so a match within max_distance shares the rest
+        trigrams = self._trigrams(query, padded=True)
+        required = len(trigrams) - 3 * max_distance
+
+        if required > 0:
+            counts = {}
+            for trigram in trigrams:
+                for name in self.trigrams.get(trigram, ()):
+                    counts[name] = counts.get(name, 0) + 1
+            candidates = filter(lambda name: counts[name] >= required, counts.keys())
+        else:
+            candidates = self.names
+
+        found = []
+        for name in candidates:
+            if abs(len(name) - len(query)) > max_distance:
+                continue
+
+            d = distance(query, name, limit=max_distance)
+            if d <= max_distance:
+                found.append((name, d))
+
+        found.sort(key=lambda match: (match[1], self._rank(match[0], query), len(match[0]), match[0]))
+
+        if k is not None:
+            found = found[:k]
+
+        return found
+
+    def _prefixed(self, query: str) -> List[str]:
+        results = []
+        i = bisect_left(self.names, query)
+        while i < len(self.names) and self.names[i].startswith(query):
+            results.append(self.names[i])
+            i += 1
+
+        return results
+
+    def _containing(self, query: str) -> List[str]:
+        trigrams = self._trigrams(query)
+        if len(trigrams) == 0:
+            return list(filter(lambda name: query in name, self.names))
+
+        # Intersect from the rarest trigram up, then confirm the candidates actually contain the query
+        postings = sorted(map(lambda trigram: self.trigrams.get(trigram, set()), trigrams), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if len(candidates) == 0:
+                break
+
+        return list(filter(lambda name: query in name, candidates))
+
+    def _rank(self, name: str, query: str) -> int:
+        # Exact matches first, then prefixes, then matches starting a hyphenated word, then anything else
+        if name == query:
+            return 0
+        if name.startswith(query):
+            return 1
+        if ("-" + query) in name:
+            return 2
+        return 3
+
+    def _trigrams(self, name: str, padded: bool=False) -> set:
+        # Names are indexed with boundary markers; the unpadded trigrams of a substring query are a subset of those
+        if padded:
+            name = "^" + name + "$"
+        return set(name[i:i + 3] for i in range(len(name) - 2))
+
+
+class TextIndex(object):
+
+    # Okapi BM25 term frequency saturation and length normalization
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, texts: Dict[str, str]=None, version: str=None):
+        self.version = version
+
+        # Postings map each term to {concept: term frequency}; lengths hold the token count of each concept's text and
+        # terms its distinct tokens, so a concept can be taken back out of the postings
+        self.postings = {}
+        self.lengths = {}
+        self.terms = {}
+        self.total = 0
+
+        for name, text in (texts if texts is not None else {}).items():
+            self.add(name, text)
+
+    @classmethod
+    def load(cls, collection, version: str=None) -> "TextIndex":
+        records = collection.find({}, {"name": 1, "definition": 1, "notes": 1, "_id": 0})
+        return cls(dict(map(lambda record: (record["name"], cls.text(record)), records)), version=version)
+
+    @staticmethod
+    def text(record: dict) -> str:
+        return " ".join(filter(None, [record.get("definition"), record.get("notes")]))
+
+    def copy(self) -> "TextIndex":
+        # An independent copy to edit while other threads keep reading this one; each concept's term set is only ever
+        # replaced, never changed, so those can be shared
+        index = TextIndex(version=self.version)
+
+        index.postings = dict(map(lambda item: (item[0], dict(item[1])), self.postings.items()))
+        index.lengths = dict(self.lengths)
+        index.terms = dict(self.terms)
+        index.total = self.total
+
+        return index
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.lengths
+
+    def add(self, name: str, text: str):
+        self.remove(name)
+
+        tokens = self._tokens(text)
+        self.lengths[name] = len(tokens)
+        self.terms[name] = set(tokens)
+        self.total += len(tokens)
+
+        for token in tokens:
+            postings = self.postings.setdefault(token, {})
+            postings[name] = postings.get(name, 0) + 1
+
+    def remove(self, name: str):
+        if name not in self.lengths:
+            return
+
+        self.total -= self.lengths.pop(name)
+
+        for token in self.terms.pop(name):
+            postings = self.postings[token]
+            postings.pop(name, None)
+            if len(postings) == 0:
+                self.postings.pop(token)
+
+    def search(self, query: str, limit: int=None) -> List[Tuple[str, float]]:
+        if len(self.lengths) == 0:
+            return []
+
+        count = len(self.lengths)
+        average = self.total / count if self.total > 0 else 1.0
+
+        scores = {}
+        for token in set(self._tokens(query)):
+            postings = self.postings.get(token)
+            if postings is None:
+                continue
+
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for name, frequency in postings.items():
+                norm = self.K1 * (1 - self.B + self.B * self.lengths[name] / average)
+                scores[name] = scores.get(name, 0.0) + idf * frequency * (self.K1 + 1) / (frequency + norm)
+
+        results = sorted(scores.items(), key=lambda score: (-score[1], score[0]))
+
+        if limit is not None:
+            results = results[:limit]
+
+        return results
+
+    def _tokens(self, text: str) -> List[str]:
+        return TOKEN.findall((text or "").lower())
+
+
+def distance(a: str, b: str, limit: int=None) -> int:
+    # Levenshtein distance, one row at a time; with a limit, only a band of width 2 * limit + 1 around the diagonal is
+    # computed and anything over the limit is reported as limit + 1
+    if len(a) < len(b):
+        a, b = b, a
+
+    if limit is None:
+        limit = len(a)
+    if len(a) - len(b) > limit:
+        return limit + 1
+
+    previous = list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        current = [limit + 1] * (len(b) + 1)
+        if i <= limit:
+            current[0] = i
+
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (x != b[j - 1]))
+
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+
+    return min(previous[-1], limit + 1)
+
+
+_indexes = {}
+_texts = {}
+
+
+def index(collection) -> NameIndex:
+    key = (collection.database.name, collection.name)
+    version = ont.management.version(collection)
+
+    names = _indexes.get(key)
+    if names is None or names.version != version:
+        names = NameIndex.load(collection, version=version)
+        _indexes[key] = names
+
+    return names
+
+
+def peek(collection, version: str) -> Union[NameIndex, None]:
+    # The name index this process already holds, if it is at the given version; never loads one
+    names = _indexes.get((collection.database.name, collection.name))
+    if names is None or names.version != version:
+        return None
+
+    return names
+
+
+def text_index(collection) -> TextIndex:
+    key = (collection.database.name, collection.name)
+    version = ont.management.version(collection)
+
+    texts = _texts.get(key)
+    if texts is None or texts.version != version:
+        texts = TextIndex.load(collection, version=version)
+        _texts[key] = texts
+
+    return texts
+
+
+def advance(collection, previous: str, current: str, added: Iterable[str]=(), removed: Iterable[str]=(), defined: Iterable[str]=()):
+    # Names only change through add_concept and remove_concept, and text through those and update_definition; apply
+    # them to copies of the indexes that then replace them, so readers on other threads never see a half-applied edit
+    key = (collection.database.name, collection.name)
+    added = list(added)
+    removed = list(removed)
+
+    names = _indexes.get(key)
+    if names is not None and names.version != previous:
+        _indexes.pop(key, None)
+    elif names is not None:
+        if len(added) > 0 or len(removed) > 0:
+            names = names.copy()
+            for name in added:
+                names.add(name)
+            for name in removed:
+                names.remove(name)
+
+        names.version = current
+        _indexes[key] = names
+
+    texts = _texts.get(key)
+    if texts is not None and texts.version != previous:
+        _texts.pop(key, None)
+    elif texts is not None:
+        changed = added + list(defined)
+        if len(removed) > 0 or len(changed) > 0:
+            texts = texts.copy()
+            for name in removed:
+                texts.remove(name)
+
+            if len(changed) > 0:
+                for record in collection.find({"name": {"$in": changed}}, {"name": 1, "definition": 1, "notes": 1, "_id": 0}):
+                    texts.add(record["name"], TextIndex.text(record))
+
+        texts.version = current
+        _texts[key] = texts
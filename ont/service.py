@@ -1,11 +1,17 @@
-from flask import Flask, jsonify, make_response, redirect, request, abort, render_template, session
+from flask import Flask, Response, g, jsonify, make_response, redirect, request, abort, render_template, session
 from flask_cors import CORS
 from flask_socketio import SocketIO
 from itertools import groupby
 from ont.api import OntologyAPI
 
+import hashlib
 import json
+import ont.api
+import ont.cache
+import ont.graph
 import ont.management
+import ont.search
+import ont.sync
 import os
 
 
@@ -17,6 +23,9 @@ app.secret_key = "leia-ontology-service"
 
 EDITING_ENABLED = os.environ["EDITING_ENABLED"].lower() == "true" if "EDITING_ENABLED" in os.environ else True
 
+# Sent with every /ontology/api GET; the default lets clients keep responses but makes them revalidate with the ETag
+API_CACHE_CONTROL = os.environ["API_CACHE_CONTROL"] if "API_CACHE_CONTROL" in os.environ else "no-cache"
+
 
 def env_payload():
     if "recent-reports" not in session:
@@ -33,6 +42,69 @@ def env_payload():
     }
 
 
+def stream_list(items):
+    # Writes a JSON list one element at a time, so large path enumerations are never held in memory all at once
+    def generate():
+        yield "["
+        for i, item in enumerate(items):
+            yield ("," if i > 0 else "") + json.dumps(item)
+        yield "]"
+
+    return Response(generate(), mimetype="application/json")
+
+
+def string_tuples(items, size: int) -> bool:
+    # Whether a JSON body is a list of lists, each holding exactly size strings
+    return isinstance(items, list) and all(map(lambda item: isinstance(item, list) and len(item) == size and all(map(lambda x: isinstance(x, str), item)), items))
+
+
+def path_limits():
+    try:
+        max_paths = int(request.args["max_paths"]) if "max_paths" in request.args else None
+        max_depth = int(request.args["max_depth"]) if "max_depth" in request.args else None
+    except ValueError:
+        abort(400)
+
+    if (max_paths is not None and max_paths < 1) or (max_depth is not None and max_depth < 0):
+        abort(400)
+
+    return max_paths, max_depth
+
+
+def api_etag():
+    # Responses only change with the active ontology's version, so that and the request itself identify them
+    key = [ont.management.DATABASE, ont.management.active(), ont.management.version(ont.management.handle()), request.path, sorted(request.args.items(multi=True))]
+    return hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()
+
+
+def cacheable():
+    return request.method in ["GET", "HEAD"] and request.path.startswith("/ontology/api/") and ont.management.active() is not None
+
+
+@app.before_request
+def api_not_modified():
+    if not cacheable():
+        return None
+
+    g.etag = api_etag()
+    if request.if_none_match.contains(g.etag):
+        response = Response(status=304)
+        response.set_etag(g.etag)
+        response.headers["Cache-Control"] = API_CACHE_CONTROL
+        return response
+
+    return None
+
+
+@app.after_request
+def api_cache_headers(response):
+    if "etag" in g and response.status_code == 200:
+        response.set_etag(g.etag)
+        response.headers["Cache-Control"] = API_CACHE_CONTROL
+
+    return response
+
+
 ### /ontology/api - routes for query, returning JSON formatted results
 
 
@@ -58,8 +130,75 @@ def api_roots():
 @app.route("/ontology/api/search", methods=["GET"])
 def api_search():
     name_like = request.args.get("name_like")
+    match = request.args.get("match", ont.search.SUBSTRING)
+
+    if match not in [ont.search.EXACT, ont.search.PREFIX, ont.search.SUBSTRING]:
+        abort(400)
+
+    try:
+        limit = int(request.args["limit"]) if "limit" in request.args else None
+    except ValueError:
+        abort(400)
+
+    if limit is not None and limit < 0:
+        abort(400)
+
+    return json.dumps(OntologyAPI().search(name_like=name_like, match=match, limit=limit))
+
+
+@app.route("/ontology/api/fuzzy", methods=["GET"])
+def api_fuzzy():
+    if "name" not in request.args:
+        abort(400)
+
+    name = request.args["name"]
+
+    try:
+        max_distance = int(request.args.get("max_distance", 2))
+        k = int(request.args.get("k", 10))
+    except ValueError:
+        abort(400)
+
+    if max_distance < 0 or k < 0:
+        abort(400)
+
+    return json.dumps(OntologyAPI().fuzzy_search(name, max_distance=max_distance, k=k))
+
+
+@app.route("/ontology/api/search_definitions", methods=["GET"])
+def api_search_definitions():
+    if "query" not in request.args:
+        abort(400)
+
+    try:
+        limit = int(request.args.get("limit", 10))
+    except ValueError:
+        abort(400)
+
+    if limit < 0:
+        abort(400)
+
+    return json.dumps(OntologyAPI().search_definitions(request.args["query"], limit=limit))
 
-    return json.dumps(OntologyAPI().search(name_like=name_like))
+
+@app.route("/ontology/api/exists", methods=["GET"])
+def api_exists():
+    # With filter=true, a Bloom filter over every name, for clients to rule out unknown names locally
+    if "filter" in request.args and request.args["filter"].lower() == "true":
+        try:
+            error_rate = float(request.args.get("error_rate", 0.01))
+        except ValueError:
+            abort(400)
+
+        if not 0 < error_rate < 1:
+            abort(400)
+
+        return json.dumps(OntologyAPI().existence_filter(error_rate=error_rate))
+
+    if "concept" not in request.args:
+        abort(400)
+
+    return json.dumps(OntologyAPI().exists_batch(request.args.getlist("concept")))
 
 
 @app.route("/ontology/api/ancestors", methods=["GET"])
@@ -72,7 +211,11 @@ def api_ancestors():
     details = False if "details" not in request.args else request.args["details"].lower() == "true"
     paths = False if "paths" not in request.args else request.args["paths"].lower() == "true"
 
-    return json.dumps(OntologyAPI().ancestors(concept, immediate=immediate, details=details, paths=paths))
+    if paths:
+        max_paths, max_depth = path_limits()
+        return stream_list(OntologyAPI().ancestor_paths(concept, details=details, max_paths=max_paths, max_depth=max_depth))
+
+    return json.dumps(OntologyAPI().ancestors(concept, immediate=immediate, details=details))
 
 
 @app.route("/ontology/api/descendants", methods=["GET"])
@@ -85,7 +228,77 @@ def api_descendants():
     details = False if "details" not in request.args else request.args["details"].lower() == "true"
     paths = False if "paths" not in request.args else request.args["paths"].lower() == "true"
 
-    return json.dumps(OntologyAPI().descendants(concept, immediate=immediate, details=details, paths=paths))
+    if paths:
+        max_paths, max_depth = path_limits()
+        return stream_list(OntologyAPI().descendant_paths(concept, details=details, max_paths=max_paths, max_depth=max_depth))
+
+    return json.dumps(OntologyAPI().descendants(concept, immediate=immediate, details=details))
+
+
+@app.route("/ontology/api/is_a", methods=["GET", "POST"])
+def api_is_a():
+    if request.method == "POST":
+        pairs = request.get_json()
+        if not string_tuples(pairs, 2):
+            abort(400)
+    else:
+        concepts = request.args.getlist("concept")
+        ancestors = request.args.getlist("ancestor")
+        if len(concepts) == 0 or len(concepts) != len(ancestors):
+            abort(400)
+        pairs = list(zip(concepts, ancestors))
+
+    return json.dumps(OntologyAPI().is_a_batch(pairs))
+
+
+@app.route("/ontology/api/common_ancestors", methods=["GET", "POST"])
+def api_common_ancestors():
+    most_specific = True if "most_specific" not in request.args else request.args["most_specific"].lower() == "true"
+
+    if request.method == "POST":
+        groups = request.get_json()
+        if not isinstance(groups, list) or any(map(lambda group: not isinstance(group, list) or len(group) == 0 or not all(map(lambda concept: isinstance(concept, str), group)), groups)):
+            abort(400)
+
+        return json.dumps(OntologyAPI().common_ancestors_batch(groups, most_specific=most_specific))
+
+    if "concept" not in request.args:
+        abort(400)
+
+    concepts = request.args.getlist("concept")
+
+    return json.dumps(OntologyAPI().common_ancestors(concepts, most_specific=most_specific))
+
+
+@app.route("/ontology/api/similarity", methods=["POST"])
+def api_similarity():
+    metric = request.args.get("metric", ont.graph.WU_PALMER)
+    if metric not in [ont.graph.WU_PALMER, ont.graph.PATH]:
+        abort(400)
+
+    pairs = request.get_json()
+    if not string_tuples(pairs, 2):
+        abort(400)
+
+    return json.dumps(OntologyAPI().similarity(pairs, metric=metric))
+
+
+@app.route("/ontology/api/check_constraints", methods=["POST"])
+def api_check_constraints():
+    # Each item is [concept, slot, filler]; the filler may be anything a property can hold
+    items = request.get_json()
+    if not isinstance(items, list) or any(map(lambda item: not isinstance(item, list) or len(item) != 3 or not string_tuples([item[:2]], 2), items)):
+        abort(400)
+
+    return json.dumps(OntologyAPI().check_constraints(items))
+
+
+@app.route("/ontology/api/stats", methods=["GET"])
+def api_stats():
+    if "concept" not in request.args:
+        abort(400)
+
+    return json.dumps(OntologyAPI().statistics(request.args.getlist("concept")))
 
 
 @app.route("/ontology/api/inverses", methods=["GET"])
@@ -110,6 +323,21 @@ def api_domains_and_ranges():
     return json.dumps(OntologyAPI().domains_and_ranges(property))
 
 
+@app.route("/ontology/api/batch", methods=["POST"])
+def api_batch():
+    operations = request.get_json()
+    if not isinstance(operations, list) or any(map(lambda operation: not isinstance(operation, dict) or not isinstance(operation.get("args", {}), dict), operations)):
+        abort(400)
+
+    # Only a malformed batch, or one naming an unknown concept, is the client's fault; anything else is a 500
+    try:
+        results = OntologyAPI().batch(operations)
+    except (ont.api.BatchError, ont.graph.UnknownConceptError) as e:
+        abort(make_response(jsonify(message=str(e)), 400))
+
+    return json.dumps(results)
+
+
 ### /ontology/view - routes for the editor and browser ui, GET only
 
 
@@ -376,10 +604,10 @@ def edit_add_parent(concept):
     if concept == parent:
         abort(make_response(jsonify(message="Cannot assign %s as a parent of itself." % concept.lower()), 400))
 
-    if len(OntologyAPI().get(concept, local=True)) == 0:
+    if not OntologyAPI().exists(concept):
         abort(make_response(jsonify(message="Unknown concept %s." % concept.lower()), 400))
 
-    if len(OntologyAPI().get(parent, local=True)) == 0:
+    if not OntologyAPI().exists(parent):
         abort(make_response(jsonify(message="Unknown concept %s." % parent.lower()), 400))
 
     OntologyAPI().add_parent(concept, parent)
@@ -422,10 +650,10 @@ def edit_add_concept():
     if concept == parent:
         abort(make_response(jsonify(message="Cannot assign %s as a parent of itself." % concept.lower()), 400))
 
-    if len(OntologyAPI().get(concept, local=True)) != 0:
+    if OntologyAPI().exists(concept):
         abort(make_response(jsonify(message="Concept %s already exists." % concept.lower()), 400))
 
-    if len(OntologyAPI().get(parent, local=True)) == 0:
+    if not OntologyAPI().exists(parent):
         abort(make_response(jsonify(message="Unknown concept %s." % parent.lower()), 400))
 
     OntologyAPI().add_concept(concept, parent, data["definition"])
@@ -474,14 +702,27 @@ def manage():
     return render_template("manager.html", payload=payload, env=env_payload())
 
 
+@app.route("/ontology/manage/indexes", methods=["GET"])
+def manage_indexes():
+    from ont.management import check_query_plans, list_collections
+
+    return json.dumps(dict(map(lambda c: (c, check_query_plans(c)), list_collections())))
+
+
+@app.route("/ontology/manage/cache", methods=["GET"])
+def manage_cache():
+    return json.dumps(ont.cache.metrics())
+
+
 @app.route("/ontology/manage/activate", methods=["POST"])
 def manage_activate():
 
     ontology = request.form["ontology"]
 
     try:
-        from ont.management import activate
+        from ont.management import activate, warm
         activate(ontology)
+        warm(ontology)
     except Exception as e:
         return redirect("/ontology/manage?error=" + e.message)
 
@@ -691,4 +932,10 @@ if __name__ == '__main__':
             if k == "port":
                 port = int(v)
 
+    ont.management.ensure_all_indexes()
+    ont.sync.watch()
+
+    if ont.management.active() is not None:
+        ont.management.warm()
+
     socketio.run(app, host=host, port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,154 @@
+from typing import Union
+
+import logging
+import ont.cache
+import ont.graph
+import ont.management
+import ont.properties
+import ont.search
+import os
+import pymongo.errors
+import threading
+
+
+POLL_INTERVAL = float(os.environ["VERSION_POLL_INTERVAL"]) if "VERSION_POLL_INTERVAL" in os.environ else 1.0
+MAX_RETRY_INTERVAL = float(os.environ["VERSION_MAX_RETRY_INTERVAL"]) if "VERSION_MAX_RETRY_INTERVAL" in os.environ else 30.0
+
+logger = logging.getLogger(__name__)
+
+
+def apply(collection, previous: Union[str, None], current: str, change: dict, graph: ont.graph.OntologyGraph=None):
+    # Carry every in-process structure from the previous version to the current one, given a description of the edit
+    # made in between (and the hierarchy as it stood before it); anything not at the previous version is dropped
+    concepts = change["concepts"]
+    if graph is None:
+        graph = ont.graph.peek(collection, previous)
+
+    # Edits to a concept can only reach the resolved frames of that concept and its descendants; None means anything
+    affected = None
+    relations = True
+    if concepts is not None and graph is not None:
+        affected = set(concepts)
+        for concept in filter(lambda concept: concept in graph, concepts):
+            affected.update(graph.descendants(concept))
+
+        # The relation set only moves with the relation subtree or with inverse slots
+        relations = change["hierarchy"] or change["inverse"] or any(map(lambda concept: graph.is_a(concept, "relation"), concepts))
+
+    # Only the documents of the edited concepts themselves change
+    documents = set(concepts if concepts is not None else [])
+    for names in ("added", "removed", "defined", "properties", "relinked"):
+        documents.update(change[names])
+
+    ont.cache.evict(collection, previous, current, documents)
+    ont.cache.advance(collection, previous, current, affected, relations=relations)
+    ont.search.advance(collection, previous, current, added=change["added"], removed=change["removed"], defined=change["defined"])
+    ont.properties.advance(collection, previous, current, change["properties"])
+    ont.graph.advance(collection, previous, current, change["relinked"])
+
+
+class VersionWatcher(threading.Thread):
+
+    def __init__(self, database, interval: float=POLL_INTERVAL):
+        super(VersionWatcher, self).__init__()
+        self.daemon = True
+
+        self.database = database
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        delay = self.interval
+
+        try:
+            while not self.stopped.is_set():
+                try:
+                    self.poll()
+                    delay = self.interval
+
+                    # Change streams need a replica set; a standalone mongod refuses them, so fall back to polling the
+                    # version documents
+                    try:
+                        self.stream()
+                    except pymongo.errors.OperationFailure:
+                        while not self.stopped.wait(self.interval):
+                            self.poll()
+                except pymongo.errors.PyMongoError:
+                    logger.exception("Watching versions in %s failed; retrying in %.1f seconds." % (self.database.name, delay))
+
+                    # Edits made while the watcher is down would go unseen; read versions from Mongo until it is back
+                    ont.management.forget_all(self.database.name)
+                    self.stopped.wait(delay)
+                    delay = min(delay * 2, MAX_RETRY_INTERVAL)
+        finally:
+            ont.management.forget_all(self.database.name)
+
+    def stop(self):
+        self.stopped.set()
+
+    def stream(self):
+        while not self.stopped.is_set():
+            with self.database[ont.management.VERSIONS].watch(full_document="updateLookup") as changes:
+                for change in changes:
+                    if change.get("fullDocument") is not None:
+                        self.observe(change["fullDocument"])
+                    elif "documentKey" in change:
+                        ont.management.forget(self.database[change["documentKey"]["_id"]])
+
+                    if self.stopped.is_set():
+                        return
+
+            # The stream was invalidated (the versions collection was dropped); start over from the current state
+            ont.management.forget_all(self.database.name)
+            self.poll()
+
+    def poll(self):
+        records = list(self.database[ont.management.VERSIONS].find())
+
+        names = set(map(lambda record: record["_id"], records))
+        for name in ont.management.known(self.database.name):
+            if name not in names:
+                ont.management.forget(self.database[name])
+
+        for record in records:
+            self.observe(record)
+
+    def observe(self, record: dict):
+        collection = self.database[record["_id"]]
+        known = ont.management.known(self.database.name).get(record["_id"])
+
+        if known == record["version"]:
+            return
+
+        # Replay the edit locally only if it was made on top of the version this process has; otherwise just move on
+        if known is not None and record.get("previous") == known and record.get("change") is not None:
+            apply(collection, known, record["version"], record["change"])
+
+        ont.management.remember(collection, record["version"])
+
+
+_watchers = {}
+
+
+def watch(database=None, interval: float=POLL_INTERVAL) -> VersionWatcher:
+    if database is None:
+        database = ont.management.getclient()[ont.management.DATABASE]
+
+    watcher = _watchers.get(database.name)
+    if watcher is None or not watcher.is_alive():
+        watcher = VersionWatcher(database, interval=interval)
+        _watchers[database.name] = watcher
+        watcher.start()
+
+    return watcher
+
+
+def unwatch(database=None):
+    if database is None:
+        database = ont.management.getclient()[ont.management.DATABASE]
+
+    watcher = _watchers.pop(database.name, None)
+    if watcher is not None:
+        watcher.stop()
+
+    ont.management.forget_all(database.name)
@@ -11,6 +11,7 @@ setup(
         "Flask-SocketIO==3.3.1",
         "pymongo==3.6.1",
         "boto3==1.7.6",
+        "numpy==1.16.2",
     ],
 
     author="Jesse English",
@@ -1,8 +1,18 @@
 from ont.api import OntologyAPI
+from ont.bloom import BloomFilter
 from tests.TestUtils import mock_concept
 
+import numpy as np
+import ont.api
+import ont.cache
+import ont.graph
 import ont.management
+import ont.properties
+import ont.search
+import ont.sync
 import os
+import pymongo.errors
+import time
 import unittest
 
 
@@ -177,6 +187,22 @@ class APITestCase(unittest.TestCase):
 
         self.assertEqual([meta_property2, meta_property3], OntologyAPI()._prune_list([meta_property1, meta_property2, meta_property3], [property1]))
 
+    def test_prune_list_structured_fillers(self):
+        property1 = {"slot": "test", "facet": "sem", "filler": {">": 1, "<": 5}}
+        property2 = {"slot": "test", "facet": "sem", "filler": ["a", "b"]}
+        property3 = {"slot": "test", "facet": "sem", "filler": 3}
+
+        self.assertEqual([property2, property3], OntologyAPI()._prune_list([property1, property2, property3], [{"slot": "test", "facet": "sem", "filler": {"<": 5, ">": 1}}]))
+        self.assertEqual([property1, property3], OntologyAPI()._prune_list([property1, property2, property3], [property2]))
+
+    def test_inherit_retains_local_copy(self):
+        property1 = {"slot": "prop1", "facet": "sem", "filler": "value1"}
+
+        concept = mock_concept("concept", parents=["parent"], localProperties=[dict(property1)])
+        parent = mock_concept("parent", localProperties=[dict(property1)])
+
+        self.assertEqual([property1], OntologyAPI()._inherit(concept))
+
 
 class APIGetTestCase(unittest.TestCase):
 
@@ -202,6 +228,19 @@ class APIGetTestCase(unittest.TestCase):
         self.assertTrue(OntologyAPI().format(concept1) in results)
         self.assertTrue(OntologyAPI().format(concept2) in results)
 
+    def test_get_multiple_subclasses(self):
+        parent1 = mock_concept("parent1")
+        parent2 = mock_concept("parent2")
+        child1 = mock_concept("child1", parents=["parent1"])
+        child2 = mock_concept("child2", parents=["parent1", "parent2"])
+
+        results = OntologyAPI().get(["parent1", "parent2", "child1"])
+        results = {list(r.keys())[0]: r for r in results}
+
+        self.assertEqual(["child1", "child2"], results["parent1"]["parent1"]["subclasses"]["value"])
+        self.assertEqual(["child2"], results["parent2"]["parent2"]["subclasses"]["value"])
+        self.assertEqual([], results["child1"]["child1"]["subclasses"]["value"])
+
     def test_get_metadata(self):
         concept = mock_concept("concept", definition="test definition")
 
@@ -398,6 +437,107 @@ class APIAncestorsTestCase(unittest.TestCase):
 
         self.assertEqual(0, len(results))
 
+    def test_ancestors_paths_shortest_first(self):
+        concept = mock_concept("concept", parents=["parent", "root"])
+        parent = mock_concept("parent", parents=["grandparent"])
+        grandparent = mock_concept("grandparent", parents=["root"])
+        root = mock_concept("root")
+
+        results = OntologyAPI().ancestors("concept", paths=True)
+        self.assertEqual([["root"], ["parent", "grandparent", "root"]], results)
+
+    def test_ancestors_paths_limits(self):
+        # Three stacked diamonds give 2^3 distinct paths to the root
+        mock_concept("concept", parents=["a1", "b1"])
+        mock_concept("a1", parents=["level1"])
+        mock_concept("b1", parents=["level1"])
+        mock_concept("level1", parents=["a2", "b2"])
+        mock_concept("a2", parents=["level2"])
+        mock_concept("b2", parents=["level2"])
+        mock_concept("level2", parents=["a3", "b3"])
+        mock_concept("a3", parents=["root"])
+        mock_concept("b3", parents=["root"])
+        mock_concept("root")
+
+        self.assertEqual(8, len(OntologyAPI().ancestors("concept", paths=True)))
+        self.assertEqual(3, len(OntologyAPI().ancestors("concept", paths=True, max_paths=3)))
+
+        results = OntologyAPI().ancestors("concept", paths=True, max_depth=2)
+        self.assertEqual(2, len(results))
+        self.assertTrue(["a1", "level1"] in results)
+        self.assertTrue(["b1", "level1"] in results)
+
+
+    def test_ancestors_paths_capped_shortest_first(self):
+        concept = mock_concept("concept", parents=["b", "root"])
+        b = mock_concept("b", parents=["a"])
+        a = mock_concept("a", parents=["root"])
+        root = mock_concept("root")
+
+        self.assertEqual([["root"]], OntologyAPI().ancestors("concept", paths=True, max_paths=1))
+        self.assertEqual([["root"], ["b", "a", "root"]], OntologyAPI().ancestors("concept", paths=True, max_paths=2))
+
+    def test_paths_capped_are_the_shortest(self):
+        # Capping at k gives exactly the first k paths of the uncapped (shortest first) enumeration
+        mock_concept("root")
+        mock_concept("p1", parents=["root"])
+        mock_concept("p2", parents=["p1"])
+        mock_concept("p3", parents=["p2", "root"])
+        mock_concept("p4", parents=["p3", "p1"])
+        mock_concept("concept", parents=["p4", "p2", "root"])
+
+        api = OntologyAPI()
+        ancestors = api.ancestors("concept", paths=True)
+        descendants = api.descendants("root", paths=True)
+        for k in range(1, 8):
+            self.assertEqual(ancestors[:k], api.ancestors("concept", paths=True, max_paths=k))
+            self.assertEqual(descendants[:k], api.descendants("root", paths=True, max_paths=k))
+
+    def test_ancestors_paths_bounded_work(self):
+        # Twenty stacked diamonds give 2^20 paths to the root; asking for a few must not explore them all
+        parents = ["root"]
+        for level in range(20):
+            names = ["a%d" % level, "b%d" % level]
+            for name in names:
+                mock_concept(name, parents=parents)
+            mock_concept("level%d" % level, parents=names)
+            parents = ["level%d" % level]
+        mock_concept("root")
+        mock_concept("concept", parents=parents)
+
+        graph = OntologyAPI().graph
+        steps = []
+        on_path = graph._on_path
+
+        def counted(id, cell):
+            steps.append(id)
+            return on_path(id, cell)
+
+        graph._on_path = counted
+
+        results = OntologyAPI().ancestors("concept", paths=True, max_paths=3)
+        self.assertEqual(3, len(results))
+        self.assertTrue(all(map(lambda path: path[-1] == "root", results)))
+        self.assertLess(len(steps), 1000)
+
+        del steps[:]
+        results = OntologyAPI().descendants("root", paths=True, max_paths=5)
+        self.assertEqual(5, len(results))
+        self.assertLess(len(steps), 1000)
+
+    def test_ancestors_paths_default_caps(self):
+        mock_concept("concept", parents=["a1", "b1"])
+        mock_concept("a1", parents=["root"])
+        mock_concept("b1", parents=["root"])
+        mock_concept("root")
+
+        max_paths = ont.api.MAX_PATHS
+        ont.api.MAX_PATHS = 1
+        try:
+            self.assertEqual(1, len(OntologyAPI().ancestors("concept", paths=True)))
+            self.assertEqual(1, len(OntologyAPI().ancestors("concept", paths=True, max_paths=10)))
+        finally:
+            ont.api.MAX_PATHS = max_paths
 
 class APIDescendantsTestCase(unittest.TestCase):
 
@@ -472,6 +612,23 @@ class APIDescendantsTestCase(unittest.TestCase):
 
         self.assertEqual(0, len(results))
 
+    def test_descendants_paths_limits(self):
+        concept1 = mock_concept("concept1", parents=["parent1"])
+        concept2 = mock_concept("concept2", parents=["parent2"])
+        parent1 = mock_concept("parent1", parents=["grandparent"])
+        parent2 = mock_concept("parent2", parents=["grandparent"])
+        grandparent = mock_concept("grandparent")
+
+        results = OntologyAPI().descendants("grandparent", paths=True, max_depth=1)
+        self.assertEqual(2, len(results))
+        self.assertTrue(["parent1"] in results)
+        self.assertTrue(["parent2"] in results)
+
+        results = OntologyAPI().descendants("grandparent", paths=True, max_paths=3)
+        self.assertEqual(3, len(results))
+        self.assertTrue(["parent1"] in results)
+        self.assertTrue(["parent2"] in results)
+
 
 class APIInversesTestCase(unittest.TestCase):
 
@@ -579,6 +736,33 @@ class APIDomainsAndRangesTestCase(unittest.TestCase):
             "d2": ["r1", "r2"]
         }, OntologyAPI().domains_and_ranges("prop"))
 
+    def test_domains_and_ranges_follow_property_edits(self):
+        mock_concept("d1", localProperties=[{"slot": "prop", "facet": "sem", "filler": "r1"}])
+        mock_concept("d2", localProperties=[{"slot": "prop", "facet": "sem", "filler": {"structured": "filler"}}])
+
+        api = OntologyAPI()
+        self.assertEqual({"d1": ["r1"], "d2": [{"structured": "filler"}]}, api.domains_and_ranges("prop"))
+
+        api.insert_property("d1", "prop", "sem", "r2")
+        api.remove_property("d2", "prop", "sem", "filler")
+        self.assertEqual({"d1": ["r1", "r2"], "d2": [{"structured": "filler"}]}, api.domains_and_ranges("prop"))
+
+        api.remove_property("d1", "prop", "sem", "r1")
+        api.remove_property("d1", "prop", "sem", "r2")
+        self.assertEqual({"d2": [{"structured": "filler"}]}, api.domains_and_ranges("prop"))
+
+    def test_property_edits_leave_held_index_untouched(self):
+        mock_concept("d1", localProperties=[{"slot": "prop", "facet": "sem", "filler": "r1"}])
+
+        api = OntologyAPI()
+        api.domains_and_ranges("prop")
+        held = ont.properties.index(api.collection)
+
+        # A reader on another thread may still hold the index from before the edit
+        api.insert_property("d1", "prop", "sem", "r2")
+        self.assertEqual({"d1": ["r1"]}, held.domains_and_ranges("prop"))
+        self.assertEqual({"d1": ["r1", "r2"]}, ont.properties.index(api.collection).domains_and_ranges("prop"))
+
 
 class APISiblingsTestCase(unittest.TestCase):
 
@@ -699,6 +883,118 @@ class APIReportTestCase(unittest.TestCase):
             "filler": "concept"
         }, report["usage"]["inverses"])
 
+    def test_report_usage_follows_edits(self):
+        concept = mock_concept("concept")
+        user = mock_concept("user")
+
+        api = OntologyAPI()
+        self.assertEqual([], api.report("concept", include_usage=True)["usage"]["inverses"])
+
+        api.insert_property("user", "slot1", "sem", "concept")
+        self.assertEqual([{
+            "concept": "user",
+            "slot": "slot1",
+            "facet": "sem",
+            "filler": "concept"
+        }], api.report("concept", include_usage=True)["usage"]["inverses"])
+
+        api.remove_concept("concept", include_usages=True)
+        self.assertEqual({}, api.domains_and_ranges("slot1"))
+
+
+class APIBatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_batch(self):
+        concept = mock_concept("concept", parents=["parent"], localProperties=[{"slot": "rel", "facet": "sem", "filler": "value"}])
+        parent = mock_concept("parent")
+
+        api = OntologyAPI()
+        results = api.batch([
+            {"op": "get", "args": {"concepts": "concept"}},
+            {"op": "ancestors", "args": {"concept": "concept"}},
+            {"op": "descendants", "args": {"concept": "parent"}},
+            {"op": "domains_and_ranges", "args": {"property": "rel"}},
+            {"op": "roots"}
+        ])
+
+        self.assertEqual([
+            api.get("concept"),
+            api.ancestors("concept"),
+            api.descendants("parent"),
+            api.domains_and_ranges("rel"),
+            api.roots()
+        ], results)
+
+    def test_batch_rejects_unknown_operations(self):
+        concept = mock_concept("concept")
+
+        with self.assertRaises(ont.api.BatchError):
+            OntologyAPI().batch([{"op": "remove_concept", "args": {"concept": "concept"}}])
+
+        self.assertTrue(OntologyAPI().exists("concept"))
+
+    def test_batch_validates_before_running(self):
+        concept = mock_concept("concept")
+
+        with self.assertRaises(ont.api.BatchError):
+            OntologyAPI().batch([{"op": "get", "args": {"concepts": "concept"}}, {"op": "roots", "args": {"unknown": 1}}])
+
+        with self.assertRaises(ont.api.BatchError):
+            OntologyAPI().batch([{"op": "ancestors", "args": {"concept": "concept", "paths": True, "max_paths": 0}}])
+
+        with self.assertRaises(ont.api.BatchError):
+            OntologyAPI().batch([{"op": "roots"}] * (ont.api.MAX_BATCH_OPERATIONS + 1))
+
+        with self.assertRaises(ont.graph.UnknownConceptError):
+            OntologyAPI().batch([{"op": "ancestors", "args": {"concept": "no-such-concept"}}])
+
+    def test_batch_checks_argument_values(self):
+        concept = mock_concept("concept")
+
+        for operation in [
+            {"op": "search", "args": {"name_like": "con", "match": "bogus"}},
+            {"op": "search", "args": {"name_like": "con", "limit": -1}},
+            {"op": "similarity", "args": {"pairs": [["concept", "concept"]], "metric": "x"}},
+            {"op": "similarity", "args": {"pairs": [[1, 2]]}},
+            {"op": "get", "args": {"concepts": 5}},
+            {"op": "get", "args": {"concepts": "concept", "local": "yes"}},
+            {"op": "check_constraints", "args": {"items": [[1, "agent", "object"]]}}
+        ]:
+            with self.assertRaises(ont.api.BatchError):
+                OntologyAPI().batch([operation])
+
+        self.assertEqual([["concept"], [{"satisfied": True, "facet": None}]], OntologyAPI().batch([
+            {"op": "search", "args": {"name_like": "con", "match": "prefix", "limit": None}},
+            {"op": "check_constraints", "args": {"items": [["concept", "agent", {"structured": "filler"}]]}}
+        ]))
+
+    def test_batch_paths_capped(self):
+        mock_concept("root")
+        for i in range(4):
+            mock_concept("child%d" % i, parents=["root"])
+
+        max_paths = ont.api.MAX_PATHS
+        ont.api.MAX_PATHS = 2
+        try:
+            results = OntologyAPI().batch([
+                {"op": "descendants", "args": {"concept": "root", "paths": True}},
+                {"op": "descendants", "args": {"concept": "root", "paths": True, "max_paths": 100}}
+            ])
+        finally:
+            ont.api.MAX_PATHS = max_paths
+
+        self.assertEqual([2, 2], list(map(len, results)))
+
 
 class APIUpdateDefinitionTestCase(unittest.TestCase):
 
@@ -1057,4 +1353,1181 @@ class APISearchTestCase(unittest.TestCase):
         self.assertEqual([], OntologyAPI().search())
 
         # Name must be at least 3 characters to search (treats as None otherwise)
-        self.assertEqual([], OntologyAPI().search(name_like="co"))
\ No newline at end of file
+        self.assertEqual([], OntologyAPI().search(name_like="co"))
+
+    def test_search_match_types(self):
+        mock_concept("event")
+        mock_concept("mental-event")
+        mock_concept("eventful")
+        mock_concept("prevent")
+
+        self.assertEqual(["event"], OntologyAPI().search(name_like="event", match="exact"))
+        self.assertEqual(["event", "eventful"], OntologyAPI().search(name_like="event", match="prefix"))
+        self.assertEqual(["event", "eventful", "mental-event", "prevent"], OntologyAPI().search(name_like="event"))
+        self.assertEqual(["event", "eventful"], OntologyAPI().search(name_like="event", limit=2))
+
+    def test_search_does_not_interpret_patterns(self):
+        mock_concept("concept1")
+        mock_concept("concept.*")
+
+        self.assertEqual(["concept.*"], OntologyAPI().search(name_like="concept.*"))
+        self.assertEqual([], OntologyAPI().search(name_like="c.*1"))
+
+    def test_search_follows_added_and_removed_concepts(self):
+        mock_concept("all")
+
+        api = OntologyAPI()
+        self.assertEqual([], api.search(name_like="concept"))
+
+        api.add_concept("concept", "all", "")
+        self.assertEqual(["concept"], api.search(name_like="concept"))
+
+        api.remove_concept("concept")
+        self.assertEqual([], api.search(name_like="concept"))
+
+    def test_fuzzy_search(self):
+        mock_concept("mental-event")
+        mock_concept("event")
+        mock_concept("vent")
+        mock_concept("human")
+
+        self.assertEqual([{"name": "mental-event", "distance": 1}], OntologyAPI().fuzzy_search("mentalevent"))
+        self.assertEqual([{"name": "event", "distance": 1}, {"name": "vent", "distance": 2}], OntologyAPI().fuzzy_search("evnt"))
+        self.assertEqual([{"name": "event", "distance": 1}], OntologyAPI().fuzzy_search("evnt", k=1))
+        self.assertEqual([{"name": "event", "distance": 1}], OntologyAPI().fuzzy_search("evnt", max_distance=1))
+        self.assertEqual([], OntologyAPI().fuzzy_search("xyz", max_distance=1))
+
+    def test_fuzzy_search_follows_added_and_removed_concepts(self):
+        mock_concept("all")
+
+        api = OntologyAPI()
+        self.assertEqual([], api.fuzzy_search("concpt"))
+
+        api.add_concept("concept", "all", "")
+        self.assertEqual([{"name": "concept", "distance": 1}], api.fuzzy_search("concpt"))
+
+        api.remove_concept("concept")
+        self.assertEqual([], api.fuzzy_search("concpt"))
+
+    def test_search_definitions(self):
+        mock_concept("dog", definition="a domesticated canine animal")
+        mock_concept("wolf", definition="a wild canine animal that hunts in packs of wolves")
+        mock_concept("cat", definition="a domesticated feline animal")
+
+        results = OntologyAPI().search_definitions("domesticated canine")
+        self.assertEqual(["dog", "cat", "wolf"], list(map(lambda result: result["name"], results)))
+        self.assertTrue(results[0]["score"] > results[1]["score"] > 0)
+
+        self.assertEqual(["dog"], list(map(lambda result: result["name"], OntologyAPI().search_definitions("domesticated canine", limit=1))))
+        self.assertEqual([], OntologyAPI().search_definitions("reptile"))
+
+    def test_search_definitions_includes_notes(self):
+        concept = mock_concept("dog")
+        ont.management.handle().update_one({"name": "dog"}, {"$set": {"notes": "Often kept as a pet."}})
+
+        self.assertEqual(["dog"], list(map(lambda result: result["name"], OntologyAPI().search_definitions("pet"))))
+
+    def test_search_definitions_follows_edits(self):
+        mock_concept("all")
+
+        api = OntologyAPI()
+        self.assertEqual([], api.search_definitions("canine"))
+
+        api.add_concept("dog", "all", "a canine")
+        self.assertEqual(["dog"], list(map(lambda result: result["name"], api.search_definitions("canine"))))
+
+        api.update_definition("dog", "a pet")
+        self.assertEqual([], api.search_definitions("canine"))
+        self.assertEqual(["dog"], list(map(lambda result: result["name"], api.search_definitions("pet"))))
+
+        api.remove_concept("dog")
+        self.assertEqual([], api.search_definitions("pet"))
+
+    def test_name_edits_leave_held_index_untouched(self):
+        mock_concept("all")
+
+        api = OntologyAPI()
+        api.search("dog")
+        held = ont.search.index(api.collection)
+
+        # A reader on another thread may still hold the index from before the edit
+        api.add_concept("dog", "all", "")
+        self.assertEqual([], held.search("dog"))
+        self.assertEqual(["dog"], ont.search.index(api.collection).search("dog"))
+
+    def test_definition_edits_leave_held_index_untouched(self):
+        mock_concept("all")
+
+        api = OntologyAPI()
+        api.search_definitions("canine")
+        held = ont.search.text_index(api.collection)
+
+        # A reader on another thread may still hold the index from before the edit
+        api.add_concept("dog", "all", "a canine")
+        self.assertEqual([], held.search("canine"))
+        self.assertEqual(["dog"], list(map(lambda result: result[0], ont.search.text_index(api.collection).search("canine"))))
+
+
+class APIExistsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_exists(self):
+        concept = mock_concept("concept")
+
+        self.assertTrue(OntologyAPI().exists("concept"))
+        self.assertTrue(OntologyAPI().exists("CONCEPT"))
+        self.assertFalse(OntologyAPI().exists("other"))
+        self.assertEqual([True, False], OntologyAPI().exists_batch(["concept", "other"]))
+
+    def test_exists_after_edits(self):
+        all = mock_concept("all")
+
+        api = OntologyAPI()
+        self.assertFalse(api.exists("concept"))
+
+        api.add_concept("concept", "all", "")
+        self.assertTrue(api.exists("concept"))
+
+        api.remove_concept("concept")
+        self.assertFalse(api.exists("concept"))
+
+    def test_existence_filter(self):
+        names = list(map(lambda i: "concept%d" % i, range(200)))
+        for name in names:
+            mock_concept(name)
+
+        bloom = BloomFilter.from_json(OntologyAPI().existence_filter(error_rate=0.01))
+        self.assertTrue(all(map(lambda name: name in bloom, names)))
+        self.assertEqual(200, bloom.count)
+
+        false_positives = len(list(filter(lambda i: ("other%d" % i) in bloom, range(1000))))
+        self.assertLess(false_positives, 50)
+
+    def test_existence_filter_after_edits(self):
+        all = mock_concept("all")
+
+        api = OntologyAPI()
+        api.existence_filter()
+        api.add_concept("concept", "all", "")
+
+        self.assertTrue("concept" in BloomFilter.from_json(api.existence_filter()))
+
+    def test_unknown_names_skip_lookup(self):
+        concept = mock_concept("concept")
+
+        api = OntologyAPI()
+        api.exists("concept")
+
+        mock_concept("other")
+        self.assertEqual([], api.get("other"))
+
+
+class APIFullAncestryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_full_ancestry(self):
+        concept = mock_concept("concept", parents=["parent"])
+        parent = mock_concept("parent", parents=["grandparent1", "grandparent2"])
+        grandparent1 = mock_concept("grandparent1")
+        grandparent2 = mock_concept("grandparent2")
+
+        self.assertEqual({
+            "concept": {"parent", "grandparent1", "grandparent2"},
+            "parent": {"grandparent1", "grandparent2"},
+            "grandparent1": set(),
+            "grandparent2": set(),
+        }, OntologyAPI().full_ancestry())
+
+    def test_full_ancestry_reflects_edits(self):
+        parent = mock_concept("parent")
+        child = mock_concept("child")
+
+        api = OntologyAPI()
+        self.assertEqual(set(), api.full_ancestry()["child"])
+
+        api.add_parent("child", "parent")
+        self.assertEqual({"parent"}, api.full_ancestry()["child"])
+
+
+class APIIsATestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_is_a(self):
+        concept = mock_concept("concept", parents=["parent"])
+        parent = mock_concept("parent", parents=["grandparent"])
+        grandparent = mock_concept("grandparent")
+        other = mock_concept("other")
+
+        self.assertTrue(OntologyAPI().is_a("concept", "concept"))
+        self.assertTrue(OntologyAPI().is_a("concept", "parent"))
+        self.assertTrue(OntologyAPI().is_a("concept", "grandparent"))
+        self.assertFalse(OntologyAPI().is_a("grandparent", "concept"))
+        self.assertFalse(OntologyAPI().is_a("concept", "other"))
+        self.assertFalse(OntologyAPI().is_a("concept", "no-such-concept"))
+
+    def test_is_a_multiple_inheritance(self):
+        concept = mock_concept("concept", parents=["parent"])
+        parent = mock_concept("parent", parents=["grandparent1", "grandparent2"])
+        grandparent1 = mock_concept("grandparent1", parents=["root"])
+        grandparent2 = mock_concept("grandparent2", parents=["other-root"])
+        root = mock_concept("root")
+        other_root = mock_concept("other-root")
+
+        self.assertTrue(OntologyAPI().is_a("concept", "grandparent1"))
+        self.assertTrue(OntologyAPI().is_a("concept", "grandparent2"))
+        self.assertTrue(OntologyAPI().is_a("concept", "root"))
+        self.assertTrue(OntologyAPI().is_a("concept", "other-root"))
+        self.assertFalse(OntologyAPI().is_a("grandparent1", "other-root"))
+        self.assertFalse(OntologyAPI().is_a("grandparent2", "root"))
+
+    def test_is_a_batch(self):
+        concept = mock_concept("concept", parents=["parent"])
+        parent = mock_concept("parent")
+
+        self.assertEqual([True, False, True], OntologyAPI().is_a_batch([("concept", "parent"), ("parent", "concept"), ("CONCEPT", "Parent")]))
+
+
+class APIAncestryMatrixTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_reduce_to_common_ancestors(self):
+        concept1 = mock_concept("concept1", parents=["parent"])
+        concept2 = mock_concept("concept2", parents=["parent"])
+        parent = mock_concept("parent", parents=["grandparent"])
+        grandparent = mock_concept("grandparent")
+        other = mock_concept("other")
+
+        graph = OntologyAPI().graph
+        self.assertEqual({"parent", "other"}, graph.reduce_to_common_ancestors({"concept1", "concept2", "parent", "other"}))
+        self.assertEqual({"grandparent", "literal"}, graph.reduce_to_common_ancestors({"concept1", "grandparent", "literal"}))
+
+    def test_most_specific_subsumers(self):
+        concept1 = mock_concept("concept1", parents=["parent1"])
+        concept2 = mock_concept("concept2", parents=["parent1", "parent2"])
+        parent1 = mock_concept("parent1", parents=["grandparent"])
+        parent2 = mock_concept("parent2", parents=["grandparent"])
+        grandparent = mock_concept("grandparent")
+
+        graph = OntologyAPI().graph
+        self.assertEqual({"parent1", "grandparent"}, graph.common_subsumers({"concept1", "concept2"}))
+        self.assertEqual({"parent1"}, graph.most_specific_subsumers({"concept1", "concept2"}))
+        self.assertEqual({"concept1"}, graph.most_specific_subsumers({"concept1"}))
+        self.assertEqual(set(), graph.most_specific_subsumers({"concept1", "no-such-concept"}))
+
+
+class APICommonAncestorsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_common_ancestors(self):
+        concept1 = mock_concept("concept1", parents=["parent1"])
+        concept2 = mock_concept("concept2", parents=["parent1", "parent2"])
+        concept3 = mock_concept("concept3", parents=["parent2"])
+        parent1 = mock_concept("parent1", parents=["grandparent"])
+        parent2 = mock_concept("parent2", parents=["grandparent"])
+        grandparent = mock_concept("grandparent")
+
+        self.assertEqual(["parent1"], OntologyAPI().common_ancestors(["concept1", "concept2"]))
+        self.assertEqual(["parent1", "grandparent"], OntologyAPI().common_ancestors(["concept1", "concept2"], most_specific=False))
+        self.assertEqual(["grandparent"], OntologyAPI().common_ancestors(["concept1", "concept3"]))
+        self.assertEqual(["parent2"], OntologyAPI().common_ancestors(["concept2", "concept3", "parent2"]))
+        self.assertEqual([], OntologyAPI().common_ancestors(["concept1", "no-such-concept"]))
+
+    def test_common_ancestors_batch(self):
+        concept1 = mock_concept("concept1", parents=["parent"])
+        concept2 = mock_concept("concept2", parents=["parent"])
+        parent = mock_concept("parent")
+        other = mock_concept("other")
+
+        self.assertEqual([["parent"], [], ["concept1"]], OntologyAPI().common_ancestors_batch([
+            ["concept1", "concept2"],
+            ["concept1", "other"],
+            ["CONCEPT1"]
+        ]))
+
+
+class APISimilarityTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_similarity_wu_palmer(self):
+        concept1 = mock_concept("concept1", parents=["parent"])
+        concept2 = mock_concept("concept2", parents=["parent"])
+        parent = mock_concept("parent", parents=["root"])
+        other = mock_concept("other", parents=["root"])
+        root = mock_concept("root")
+        island = mock_concept("island")
+
+        self.assertEqual([2 * 2 / 6, 1.0, 2 * 1 / 5, 2 * 2 / 5, 0.0, 0.0], OntologyAPI().similarity([
+            ("concept1", "concept2"),
+            ("concept1", "concept1"),
+            ("concept1", "other"),
+            ("concept1", "parent"),
+            ("concept1", "island"),
+            ("concept1", "no-such-concept")
+        ]))
+
+    def test_similarity_wu_palmer_chunked(self):
+        concept1 = mock_concept("concept1", parents=["parent"])
+        concept2 = mock_concept("concept2", parents=["parent"])
+        parent = mock_concept("parent", parents=["root"])
+        other = mock_concept("other", parents=["root"])
+        root = mock_concept("root")
+
+        graph = OntologyAPI().graph
+        x = np.array(list(map(graph.id, ["concept1", "concept1", "concept2", "other"])))
+        y = np.array(list(map(graph.id, ["concept2", "other", "parent", "root"])))
+
+        self.assertEqual(list(graph.wu_palmer(x, y)), list(graph.wu_palmer(x, y, chunk=1)))
+
+        cells = ont.graph.UNPACKED_CELLS
+        ont.graph.UNPACKED_CELLS = 1
+        try:
+            self.assertEqual(list(graph.wu_palmer(x, y)), list(graph.wu_palmer(x, y, chunk=1024)))
+        finally:
+            ont.graph.UNPACKED_CELLS = cells
+
+    def test_similarity_path(self):
+        concept1 = mock_concept("concept1", parents=["parent"])
+        concept2 = mock_concept("concept2", parents=["parent", "other"])
+        parent = mock_concept("parent", parents=["root"])
+        other = mock_concept("other", parents=["root"])
+        root = mock_concept("root")
+        island = mock_concept("island")
+
+        self.assertEqual([1 / 3, 1.0, 1 / 2, 1 / 4, 0.0], OntologyAPI().similarity([
+            ("concept1", "concept2"),
+            ("concept1", "concept1"),
+            ("concept2", "other"),
+            ("concept1", "other"),
+            ("concept1", "island")
+        ], metric="path"))
+
+    def test_similarity_unknown_metric(self):
+        with self.assertRaises(Exception):
+            OntologyAPI().similarity([("concept1", "concept2")], metric="no-such-metric")
+
+    def test_depth(self):
+        concept = mock_concept("concept", parents=["parent", "grandparent"])
+        parent = mock_concept("parent", parents=["grandparent"])
+        grandparent = mock_concept("grandparent")
+
+        graph = OntologyAPI().graph
+        self.assertEqual(0, graph.depth("grandparent"))
+        self.assertEqual(1, graph.depth("parent"))
+        self.assertEqual(2, graph.depth("concept"))
+
+
+class APICheckConstraintsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_check_constraints(self):
+        event = mock_concept("event", localProperties=[
+            {"slot": "agent", "facet": "default", "filler": "human"},
+            {"slot": "agent", "facet": "sem", "filler": "animal"},
+            {"slot": "agent", "facet": "relaxable-to", "filler": "object"}
+        ])
+        eat = mock_concept("eat", parents=["event"])
+        obj = mock_concept("object")
+        animal = mock_concept("animal", parents=["object"])
+        human = mock_concept("human", parents=["animal"])
+        dog = mock_concept("dog", parents=["animal"])
+        rock = mock_concept("rock", parents=["object"])
+        idea = mock_concept("idea")
+
+        self.assertEqual([
+            {"satisfied": True, "facet": "default"},
+            {"satisfied": True, "facet": "sem"},
+            {"satisfied": True, "facet": "relaxable-to"},
+            {"satisfied": False, "facet": None},
+            {"satisfied": True, "facet": None},
+            {"satisfied": False, "facet": None}
+        ], OntologyAPI().check_constraints([
+            ("eat", "agent", "human"),
+            ("eat", "agent", "dog"),
+            ("eat", "agent", "rock"),
+            ("eat", "agent", "idea"),
+            ("eat", "theme", "idea"),
+            ("no-such-concept", "agent", "human")
+        ]))
+
+    def test_check_constraints_respects_blocked_fillers(self):
+        event = mock_concept("event", localProperties=[
+            {"slot": "agent", "facet": "sem", "filler": "animal"}
+        ])
+        eat = mock_concept("eat", parents=["event"], localProperties=[
+            {"slot": "agent", "facet": "sem", "filler": "human"}
+        ], totallyRemovedProperties=[
+            {"slot": "agent", "facet": "sem", "filler": "animal"}
+        ])
+        animal = mock_concept("animal")
+        human = mock_concept("human", parents=["animal"])
+        dog = mock_concept("dog", parents=["animal"])
+
+        self.assertEqual([
+            {"satisfied": True, "facet": "sem"},
+            {"satisfied": False, "facet": None}
+        ], OntologyAPI().check_constraints([("eat", "agent", "human"), ("eat", "agent", "dog")]))
+
+
+class APIStatisticsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_statistics(self):
+        concept = mock_concept("concept", parents=["parent", "grandparent"])
+        parent = mock_concept("parent", parents=["grandparent"])
+        grandparent = mock_concept("grandparent")
+
+        self.assertEqual({
+            "grandparent": {"descendants": 2, "children": 2, "leaf": False, "min_depth": 0, "max_depth": 0},
+            "concept": {"descendants": 0, "children": 0, "leaf": True, "min_depth": 1, "max_depth": 2}
+        }, OntologyAPI().statistics(["grandparent", "concept", "no-such-concept"]))
+
+    def test_statistics_follow_hierarchy_edits(self):
+        mock_concept("all")
+        mock_concept("object", parents=["all"])
+        mock_concept("event", parents=["all"])
+
+        api = OntologyAPI()
+        graph = api.graph
+        self.assertEqual(2, api.statistics("all")["all"]["descendants"])
+
+        api.add_concept("dog", "object", "")
+        api.add_concept("puppy", "dog", "")
+        self.assertEqual(4, api.statistics("all")["all"]["descendants"])
+        self.assertEqual(2, api.statistics("object")["object"]["descendants"])
+        self.assertEqual(3, api.statistics("puppy")["puppy"]["max_depth"])
+
+        api.add_parent("dog", "event")
+        self.assertEqual(4, api.statistics("all")["all"]["descendants"])
+        self.assertEqual(2, api.statistics("event")["event"]["descendants"])
+
+        api.remove_parent("dog", "object")
+        self.assertEqual({"descendants": 0, "children": 0, "leaf": True, "min_depth": 1, "max_depth": 1}, api.statistics("object")["object"])
+
+        api.remove_concept("dog", include_usages=True)
+        self.assertEqual(2, api.statistics("all")["all"]["descendants"])
+        self.assertEqual(0, api.statistics("puppy")["puppy"]["max_depth"])
+        self.assertEqual(["all", "puppy"], api.roots())
+
+        # Hierarchy edits patch a copy of the snapshot, leaving the one other threads may be reading untouched
+        self.assertIsNot(graph, api.graph)
+        self.assertEqual(["all", "event", "object"], sorted(graph.names))
+        self.assertEqual(2, graph.statistics("all")["descendants"])
+
+    def test_hierarchy_edits_patch_without_reloading(self):
+        mock_concept("all")
+        mock_concept("object", parents=["all"])
+
+        api = OntologyAPI()
+        api.graph
+
+        load = ont.graph.OntologyGraph.load
+        loads = []
+        ont.graph.OntologyGraph.load = lambda collection, version=None: loads.append(version) or load(collection, version=version)
+        try:
+            api.add_concept("dog", "object", "")
+            api.remove_concept("dog", include_usages=True)
+            self.assertEqual(["all", "object"], sorted(api.graph.names))
+        finally:
+            ont.graph.OntologyGraph.load = load
+
+        self.assertEqual([], loads)
+
+    def test_hierarchy_edits_keep_document_order(self):
+        mock_concept("all")
+        mock_concept("a", parents=["all"])
+        mock_concept("b", parents=["all"])
+        mock_concept("c3", parents=["a"])
+        mock_concept("c6", parents=["b"])
+
+        api = OntologyAPI()
+        api.graph
+
+        api.add_parent("c6", "a")
+        api.remove_parent("c3", "a")
+        api.add_parent("c3", "b")
+        api.add_parent("c3", "a")
+        api.add_concept("c7", "a", "")
+
+        warm = api.graph
+        cold = ont.graph.OntologyGraph.load(api.collection)
+        for name in ["all", "a", "b", "c3", "c6", "c7"]:
+            self.assertEqual(cold.descendants(name, immediate=True), warm.descendants(name, immediate=True))
+            self.assertEqual(cold.ancestors(name, immediate=True), warm.ancestors(name, immediate=True))
+
+        self.assertEqual(["c3", "c6", "c7"], api.get("a")[0]["a"]["subclasses"]["value"])
+
+
+class APIRecordCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_records_shared_across_instances(self):
+        concept = mock_concept("concept")
+
+        OntologyAPI().get("concept")
+        before = ont.cache.metrics()
+        OntologyAPI().get("concept")
+        after = ont.cache.metrics()
+
+        self.assertEqual(before["hits"] + 1, after["hits"])
+        self.assertEqual(before["misses"], after["misses"])
+
+    def test_records_evicted_on_edit(self):
+        concept = mock_concept("concept", definition="before")
+
+        OntologyAPI().get("concept", metadata=True)
+        OntologyAPI().update_definition("concept", "after")
+
+        self.assertEqual("after", OntologyAPI().get("concept", metadata=True)[0]["concept"]["_metadata"]["definition"])
+
+    def test_record_cache_bounds(self):
+        cache = ont.cache.RecordCache(entries=2)
+        key = ("db", "collection")
+
+        cache.get(key, "v1", [])
+        cache.put(key, "v1", "a", [{"name": "a"}])
+        cache.put(key, "v1", "b", [{"name": "b"}])
+        cache.get(key, "v1", ["a"])
+        cache.put(key, "v1", "c", [{"name": "c"}])
+
+        found, missing = cache.get(key, "v1", ["a", "b", "c"])
+        self.assertEqual({"a", "c"}, set(found.keys()))
+        self.assertEqual(["b"], missing)
+        self.assertEqual(1, cache.metrics()["evictions"])
+
+        cache = ont.cache.RecordCache(bytes=1)
+        cache.get(key, "v1", [])
+        cache.put(key, "v1", "a", [{"name": "a"}])
+        self.assertEqual(0, cache.metrics()["entries"])
+
+    def test_memo_bounds(self):
+        memo = ont.cache.InheritanceMemo(version="v1", entries=2)
+
+        memo.store(("a", False), [{"slot": "a"}], "v1")
+        memo.store(("b", False), [{"slot": "b"}], "v1")
+        memo.get(("a", False))
+        memo.store(("c", False), [{"slot": "c"}], "v1")
+
+        self.assertTrue(("a", False) in memo)
+        self.assertFalse(("b", False) in memo)
+        self.assertTrue(("c", False) in memo)
+        self.assertEqual(1, memo.metrics()["evictions"])
+
+        memo.evict(["a"])
+        self.assertEqual([{"slot": "c"}], memo[("c", False)])
+        self.assertEqual(len(ont.cache.BSON.encode({"slot": "c"})), memo.metrics()["bytes"])
+
+        memo = ont.cache.InheritanceMemo(version="v1", bytes=1)
+        memo.store(("a", False), [{"slot": "a"}], "v1")
+        self.assertEqual(0, memo.metrics()["entries"])
+        self.assertEqual(0, memo.metrics()["bytes"])
+
+    def test_memo_metrics(self):
+        concept = mock_concept("concept", parents=["parent"])
+        parent = mock_concept("parent")
+
+        OntologyAPI().get("concept")
+        OntologyAPI().get("concept")
+
+        metrics = ont.cache.metrics()["memo"]
+        self.assertTrue(metrics["entries"] >= 2)
+        self.assertTrue(metrics["hits"] >= 1)
+
+    def test_record_cache_versions(self):
+        cache = ont.cache.RecordCache()
+        key = ("db", "collection")
+
+        cache.get(key, "v1", [])
+        cache.put(key, "v1", "a", [{"name": "a"}])
+        cache.put(key, "v1", "b", [{"name": "b"}])
+
+        cache.advance(key, "v1", "v2", ["a"])
+        found, missing = cache.get(key, "v2", ["a", "b"])
+        self.assertEqual(["b"], list(found.keys()))
+
+        found, missing = cache.get(key, "v3", ["b"])
+        self.assertEqual(["b"], missing)
+
+
+class APIVersionWatcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+    def tearDown(self):
+        ont.management.forget_all("unittest")
+
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def foreign_edit(self, collection, change: dict):
+        # What another process's edit leaves behind in the versions collection
+        versions = collection.database[ont.management.VERSIONS]
+        previous = versions.find_one({"_id": collection.name})["version"]
+        versions.update_one({"_id": collection.name}, {"$set": {"version": "foreign", "previous": previous, "change": change}})
+
+    def change(self, **kwargs) -> dict:
+        change = {"concepts": [], "hierarchy": False, "inverse": False, "added": [], "removed": [], "defined": [], "properties": [], "relinked": []}
+        change.update(kwargs)
+        return change
+
+    def test_edit_records_change(self):
+        concept = mock_concept("concept")
+
+        api = OntologyAPI()
+        previous = ont.management.version(api.collection)
+        api.insert_property("concept", "test", "sem", "value")
+
+        record = api.collection.database[ont.management.VERSIONS].find_one({"_id": api.collection.name})
+        self.assertEqual(previous, record["previous"])
+        self.assertEqual(["concept"], record["change"]["concepts"])
+        self.assertEqual(["concept"], record["change"]["properties"])
+
+    def test_foreign_edit_evicts_affected_only(self):
+        parent = mock_concept("parent", localProperties=[{"slot": "test", "facet": "sem", "filler": "value1"}])
+        child = mock_concept("child", parents=["parent"])
+        other = mock_concept("other")
+
+        api = OntologyAPI()
+        api.get(["child", "other"])
+
+        watcher = ont.sync.VersionWatcher(api.collection.database)
+        watcher.poll()
+
+        api.collection.update_one({"name": "parent"}, {"$push": {"localProperties": {"slot": "test", "facet": "sem", "filler": "value2"}}})
+        self.foreign_edit(api.collection, self.change(concepts=["parent"], properties=["parent"]))
+        watcher.poll()
+
+        self.assertEqual("foreign", ont.management.version(api.collection))
+
+        memo = ont.cache.memo(api.collection)
+        self.assertEqual("foreign", memo.version)
+        self.assertFalse(("child", False) in memo)
+        self.assertTrue(("other", False) in memo)
+
+        self.assertEqual(["value1", "value2"], OntologyAPI().get("child")[0]["child"]["test"]["sem"])
+
+    def test_foreign_hierarchy_edit(self):
+        parent1 = mock_concept("parent1")
+        parent2 = mock_concept("parent2")
+        child = mock_concept("child", parents=["parent1"])
+
+        api = OntologyAPI()
+        self.assertTrue(api.is_a("child", "parent1"))
+
+        watcher = ont.sync.VersionWatcher(api.collection.database)
+        watcher.poll()
+
+        api.collection.update_one({"name": "child"}, {"$set": {"parents": ["parent2"]}})
+        self.foreign_edit(api.collection, self.change(concepts=["child"], hierarchy=True, relinked=["child"]))
+        watcher.poll()
+
+        self.assertEqual("foreign", ont.graph.snapshot(api.collection).version)
+        self.assertFalse(api.is_a("child", "parent1"))
+        self.assertTrue(api.is_a("child", "parent2"))
+
+    def test_missed_edit_drops_structures(self):
+        concept = mock_concept("concept")
+        other = mock_concept("other")
+
+        api = OntologyAPI()
+        api.get(["concept", "other"])
+
+        watcher = ont.sync.VersionWatcher(api.collection.database)
+        watcher.poll()
+
+        # Two edits landed between polls, so the first one's description is lost
+        api.collection.update_one({"name": "other"}, {"$set": {"definition": "edited"}})
+        self.foreign_edit(api.collection, self.change(defined=["other"]))
+        self.foreign_edit(api.collection, self.change(concepts=["concept"]))
+        api.collection.database[ont.management.VERSIONS].update_one({"_id": api.collection.name}, {"$set": {"version": "later"}})
+        watcher.poll()
+
+        self.assertEqual("later", ont.management.version(api.collection))
+        self.assertFalse(("other", False) in ont.cache.memo(api.collection))
+        self.assertEqual("edited", OntologyAPI().get("other", metadata=True)[0]["other"]["_metadata"]["definition"])
+
+
+    def test_watcher_survives_errors(self):
+        concept = mock_concept("concept")
+
+        api = OntologyAPI()
+        ont.management.bump_version(api.collection)
+        watcher = ont.sync.VersionWatcher(api.collection.database, interval=0.01)
+        watcher.poll()
+
+        self.foreign_edit(api.collection, self.change(concepts=["concept"]))
+
+        poll = watcher.poll
+        seen = []
+        def flaky():
+            # The connection drops on the first poll; the retry then picks the edit up and stops the watcher
+            if len(seen) == 0:
+                seen.append(None)
+                raise pymongo.errors.AutoReconnect("connection lost")
+            poll()
+            seen.append(ont.management.known("unittest").get(api.collection.name))
+            watcher.stop()
+
+        def standalone():
+            raise pymongo.errors.OperationFailure("The $changeStream stage is only supported on replica sets")
+
+        watcher.poll = flaky
+        watcher.stream = standalone
+        watcher.run()
+
+        self.assertEqual([None, "foreign"], seen)
+
+        # Once the watcher is gone, versions are read from Mongo again rather than from what it last saw
+        self.assertEqual({}, ont.management.known("unittest"))
+        api.collection.database[ont.management.VERSIONS].update_one({"_id": api.collection.name}, {"$set": {"version": "later"}})
+        self.assertEqual("later", ont.management.version(api.collection))
+
+    def test_watcher_forgets_versions_while_failing(self):
+        concept = mock_concept("concept")
+
+        api = OntologyAPI()
+        ont.management.bump_version(api.collection)
+        watcher = ont.sync.VersionWatcher(api.collection.database, interval=0.01)
+        watcher.poll()
+
+        versions = []
+        def failing():
+            versions.append(ont.management.version(api.collection))
+            if len(versions) == 1:
+                self.foreign_edit(api.collection, self.change(concepts=["concept"]))
+            else:
+                watcher.stop()
+            raise pymongo.errors.AutoReconnect("connection lost")
+
+        watcher.poll = failing
+        watcher.run()
+
+        self.assertEqual("foreign", versions[1])
+
+
+class APIWarmTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+        # Start from no recorded accesses
+        ont.cache.flush()
+        client.drop_database("unittest")
+
+    def tearDown(self):
+        ont.cache.pin(ont.management.handle(), [])
+
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_hottest(self):
+        concept1 = mock_concept("concept1")
+        concept2 = mock_concept("concept2")
+        concept3 = mock_concept("concept3")
+
+        api = OntologyAPI()
+        api.get(["concept1", "concept2"])
+        api.get("concept2")
+        api.get("concept3")
+        api.get("concept2")
+
+        self.assertEqual(["concept2", "concept1"], ont.cache.hottest(api.collection, 2))
+
+        record = api.collection.database[ont.management.ACCESSES].find_one({"collection": "unittest", "name": "concept2"})
+        self.assertEqual(3, record["count"])
+
+    def test_warm(self):
+        concept1 = mock_concept("concept1", localProperties=[{"slot": "test", "facet": "sem", "filler": "value"}])
+        concept2 = mock_concept("concept2")
+
+        api = OntologyAPI()
+        api.get("concept1")
+        ont.cache.flush()
+
+        # Start over from nothing resolved, as after a restart
+        api.collection.database[ont.management.VERSIONS].drop()
+        self.assertEqual(["concept1"], OntologyAPI().warm(limit=10))
+
+        memo = ont.cache.memo(api.collection)
+        self.assertTrue(("concept1", False) in memo)
+        self.assertFalse(("concept2", False) in memo)
+        self.assertIsNotNone(memo.relations)
+        self.assertEqual(1, ont.cache.metrics()["pinned"])
+        self.assertEqual(frozenset([("concept1", False)]), memo.pinned)
+
+        self.assertEqual(1, ont.cache.hottest(api.collection, 10).count("concept1"))
+        record = api.collection.database[ont.management.ACCESSES].find_one({"collection": "unittest", "name": "concept1"})
+        self.assertEqual(1, record["count"])
+
+    def test_warm_in_background(self):
+        concept = mock_concept("concept")
+
+        OntologyAPI().get("concept")
+        ont.management.warm(limit=10).join()
+
+        self.assertTrue(("concept", False) in ont.cache.memo(ont.management.handle()))
+
+    def test_unknown_names_not_counted(self):
+        concept = mock_concept("concept")
+
+        api = OntologyAPI()
+        api.get(["concept", "no-such-concept"])
+
+        self.assertEqual(["concept"], ont.cache.hottest(api.collection, 10))
+
+    def test_pinned_frames_not_evicted(self):
+        memo = ont.cache.InheritanceMemo(version="v1", entries=2)
+
+        memo.pin([("a", False)])
+        memo.store(("a", False), [], "v1")
+        memo.store(("b", False), [], "v1")
+        memo.store(("c", False), [], "v1")
+
+        self.assertTrue(("a", False) in memo)
+        self.assertFalse(("b", False) in memo)
+        self.assertTrue(("c", False) in memo)
+
+        # Edits still evict pinned entries
+        memo.advance("v2", ["a"])
+        self.assertFalse(("a", False) in memo)
+
+    def test_pins_carry_to_new_memos(self):
+        concept = mock_concept("concept")
+
+        collection = ont.management.handle()
+        ont.cache.pin(collection, ["concept"])
+        collection.database[ont.management.VERSIONS].drop()
+
+        self.assertEqual(frozenset([("concept", False)]), ont.cache.memo(collection).pinned)
+
+    def test_pinned_entries_not_evicted(self):
+        cache = ont.cache.RecordCache(entries=2)
+        key = ("db", "collection")
+
+        cache.pin(key, ["a"])
+        cache.get(key, "v1", [])
+        cache.put(key, "v1", "a", [{"name": "a"}])
+        cache.put(key, "v1", "b", [{"name": "b"}])
+        cache.put(key, "v1", "c", [{"name": "c"}])
+
+        found, missing = cache.get(key, "v1", ["a", "b", "c"])
+        self.assertEqual({"a", "c"}, set(found.keys()))
+
+        # Edits still evict pinned entries
+        cache.advance(key, "v1", "v2", ["a"])
+        found, missing = cache.get(key, "v2", ["a"])
+        self.assertEqual(["a"], missing)
+
+
+    def test_access_flush_failure_keeps_counts(self):
+        concept = mock_concept("concept")
+        collection = ont.management.handle()
+
+        class Unreachable(object):
+            def __getitem__(self, name):
+                return self
+
+            def bulk_write(self, updates, ordered=True):
+                raise pymongo.errors.AutoReconnect("connection lost")
+
+        log = ont.cache.AccessLog(interval=3600)
+        log.record(collection, ["concept"])
+        log.databases["unittest"] = Unreachable()
+        log.flush()
+
+        self.assertEqual({("unittest", "unittest"): {"concept": 1}}, log.pending)
+
+        log.record(collection, ["concept"])
+        log.flush()
+
+        record = collection.database[ont.management.ACCESSES].find_one({"collection": "unittest", "name": "concept"})
+        self.assertEqual(2, record["count"])
+
+    def test_access_flush_in_background(self):
+        concept = mock_concept("concept")
+        collection = ont.management.handle()
+
+        log = ont.cache.AccessLog(interval=0)
+        log.record(collection, ["concept"])
+
+        # The request that crossed the interval returned before the counts were written
+        deadline = time.time() + 5
+        while log.flushing and time.time() < deadline:
+            time.sleep(0.01)
+
+        record = collection.database[ont.management.ACCESSES].find_one({"collection": "unittest", "name": "concept"})
+        self.assertEqual(1, record["count"])
+
+    def test_compile_does_not_count_accesses(self):
+        concept = mock_concept("concept")
+
+        ont.management.compile("unittest")
+        self.assertEqual([], ont.cache.hottest(ont.management.handle(), 10))
+
+class APICompiledTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def mock_ontology(self):
+        all = mock_concept("all")
+        parent = mock_concept("parent", parents=["all"], localProperties=[{"slot": "test", "facet": "sem", "filler": "value1"}])
+        child = mock_concept("child", parents=["parent"], localProperties=[{"slot": "test", "facet": "default", "filler": 1}])
+
+    def mark(self, concept: str):
+        # Alter a compiled frame, to tell a compiled read from a live one
+        compiled = ont.management.getclient()["unittest"]["compiled_unittest"]
+        compiled.update_one({"_id": concept.upper()}, {"$set": {"TEST.SEM": ["COMPILED"]}})
+
+    def test_get_from_compiled(self):
+        self.mock_ontology()
+
+        live = OntologyAPI().get(["child", "parent"])
+        ont.management.compile("unittest", compile_inherited_values=True)
+        self.assertEqual(live, OntologyAPI().get(["child", "parent"]))
+
+        self.mark("child")
+        self.assertEqual(["compiled"], OntologyAPI().get("child")[0]["child"]["test"]["sem"])
+
+    def test_get_local_from_compiled(self):
+        self.mock_ontology()
+
+        live = OntologyAPI().get(["child", "parent"], local=True)
+        ont.management.compile("unittest")
+        self.assertEqual(live, OntologyAPI().get(["child", "parent"], local=True))
+
+        self.mark("parent")
+        self.assertEqual(["compiled"], OntologyAPI().get("parent", local=True)[0]["parent"]["test"]["sem"])
+        self.assertEqual(["value1"], OntologyAPI().get("parent")[0]["parent"]["test"]["sem"])
+
+    def test_compiled_ignored_after_edit(self):
+        self.mock_ontology()
+
+        ont.management.compile("unittest", compile_inherited_values=True)
+        self.mark("child")
+
+        OntologyAPI().insert_property("parent", "test", "sem", "value2")
+        self.assertEqual(["value1", "value2"], OntologyAPI().get("child")[0]["child"]["test"]["sem"])
+
+    def test_compiled_ignored_with_extra_frames(self):
+        self.mock_ontology()
+
+        ont.management.compile("unittest", compile_inherited_values=True, compile_domains_and_ranges=True)
+        self.mark("child")
+
+        self.assertEqual(["value1"], OntologyAPI().get("child")[0]["child"]["test"]["sem"])
+
+    def test_compiled_ignored_with_mixed_case(self):
+        self.mock_ontology()
+        other = mock_concept("other", localProperties=[{"slot": "test", "facet": "sem", "filler": "Value"}])
+
+        ont.management.compile("unittest", compile_inherited_values=True)
+        self.mark("child")
+
+        self.assertEqual(["value1"], OntologyAPI().get("child")[0]["child"]["test"]["sem"])
+        self.assertEqual(["Value"], OntologyAPI().get("other")[0]["other"]["test"]["sem"])
+
+    def test_compiled_ignored_with_metadata(self):
+        self.mock_ontology()
+
+        ont.management.compile("unittest", compile_inherited_values=True)
+        self.mark("child")
+
+        self.assertEqual("value1", OntologyAPI().get("child", metadata=True)[0]["child"]["test"]["sem"][0]["filler"])
+
+
+class APIInheritanceMemoTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_memo_evicts_edited_subtree_only(self):
+        parent = mock_concept("parent", localProperties=[{"slot": "test", "facet": "sem", "filler": "value1"}])
+        child = mock_concept("child", parents=["parent"])
+        other = mock_concept("other")
+
+        api = OntologyAPI()
+        api.get(["child", "other"])
+
+        memo = ont.cache.memo(api.collection)
+        self.assertTrue(("child", False) in memo)
+        self.assertTrue(("other", False) in memo)
+
+        api.insert_property("parent", "test", "sem", "value2")
+
+        memo = ont.cache.memo(api.collection)
+        self.assertFalse(("parent", False) in memo)
+        self.assertFalse(("child", False) in memo)
+        self.assertTrue(("other", False) in memo)
+
+        result = OntologyAPI().get("child")[0]["child"]
+        self.assertEqual(["value1", "value2"], result["test"]["sem"])
+
+    def test_memo_skips_frames_resolved_across_an_edit(self):
+        parent = mock_concept("parent", localProperties=[{"slot": "test", "facet": "sem", "filler": "value1"}])
+        child = mock_concept("child", parents=["parent"])
+
+        api = OntologyAPI()
+        memo = ont.cache.memo(api.collection)
+        load = api._load
+
+        # An edit lands (moving the memo on in place) while the child's parents are being loaded
+        def edited(names, memo=None):
+            records = load(names, memo=memo)
+            memo.advance("edited", [])
+            return records
+
+        child = load(["child"], memo=memo)["child"]
+        api._load = edited
+        api._inherit(child, memo=memo)
+
+        self.assertEqual("edited", memo.version)
+        self.assertFalse(("child", False) in memo)
+
+    def test_memo_store_checks_version(self):
+        memo = ont.cache.InheritanceMemo(version="v1")
+
+        self.assertTrue(memo.store(("a", False), [], "v1"))
+        memo.advance("v2", [])
+        self.assertFalse(memo.store(("b", False), [], "v1"))
+        self.assertTrue(("a", False) in memo)
+        self.assertFalse(("b", False) in memo)
+
+    def test_memo_evicts_on_parent_change(self):
+        parent1 = mock_concept("parent1", localProperties=[{"slot": "test", "facet": "sem", "filler": "value1"}])
+        parent2 = mock_concept("parent2", localProperties=[{"slot": "test", "facet": "sem", "filler": "value2"}])
+        child = mock_concept("child", parents=["parent1"])
+
+        api = OntologyAPI()
+        self.assertEqual(["value1"], api.get("child")[0]["child"]["test"]["sem"])
+
+        api.remove_parent("child", "parent1")
+        api.add_parent("child", "parent2")
+        self.assertEqual(["value2"], api.get("child")[0]["child"]["test"]["sem"])
+
+    def test_memo_is_not_mutated_by_blocking(self):
+        parent = mock_concept("parent", localProperties=[{"slot": "test", "facet": "sem", "filler": "value1"}])
+        child = mock_concept("child", parents=["parent"], totallyRemovedProperties=[{"slot": "test", "facet": "sem", "filler": "value1"}])
+
+        api = OntologyAPI()
+        self.assertTrue(api.get("child", metadata=True)[0]["child"]["test"]["sem"][0]["blocked"])
+        self.assertFalse(api.get("parent", metadata=True)[0]["parent"]["test"]["sem"][0]["blocked"])
+
+    def test_memo_relations(self):
+        relation = mock_concept("relation")
+        rel = mock_concept("rel", parents=["relation"])
+        concept = mock_concept("concept", localProperties=[{"slot": "rel", "facet": "sem", "filler": "value"}])
+
+        api = OntologyAPI()
+        self.assertTrue(api.get("concept", metadata=True)[0]["concept"]["rel"]["is_relation"])
+        self.assertEqual(frozenset({"relation", "rel"}), ont.cache.memo(api.collection).relations)
+
+        api.insert_property("concept", "other", "sem", "value")
+        self.assertEqual(frozenset({"relation", "rel"}), ont.cache.memo(api.collection).relations)
+
+        api.insert_property("rel", "inverse", "value", "rel-of")
+        self.assertIsNone(ont.cache.memo(api.collection).relations)
+
+        api.insert_property("concept", "rel-of", "sem", "value")
+        self.assertTrue(api.get("concept", metadata=True)[0]["concept"]["rel-of"]["is_relation"])
@@ -0,0 +1,78 @@
+from tests.TestUtils import mock_concept
+
+import ont.management
+import os
+import pymongo.errors
+import unittest
+
+
+class ManagementIndexesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_ensure_indexes(self):
+        mock_concept("concept")
+
+        collection = ont.management.handle()
+        ont.management.ensure_indexes(collection)
+
+        indexes = collection.index_information()
+        self.assertTrue(indexes["name_1"]["unique"])
+        self.assertIn("parents_1", indexes)
+        self.assertIn("localProperties.slot_1", indexes)
+        self.assertIn("localProperties.filler_1", indexes)
+
+    def test_ensure_indexes_over_existing(self):
+        mock_concept("concept")
+
+        collection = ont.management.handle()
+        collection.create_index("parents", name="parents")
+
+        # mongod refuses an equivalent index under a second name with IndexOptionsConflict
+        create_index = collection.create_index
+        def conflicting(keys, **kwargs):
+            if keys == [("parents", 1)]:
+                raise pymongo.errors.OperationFailure("Index already exists with a different name: parents", code=85)
+            return create_index(keys, **kwargs)
+        collection.create_index = conflicting
+
+        ont.management.ensure_indexes(collection)
+
+        indexes = collection.index_information()
+        self.assertIn("parents", indexes)
+        self.assertNotIn("parents_1", indexes)
+        self.assertIn("name_1", indexes)
+
+    def test_ensure_indexes_with_duplicate_names(self):
+        mock_concept("concept")
+        mock_concept("concept")
+
+        collection = ont.management.handle()
+        ont.management.ensure_indexes(collection)
+
+        indexes = collection.index_information()
+        self.assertIn("name_1", indexes)
+        self.assertFalse(indexes["name_1"].get("unique", False))
+
+    def test_ensure_indexes_compiled(self):
+        compiled = ont.management.getclient()["unittest"]["compiled_unittest"]
+        ont.management.ensure_indexes(compiled)
+
+        self.assertIn("IS-A.VALUE_1", compiled.index_information())
+
+    def test_check_query_plans(self):
+        mock_concept("all")
+
+        if not hasattr(ont.management.handle().find(), "explain"):
+            self.skipTest("The database does not support explain.")
+
+        ont.management.ensure_indexes(ont.management.handle())
+        self.assertEqual([], ont.management.check_query_plans("unittest"))
@@ -1,11 +1,14 @@
 from ont.api import OntologyAPI
+from ont.bloom import BloomFilter
 from ont.service import app as service
 from tests.TestUtils import mock_concept
 
 import json
+import ont.cache
 import ont.management
 import ont.service
 import os
+import pymongo.errors
 import unittest
 
 
@@ -77,6 +80,101 @@ class APIRootsServiceTestCase(unittest.TestCase):
         self.assertTrue("grandparent2" in response)
 
         
+class APISearchServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+        self.app = service.test_client()
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_search(self):
+        mock_concept("event")
+        mock_concept("mental-event")
+        mock_concept("eventful")
+
+        response = self.app.get("/ontology/api/search?name_like=event")
+        response = json.loads(response.data)
+        self.assertEqual(["event", "eventful", "mental-event"], response)
+
+        response = self.app.get("/ontology/api/search?name_like=event&match=prefix&limit=1")
+        response = json.loads(response.data)
+        self.assertEqual(["event"], response)
+
+    def test_search_400_if_bad_params(self):
+        response = self.app.get("/ontology/api/search?name_like=event&match=regex")
+        self.assertEqual(400, response.status_code)
+
+        response = self.app.get("/ontology/api/search?name_like=event&limit=x")
+        self.assertEqual(400, response.status_code)
+
+        response = self.app.get("/ontology/api/search?name_like=event&limit=-1")
+        self.assertEqual(400, response.status_code)
+
+    def test_fuzzy(self):
+        mock_concept("event")
+        mock_concept("vent")
+
+        response = self.app.get("/ontology/api/fuzzy?name=evnt&max_distance=1")
+        response = json.loads(response.data)
+        self.assertEqual([{"name": "event", "distance": 1}], response)
+
+        response = self.app.get("/ontology/api/fuzzy?name=evnt&k=x")
+        self.assertEqual(400, response.status_code)
+
+    def test_search_definitions(self):
+        mock_concept("dog", definition="a domesticated canine")
+        mock_concept("cat", definition="a domesticated feline")
+
+        response = self.app.get("/ontology/api/search_definitions?query=canine")
+        response = json.loads(response.data)
+        self.assertEqual(["dog"], list(map(lambda result: result["name"], response)))
+
+        response = self.app.get("/ontology/api/search_definitions")
+        self.assertEqual(400, response.status_code)
+
+        response = self.app.get("/ontology/api/search_definitions?query=canine&limit=-1")
+        self.assertEqual(400, response.status_code)
+
+
+class APIExistsServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+        self.app = service.test_client()
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_exists(self):
+        concept = mock_concept("concept")
+
+        response = self.app.get("/ontology/api/exists?concept=concept&concept=other")
+        self.assertEqual([True, False], json.loads(response.data))
+
+    def test_exists_filter(self):
+        concept = mock_concept("concept")
+
+        response = self.app.get("/ontology/api/exists?filter=true&error_rate=0.001")
+        bloom = BloomFilter.from_json(json.loads(response.data))
+        self.assertTrue("concept" in bloom)
+
+    def test_exists_bad_request(self):
+        self.assertEqual(400, self.app.get("/ontology/api/exists").status_code)
+        self.assertEqual(400, self.app.get("/ontology/api/exists?filter=true&error_rate=2").status_code)
+
+
 class APIAncestorsServiceTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -156,6 +254,23 @@ class APIAncestorsServiceTestCase(unittest.TestCase):
 
         self.assertEqual(0, len(response))
 
+    def test_ancestors_paths_limits(self):
+        concept = mock_concept("concept", parents=["parent"])
+        parent = mock_concept("parent", parents=["grandparent1", "grandparent2"])
+        grandparent1 = mock_concept("grandparent1")
+        grandparent2 = mock_concept("grandparent2")
+
+        response = self.app.get("/ontology/api/ancestors?concept=concept&paths=True&max_paths=1")
+        response = json.loads(response.data)
+        self.assertEqual(1, len(response))
+
+        response = self.app.get("/ontology/api/ancestors?concept=concept&paths=True&max_depth=1")
+        response = json.loads(response.data)
+        self.assertEqual([["parent"]], response)
+
+        response = self.app.get("/ontology/api/ancestors?concept=concept&paths=True&max_paths=many")
+        self.assertEqual(400, response.status_code)
+
 
 class APIDescendantsServiceTestCase(unittest.TestCase):
 
@@ -239,6 +354,294 @@ class APIDescendantsServiceTestCase(unittest.TestCase):
         self.assertEqual(0, len(response))
 
 
+class APIIsAServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+        self.app = service.test_client()
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_is_a(self):
+        concept = mock_concept("concept", parents=["parent"])
+        parent = mock_concept("parent")
+
+        response = self.app.get("/ontology/api/is_a?concept=concept&ancestor=parent&concept=parent&ancestor=concept")
+        response = json.loads(response.data)
+
+        self.assertEqual([True, False], response)
+
+    def test_is_a_batch(self):
+        concept = mock_concept("concept", parents=["parent"])
+        parent = mock_concept("parent")
+
+        response = self.app.post("/ontology/api/is_a",
+                                 data=json.dumps([["concept", "parent"], ["parent", "concept"]]),
+                                 content_type="application/json")
+        response = json.loads(response.data)
+
+        self.assertEqual([True, False], response)
+
+    def test_is_a_400_if_unpaired(self):
+        response = self.app.get("/ontology/api/is_a?concept=concept")
+        self.assertEqual(400, response.status_code)
+
+    def test_is_a_400_if_malformed(self):
+        for body in [{}, [[1, 2]], ["ab"], [["concept"]], [["concept", "parent", "other"]]]:
+            response = self.app.post("/ontology/api/is_a", data=json.dumps(body), content_type="application/json")
+            self.assertEqual(400, response.status_code)
+
+
+class APICommonAncestorsServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+        self.app = service.test_client()
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_common_ancestors(self):
+        concept1 = mock_concept("concept1", parents=["parent"])
+        concept2 = mock_concept("concept2", parents=["parent"])
+        parent = mock_concept("parent", parents=["grandparent"])
+        grandparent = mock_concept("grandparent")
+
+        response = self.app.get("/ontology/api/common_ancestors?concept=concept1&concept=concept2")
+        response = json.loads(response.data)
+        self.assertEqual(["parent"], response)
+
+        response = self.app.get("/ontology/api/common_ancestors?concept=concept1&concept=concept2&most_specific=false")
+        response = json.loads(response.data)
+        self.assertEqual(["parent", "grandparent"], response)
+
+    def test_common_ancestors_batch(self):
+        concept1 = mock_concept("concept1", parents=["parent"])
+        concept2 = mock_concept("concept2", parents=["parent"])
+        parent = mock_concept("parent")
+
+        response = self.app.post("/ontology/api/common_ancestors",
+                                 data=json.dumps([["concept1", "concept2"], ["concept1", "parent"]]),
+                                 content_type="application/json")
+        response = json.loads(response.data)
+        self.assertEqual([["parent"], ["parent"]], response)
+
+    def test_common_ancestors_400(self):
+        response = self.app.get("/ontology/api/common_ancestors")
+        self.assertEqual(400, response.status_code)
+
+        response = self.app.post("/ontology/api/common_ancestors", data=json.dumps([[1, 2]]), content_type="application/json")
+        self.assertEqual(400, response.status_code)
+
+        response = self.app.post("/ontology/api/common_ancestors", data=json.dumps([["concept1"], []]), content_type="application/json")
+        self.assertEqual(400, response.status_code)
+
+
+class APISimilarityServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+        self.app = service.test_client()
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_similarity(self):
+        concept1 = mock_concept("concept1", parents=["parent"])
+        concept2 = mock_concept("concept2", parents=["parent"])
+        parent = mock_concept("parent")
+
+        response = self.app.post("/ontology/api/similarity?metric=path",
+                                 data=json.dumps([["concept1", "concept2"], ["concept1", "parent"]]),
+                                 content_type="application/json")
+        response = json.loads(response.data)
+        self.assertEqual([1 / 3, 1 / 2], response)
+
+        response = self.app.post("/ontology/api/similarity?metric=no-such-metric", data=json.dumps([]), content_type="application/json")
+        self.assertEqual(400, response.status_code)
+
+        response = self.app.post("/ontology/api/similarity", data=json.dumps([[1, 2]]), content_type="application/json")
+        self.assertEqual(400, response.status_code)
+
+
+class APICheckConstraintsServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+        self.app = service.test_client()
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_check_constraints(self):
+        event = mock_concept("event", localProperties=[{"slot": "agent", "facet": "sem", "filler": "animal"}])
+        animal = mock_concept("animal")
+        human = mock_concept("human", parents=["animal"])
+
+        response = self.app.post("/ontology/api/check_constraints",
+                                 data=json.dumps([["event", "agent", "human"], ["event", "agent", "event"]]),
+                                 content_type="application/json")
+        response = json.loads(response.data)
+        self.assertEqual([{"satisfied": True, "facet": "sem"}, {"satisfied": False, "facet": None}], response)
+
+    def test_check_constraints_400_if_malformed(self):
+        response = self.app.post("/ontology/api/check_constraints", data=json.dumps([["event", "agent"]]), content_type="application/json")
+        self.assertEqual(400, response.status_code)
+
+        response = self.app.post("/ontology/api/check_constraints", data=json.dumps([[1, "agent", "object"]]), content_type="application/json")
+        self.assertEqual(400, response.status_code)
+
+        response = self.app.post("/ontology/api/check_constraints", data=json.dumps([["event", None, "object"]]), content_type="application/json")
+        self.assertEqual(400, response.status_code)
+
+
+class APIStatisticsServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+        self.app = service.test_client()
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_stats(self):
+        concept = mock_concept("concept", parents=["parent"])
+        parent = mock_concept("parent")
+
+        response = self.app.get("/ontology/api/stats?concept=parent")
+        response = json.loads(response.data)
+        self.assertEqual({"parent": {"descendants": 1, "children": 1, "leaf": False, "min_depth": 0, "max_depth": 0}}, response)
+
+    def test_stats_400_without_concept(self):
+        response = self.app.get("/ontology/api/stats")
+        self.assertEqual(400, response.status_code)
+
+
+class ManageCacheServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+        self.app = service.test_client()
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_cache_metrics(self):
+        concept = mock_concept("concept")
+        self.app.get("/ontology/api/get?concept=concept")
+
+        response = self.app.get("/ontology/manage/cache")
+        response = json.loads(response.data)
+        self.assertTrue(response["entries"] >= 1)
+        self.assertIn("hits", response)
+        self.assertIn("misses", response)
+        self.assertIn("entries", response["memo"])
+
+
+class APICacheHeadersServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+        self.app = service.test_client()
+
+    def tearDown(self):
+        ont.service.API_CACHE_CONTROL = "no-cache"
+
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_etag(self):
+        concept = mock_concept("concept")
+
+        response = self.app.get("/ontology/api/get?concept=concept")
+        self.assertEqual(200, response.status_code)
+        self.assertIsNotNone(response.headers.get("ETag"))
+        self.assertEqual("no-cache", response.headers["Cache-Control"])
+
+    def test_not_modified(self):
+        concept = mock_concept("concept")
+
+        etag = self.app.get("/ontology/api/get?concept=concept").headers["ETag"]
+
+        before = ont.cache.metrics()
+        response = self.app.get("/ontology/api/get?concept=concept", headers={"If-None-Match": etag})
+        after = ont.cache.metrics()
+
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b"", response.data)
+        self.assertEqual(etag, response.headers["ETag"])
+        self.assertEqual(before["hits"], after["hits"])
+        self.assertEqual(before["misses"], after["misses"])
+
+    def test_etag_depends_on_parameters(self):
+        concept1 = mock_concept("concept1")
+        concept2 = mock_concept("concept2")
+
+        etag = self.app.get("/ontology/api/get?concept=concept1").headers["ETag"]
+
+        response = self.app.get("/ontology/api/get?concept=concept2", headers={"If-None-Match": etag})
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response.headers["ETag"])
+
+    def test_etag_changes_on_edit(self):
+        concept = mock_concept("concept")
+
+        etag = self.app.get("/ontology/api/roots").headers["ETag"]
+        OntologyAPI().update_definition("concept", "edited")
+
+        response = self.app.get("/ontology/api/roots", headers={"If-None-Match": etag})
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response.headers["ETag"])
+
+    def test_cache_control(self):
+        concept = mock_concept("concept")
+
+        ont.service.API_CACHE_CONTROL = "max-age=60"
+
+        response = self.app.get("/ontology/api/roots")
+        self.assertEqual("max-age=60", response.headers["Cache-Control"])
+
+    def test_no_etag_on_errors(self):
+        response = self.app.get("/ontology/api/get")
+        self.assertEqual(400, response.status_code)
+        self.assertIsNone(response.headers.get("ETag"))
+
+
 class APIInversesServiceTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -361,6 +764,66 @@ class APIDomainsAndRangesServiceTestCase(unittest.TestCase):
         }, response)
 
 
+class APIBatchServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        client = ont.management.getclient()
+
+        ont.management.DATABASE = "unittest"
+        os.environ[ont.management.ONTOLOGY_ACTIVE] = "unittest"
+
+        self.app = service.test_client()
+
+    def tearDown(self):
+        client = ont.management.getclient()
+        client.drop_database("unittest")
+
+    def test_batch(self):
+        concept = mock_concept("concept", parents=["parent"])
+        parent = mock_concept("parent")
+
+        operations = [
+            {"op": "get", "args": {"concepts": ["concept"]}},
+            {"op": "ancestors", "args": {"concept": "concept"}},
+            {"op": "is_a", "args": {"concept": "concept", "ancestor": "parent"}}
+        ]
+
+        response = self.app.post("/ontology/api/batch", data=json.dumps(operations), content_type="application/json")
+        response = json.loads(response.data)
+        self.assertEqual([OntologyAPI().get(["concept"]), ["parent"], True], response)
+
+    def test_batch_bad_request(self):
+        response = self.app.post("/ontology/api/batch", data=json.dumps({}), content_type="application/json")
+        self.assertEqual(400, response.status_code)
+
+        response = self.app.post("/ontology/api/batch", data=json.dumps([{"op": "add_concept"}]), content_type="application/json")
+        self.assertEqual(400, response.status_code)
+
+        response = self.app.post("/ontology/api/batch", data=json.dumps([{"op": "roots", "args": {"unknown": 1}}]), content_type="application/json")
+        self.assertEqual(400, response.status_code)
+
+        response = self.app.post("/ontology/api/batch", data=json.dumps([{"op": "ancestors", "args": {"concept": "no-such-concept"}}]), content_type="application/json")
+        self.assertEqual(400, response.status_code)
+
+        response = self.app.post("/ontology/api/batch", data=json.dumps([{"op": "get", "args": {"concepts": 5}}]), content_type="application/json")
+        self.assertEqual(400, response.status_code)
+
+    def test_batch_internal_error(self):
+        concept = mock_concept("concept")
+
+        # Failures other than a malformed request are not reported as the client's fault
+        roots = OntologyAPI.roots
+        def failing(self):
+            raise pymongo.errors.AutoReconnect("connection lost")
+        OntologyAPI.roots = failing
+        try:
+            response = self.app.post("/ontology/api/batch", data=json.dumps([{"op": "roots"}]), content_type="application/json")
+        finally:
+            OntologyAPI.roots = roots
+
+        self.assertEqual(500, response.status_code)
+
+
 class APIEditDefineServiceTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -45,6 +45,18 @@ class OntologyWrapperTestCase(unittest.TestCase):
         response = Ontology().search(name_like="concept")
         self.assertEqual(response, OntologyAPI().search(name_like="concept"))
 
+    def test_fuzzy_search(self):
+        c = mock_concept("concept")
+
+        response = Ontology().fuzzy_search("concpt")
+        self.assertEqual(response, OntologyAPI().fuzzy_search("concpt"))
+
+    def test_search_definitions(self):
+        c = mock_concept("concept", definition="a test concept")
+
+        response = Ontology().search_definitions("test")
+        self.assertEqual(response, OntologyAPI().search_definitions("test"))
+
     def test_roots(self):
         concept = mock_concept("concept", parents=["parent"])
         parent = mock_concept("parent", parents=["grandparent1", "grandparent2"])
@@ -105,12 +117,107 @@ class OntologyWrapperTestCase(unittest.TestCase):
         self.assertTrue(Ontology().is_parent("parent", "grandparent"))
         self.assertFalse(Ontology().is_parent("parent", "concept"))
 
+    def test_common_ancestors(self):
+        concept1 = mock_concept("concept1", parents=["parent"])
+        concept2 = mock_concept("concept2", parents=["parent"])
+        parent = mock_concept("parent")
+
+        response = Ontology().common_ancestors(["concept1", "concept2"])
+        self.assertEqual(response, OntologyAPI().common_ancestors(["concept1", "concept2"]))
+
+    def test_similarity(self):
+        concept1 = mock_concept("concept1", parents=["parent"])
+        concept2 = mock_concept("concept2", parents=["parent"])
+        parent = mock_concept("parent")
+
+        response = Ontology().similarity([("concept1", "concept2")])
+        self.assertEqual(response, OntologyAPI().similarity([("concept1", "concept2")]))
+
+    def test_batch(self):
+        concept = mock_concept("concept", parents=["parent"])
+        parent = mock_concept("parent")
+
+        response = Ontology().batch([("get", {"concepts": ["concept"]}), ("ancestors", {"concept": "concept"}), ("roots",)])
+        self.assertEqual([OntologyAPI().get(["concept"]), ["parent"], ["parent"]], response)
+
+    def test_check_constraints(self):
+        event = mock_concept("event", localProperties=[{"slot": "agent", "facet": "sem", "filler": "animal"}])
+        animal = mock_concept("animal")
+        human = mock_concept("human", parents=["animal"])
+
+        response = Ontology().check_constraints([("event", "agent", "human")])
+        self.assertEqual(response, OntologyAPI().check_constraints([("event", "agent", "human")]))
+
+    def test_statistics(self):
+        concept = mock_concept("concept", parents=["parent"])
+        parent = mock_concept("parent")
+
+        response = Ontology().statistics("parent")
+        self.assertEqual(response, OntologyAPI().statistics("parent"))
+
+    def test_cache(self):
+        concept = mock_concept("concept", localProperties=[{"slot": "test", "facet": "sem", "filler": "value"}])
+        parent = mock_concept("parent")
+
+        ontology = Ontology(cache_size=10)
+        self.assertTrue("concept" in ontology)
+        self.assertTrue(ontology.exists("concept"))
+        self.assertTrue(ontology.has_property("concept", "test"))
+        self.assertEqual(["value"], ontology.get_constraints("concept", "test"))
+
+        metrics = ontology.cache_metrics()
+        self.assertEqual(1, metrics["misses"])
+        self.assertEqual(3, metrics["hits"])
+
+        ontology.add_parent("concept", "parent")
+        self.assertEqual(["parent"], ontology["concept"]["is-a"]["value"])
+        self.assertEqual(2, ontology.cache_metrics()["misses"])
+
+    def test_cache_revalidation(self):
+        concept = mock_concept("concept")
+
+        ontology = Ontology(cache_size=10, cache_ttl=0)
+        ontology["concept"]
+        ontology["concept"]
+
+        metrics = ontology.cache_metrics()
+        self.assertEqual(1, metrics["misses"])
+        self.assertEqual(1, metrics["revalidations"])
+
+    def test_is_a(self):
+        concept = mock_concept("concept", parents=["parent"])
+        parent = mock_concept("parent")
+
+        self.assertTrue(Ontology().is_a("concept", "concept"))
+        self.assertTrue(Ontology().is_a("concept", "parent"))
+        self.assertFalse(Ontology().is_a("parent", "concept"))
+
     def test_exists(self):
         concept = mock_concept("concept")
 
         self.assertTrue(Ontology().exists("concept"))
         self.assertFalse(Ontology().exists("other"))
 
+    def test_exists_with_filter(self):
+        concept = mock_concept("concept")
+
+        ontology = Ontology()
+        ontology.load_existence_filter()
+
+        self.assertTrue(ontology.exists("concept"))
+        self.assertTrue("concept" in ontology)
+        self.assertFalse(ontology.exists("other"))
+
+    def test_exists_with_filter_sees_other_clients(self):
+        concept = mock_concept("concept")
+
+        ontology = Ontology(cache_ttl=0)
+        ontology.load_existence_filter()
+
+        # Added behind this client's back; the filter is revalidated rather than trusted
+        Ontology().add_concept("other", "concept", "")
+        self.assertTrue(ontology.exists("other"))
+
     def test_get_subtree(self):
         concept = mock_concept("concept", parents=["object"])
         object = mock_concept("object")